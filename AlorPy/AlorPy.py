@@ -4,19 +4,48 @@ from datetime import datetime, timezone
 from zoneinfo import ZoneInfo  # ВременнАя зона
 from typing import Any  # Любой тип
 from math import log10  # Кол-во десятичных знаков будем получать из шага цены через десятичный логарифм
-from time import time_ns, sleep  # Текущее время в наносекундах, прошедших с 01.01.1970 UTC
+from time import time, time_ns, monotonic, sleep  # Текущее время в секундах и наносекундах, прошедших с 01.01.1970 UTC
 from uuid import uuid4  # Номера подписок должны быть уникальными во времени и пространстве
-from json import loads, JSONDecodeError, dumps  # Сервер WebSockets работает с JSON сообщениями
-from threading import Thread  # Подписки сервера WebSockets будем получать в отдельном потоке
+from threading import Thread, Lock, BoundedSemaphore, Condition, Event as ThreadEvent  # Подписки сервера WebSockets и токен JWT будем получать в отдельных потоках
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed, wait, TimeoutError as FutureTimeoutError  # Пакетные запросы выполняем в пуле потоков. Ответы командного WebSocket ждем в Future
+from collections import deque  # Очередь загружаемых страниц
+from queue import Queue, Full, Empty  # Буфер данных подписки для потоков подписок
+from urllib.parse import urlsplit  # Сервер из адреса запроса
+import json  # Сервер WebSockets работает с JSON сообщениями. Стандартный кодек JSON
+from weakref import ref  # Поток обновления токена JWT не должен удерживать провайдер от удаления
+from random import random  # Случайная добавка к задержке перед повтором запроса
+from functools import partial  # Хранилищу тиков передаем биржу подписки
+from zlib import crc32  # Стабильный между запусками хэш для распределения подписок по подключениям
+
+try:
+    import numpy as np  # Перевод цен, объемов и времени массивами
+except ImportError:  # Если NumPy не установлен
+    np = None  # то перевод доступен только по одному значению
 
 import keyring  # Безопасное хранение торгового токена
 import requests.adapters  # Настройки запросов/ответов
-from requests import post, get, put, delete, Response  # Запросы/ответы через HTTP API
+from requests import Session, Response  # Запросы/ответы через HTTP API
+from requests.adapters import HTTPAdapter  # Пул соединений HTTP API
+from urllib3.util.retry import Retry  # Политика повторов запросов
 from jwt import decode  # Декодирование токена JWT для получения договоров и портфелей
 from urllib3.exceptions import MaxRetryError, SSLError  # Соединение с сервером не установлено за максимальное кол-во попыток подключения, ошибка SSL
 from websockets.sync.client import connect  # Подключение к серверу WebSockets в синхронном режиме
 from websockets.exceptions import ConnectionClosed  # Событие закрытия соединения сервера WebSockets
 
+from .Records import Bar, Trade, Quote, OrderBookSnapshot  # Компактные записи результатов
+from .OrderBook import OrderBook  # Биржевой стакан подписки
+from .BarAggregator import BarAggregator  # Сборка баров из ленты сделок
+from .TickStore import TickStore  # Хранилище сделок и котировок
+from .BarCache import BarCache  # Кэш бар на диске
+try:
+    import orjson  # Быстрый кодек JSON, если установлен
+except ImportError:
+    orjson = None
+try:
+    import msgspec.json  # Быстрый кодек JSON, если установлен
+except ImportError:
+    msgspec = None
+
 
 # noinspection PyShadowingBuiltins
 class AlorPy:
@@ -24,29 +53,100 @@ class AlorPy:
     requests.adapters.DEFAULT_RETRIES = 10  # Настройка кол-ва попыток
     requests.adapters.DEFAULT_POOL_TIMEOUT = 10  # Настройка таймаута запроса в секундах
     tz_msk = ZoneInfo('Europe/Moscow')  # Время UTC будем приводить к московскому времени
-    jwt_token_ttl = 60  # Время жизни токена JWT в секундах
+    jwt_token_ttl = 60  # Время жизни токена JWT в секундах, если в токене не указано время окончания действия
+    jwt_token_refresh_before = 30  # За сколько секунд до окончания действия токена JWT его обновлять
     exchanges = ('MOEX', 'SPBX',)  # Биржи
+    codec = None  # Кодек JSON для запросов/ответов HTTP API и WebSocket. Задается после объявления класса JsonCodec
+    page_retries = 3  # Кол-во попыток загрузки страницы постраничного запроса
+    raise_rate_limit = False  # Исключение RateLimitError, если лимит запросов превышен после всех повторов. По умолчанию запрос возвращает None с записью ошибки в лог
+    rate_limits = {'market': 20, 'client': 20, 'command': 20}  # Максимальное кол-во запросов в секунду по классам запросов: рыночные данные, данные клиента, торговые команды
+    subscription_records = {'OrderBookGetAndSubscribe': OrderBookSnapshot, 'BarsGetAndSubscribe': Bar, 'QuotesSubscribe': Quote, 'AllTradesGetAndSubscribe': Trade}  # Компактные записи данных подписок
+    subscription_local_keys = frozenset({'prev', 'result_type', 'callback', 'conflate', 'shard', 'closed', 'close_by_timer'})  # Ключи подписки, которые не отправляются на сервер WebSocket
+    subscription_handlers = {}  # Фабрики обработчиков данных подписок по типу подписки. Заполняются после объявления класса
     logger = logging.getLogger('AlorPy')  # Будем вести лог
 
-    def __init__(self, refresh_token=None, demo=False):
+    def __init__(self, refresh_token=None, demo=False, pool_maxsize=10, pool_block=False, max_retries=None, host_limit=None, batch_workers=None, rate_limits=None, status_retries=5, tracer=None,
+                 dispatch_workers=0, dispatch_queue_size=10000, dispatch_policy='block', ws_shards=1, ws_shard_by='opcode', ws_shard_map=None, bar_cache=None):
         """Инициализация
 
         :param str refresh_token: Токен
         :param bool demo: Режим демо торговли. По умолчанию установлен режим реальной торговли
+        :param int pool_maxsize: Максимальное кол-во соединений в пуле HTTP API на один сервер
+        :param bool pool_block: Ждать освобождения соединения, если все соединения пула заняты. По умолчанию создается дополнительное соединение
+        :param int|Retry max_retries: Политика повторов запросов при ошибках соединения. Кол-во попыток или настройки urllib3 Retry
+        :param int host_limit: Максимальное кол-во одновременных запросов к одному серверу. По умолчанию pool_maxsize
+        :param int batch_workers: Кол-во потоков для пакетных запросов batch/map_requests. По умолчанию pool_maxsize
+        :param dict rate_limits: Максимальное кол-во запросов в секунду по классам запросов 'market', 'client', 'command'. По умолчанию AlorPy.rate_limits. {} - без ограничений
+        :param int status_retries: Кол-во повторов запроса при превышении лимита запросов 429 и ошибках сервера 5xx
+        :param Tracer tracer: Трассировка запросов HTTP API. None - без трассировки
+        :param int dispatch_workers: Кол-во потоков обработки данных подписок. Данные одной подписки обрабатываются по порядку в одном потоке. 0 - обработка в потоке чтения WebSocket (по умолчанию)
+        :param int dispatch_queue_size: Максимальное кол-во необработанных данных подписок в очереди каждого потока обработки
+        :param str dispatch_policy: Действие при заполненной очереди: 'block' - ждать обработки, 'drop_oldest' - удалить самые старые данные, 'coalesce' - заменить ждущие данные той же подписки новыми
+        :param int ws_shards: Кол-во подключений к серверу подписок WebSocket. У каждого подключения свой поток чтения и свое переподключение
+        :param str ws_shard_by: Распределение подписок по подключениям: 'opcode' - по типу подписки, 'symbol' - по тикеру или портфелю
+        :param dict ws_shard_map: Закрепление типов подписок за подключениями. Например, {'AllTradesGetAndSubscribe': 1}. Остальные подписки распределяются по ws_shard_by
+        :param BarCache|str bar_cache: Кэш бар для get_history_cached или путь к его папке. None - без кэша
+        """
+        if max_retries is None:  # Если политика повторов не задана
+            max_retries = Retry(total=3, backoff_factor=0.1, status_forcelist=())  # то повторяем только запросы, не дошедшие до сервера. POST запросы не повторяем
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_maxsize, max_retries=max_retries, pool_block=pool_block)  # Пул соединений для серверов аутентификации и запросов
+        self.session = AlorSession(host_limit or pool_maxsize, self.rate_limits if rate_limits is None else rate_limits, status_retries, tracer=tracer)  # Сессия HTTP API. Соединения с сервером остаются открытыми (keep-alive) и используются повторно всеми запросами из всех потоков
+        self.session.mount('https://', adapter)  # Все запросы HTTPS выполняем через пул соединений
+        self.oauth_session = self.session  # Запросы к серверу аутентификации выполняем через ту же сессию
+        self.executor = ThreadPoolExecutor(max_workers=batch_workers or pool_maxsize, thread_name_prefix='AlorPyBatch')  # Потоки пакетных запросов. Создаются по мере необходимости
+        self.nested_executor = ThreadPoolExecutor(max_workers=pool_maxsize, thread_name_prefix='AlorPyNested')  # Потоки окон истории и страниц. Отдельно от пакетных запросов, т.к. их ждут потоки пакетных запросов
+        self.cws_lock = Lock()  # Блокировка подключения и отправки команд серверу заявок WebSocket
+        self.bar_lock = Lock()  # Блокировка завершения баров из потоков обработки подписок и таймера
+        self.init_state(demo, ws_shards, ws_shard_by, ws_shard_map, dispatch_workers, dispatch_queue_size, dispatch_policy, bar_cache)  # Настройки, события и справочники
+        self.refresh_token = self.load_refresh_token(refresh_token)  # Токен из параметра или системного хранилища
+        self.jwt_token_lock = Lock()  # Блокировка обновления токена JWT
+        self.jwt_token_stop = ThreadEvent()  # Остановка потока обновления токена JWT
+        self.get_jwt_token()  # Получаем токен JWT
+        Thread(target=self.jwt_token_thread, args=(ref(self), self.jwt_token_stop), name='JwtTokenThread', daemon=True).start()  # Создаем и запускаем поток обновления токена JWT. Поток хранит слабую ссылку на провайдер
+        self.set_accounts()  # Счета из токена JWT
+
+    def init_state(self, demo=False, ws_shards=1, ws_shard_by='opcode', ws_shard_map=None, dispatch_workers=0, dispatch_queue_size=10000, dispatch_policy='block', bar_cache=None):
+        """Настройки, события и справочники провайдера без запросов к серверам. Общие для синхронной и асинхронной версий
+
+        :param bool demo: Режим демо торговли
+        :param int ws_shards: Кол-во подключений к серверу подписок WebSocket
+        :param str ws_shard_by: Распределение подписок по подключениям
+        :param dict ws_shard_map: Закрепление типов подписок за подключениями
+        :param int dispatch_workers: Кол-во потоков обработки данных подписок
+        :param int dispatch_queue_size: Максимальное кол-во необработанных данных подписок в очереди каждого потока обработки
+        :param str dispatch_policy: Действие при заполненной очереди
+        :param BarCache|str bar_cache: Кэш бар или путь к его папке
         """
         self.oauth_server = f'https://oauth{"dev" if demo else ""}.alor.ru'  # Сервер аутентификации
         self.api_server = f'https://api{"dev" if demo else ""}.alor.ru'  # Сервер запросов
         self.cws_server = f'wss://api{"dev" if demo else ""}.alor.ru/cws'  # Сервис заявок WebSocket
         self.cws_socket = None  # Подключение к серверу заявок WebSocket
+        self.cws_pending = {}  # Команды, ждущие ответа сервера заявок WebSocket. Уникальный идентификатор запроса: Future
+        self.cws_timeout = 10  # Время ожидания ответа на команду в секундах
         self.ws_server = f'wss://api{"dev" if demo else ""}.alor.ru/ws'  # Сервис подписок и событий WebSocket
-        self.ws_socket = None  # Подключение к серверу подписок и событий WebSocket
-        self.ws_ready = False  # WebSocket готов принимать запросы
+        self.ws_shards = ws_shards  # Кол-во подключений к серверу подписок и событий WebSocket
+        self.ws_shard_by = ws_shard_by  # Распределение подписок по подключениям
+        self.ws_shard_map = ws_shard_map or {}  # Закрепленные за подключениями типы подписок
+        self.ws_sockets = [None] * ws_shards  # Подключения к серверу подписок и событий WebSocket
+        self.ws_shards_ready = [ThreadEvent() for _ in range(ws_shards)]  # Подключения готовы принимать запросы
         self.ws_running = False  # WebSocket запущен
-        self.ws_reconnect_timeout = 5  # Задержка между попытками подключиться к серверу в секундах
+        self.ws_reconnect_backoff = 0.5  # Задержка перед второй попыткой переподключиться к серверу в секундах. Первая попытка сразу. Далее задержка удваивается
+        self.ws_reconnect_timeout = 5  # Максимальная задержка между попытками подключиться к серверу в секундах
+        self.ws_stable_time = 10  # Время работы подключения в секундах, после которого задержка переподключения сбрасывается
+        self.dispatch_workers = dispatch_workers  # Кол-во потоков обработки данных подписок
+        self.dispatch_queue_size = dispatch_queue_size  # Размер очереди каждого потока обработки
+        self.dispatch_policy = dispatch_policy  # Действие при заполненной очереди
+        self.dispatcher = None  # Потоки обработки данных подписок. Запускаются вместе с WebSocket
+        self.bar_close_delay = 1  # Задержка завершения бара по таймеру после окончания его интервала в секундах. Для последних сделок бара, пришедших с задержкой
+        self.bar_timer_running = False  # Таймер завершения баров запущен
+        self.bar_cache = BarCache(bar_cache) if isinstance(bar_cache, str) else bar_cache  # Кэш бар на диске
+        self.server_time_offset = 0  # Разница между временем сервера и локальным временем в секундах
+        self.server_time_interval = 600  # Период обновления разницы времени сервера таймером завершения баров в секундах
 
         # События АЛОР Брокер API
         self.on_change_order_book = Event()  # Биржевой стакан
         self.on_new_bar = Event()  # Новый бар
+        self.on_bar_in_progress = Event()  # Изменение текущего (незавершенного) бара
         self.on_new_quotes = Event()  # Котировки
         self.on_all_trades = Event()  # Все сделки
         self.on_position = Event()  # Позиции по ценным бумагам и деньгам
@@ -69,19 +169,34 @@ class AlorPy:
         self.on_timeout = Event()  # Таймаут/максимальное кол-во попыток подключения
         self.on_exit = Event()  # Выход
 
+        self.jwt_token = None  # Токен JWT
+        self.jwt_token_decoded = dict()  # Информация по портфелям
+        self.jwt_token_expires = 0  # UNIX время в секундах окончания действия токена JWT
+        self.headers = {'Content-Type': 'application/json', 'Authorization': 'Bearer None'}  # Хедеры для запросов с текущим токеном JWT
+        self.accounts = list()  # Счета (портфели по договорам)
+        self.subscriptions = {}  # Справочник подписок. Для возобновления всех подписок после перезагрузки сервера Алор
+        self.handlers = {}  # Обработчики данных подписок по уникальному идентификатору подписки
+        self.conflated = set()  # Уникальные идентификаторы подписок, для которых обрабатываются только последние данные
+        self.subscribe_acks = {}  # Подтверждения подписок сервером, которые ждет subscribe_many. Уникальный идентификатор подписки: Future
+        self.symbols = {}  # Справочник тикеров
+
+    def load_refresh_token(self, refresh_token=None):
+        """Токен из параметра или системного хранилища. Указанный токен сохраняется в системном хранилище
+
+        :param str refresh_token: Токен. None - получить из системного хранилища
+        :return: Токен или None, если он не найден
+        """
         if refresh_token is None:  # Если токен не указан
-            self.refresh_token = keyring.get_password('AlorPy', 'refresh_token')  # то пробуем получить его из системного хранилища
-            if self.refresh_token is None:  # Если токен не найден
+            refresh_token = keyring.get_password('AlorPy', 'refresh_token')  # то пробуем получить его из системного хранилища
+            if refresh_token is None:  # Если токен не найден
                 self.logger.fatal('Токен не найден в системном хранилище. Вызовите ap_provider = AlorPy(''<Токен>'')')
         else:  # Если указан токен
-            self.refresh_token = refresh_token  # то запоминаем токен
-            keyring.set_password('AlorPy', 'refresh_token', self.refresh_token)  # Сохраняем токен в системном хранилище
+            keyring.set_password('AlorPy', 'refresh_token', refresh_token)  # Сохраняем токен в системном хранилище
+        return refresh_token
 
-        self.jwt_token = None  # Токен JWT
-        self.jwt_token_decoded = dict()  # Информация по портфелям
-        self.jwt_token_issued = 0  # UNIX время в секундах выдачи токена JWT
+    def set_accounts(self):
+        """Счета (портфели по договорам) из данных токена JWT"""
         self.accounts = list()  # Счета (портфели по договорам)
-        self.get_jwt_token()  # Получаем токен JWT
         if self.jwt_token_decoded:
             all_agreements = self.jwt_token_decoded['agreements'].split(' ')  # Все договоры
             all_portfolios = self.jwt_token_decoded['portfolios'].split(' ')  # Все портфели. К каждому договору привязаны 3 портфеля
@@ -112,8 +227,6 @@ class AlorPy:
                     self.accounts.append(dict(account_id=account_id, agreement=agreement, portfolio=portfolio, type=type, exchanges=exchanges, boards=boards))  # Добавляем договор/портфель/биржи/режимы торгов
                 account_id += 1  # Смещаем на следующий договор
                 portfolio_id += 3  # Смещаем на начальную позицию портфелей для следующего договора
-        self.subscriptions = {}  # Справочник подписок. Для возобновления всех подписок после перезагрузки сервера Алор
-        self.symbols = {}  # Справочник тикеров
 
     def __enter__(self):
         """Вход в класс, например, с with"""
@@ -125,29 +238,83 @@ class AlorPy:
         """JWT token
         :return: JWT токен, использующийся в качестве токена доступа при авторизации запросов к остальным ресурсам API
         """
-        now = int(datetime.timestamp(datetime.now()))  # Текущая дата и время в виде UNIX времени в секундах
-        if self.jwt_token is None or now - self.jwt_token_issued > self.jwt_token_ttl:  # Если токен JWT не был выдан или был просрочен
-            try:
-                response = post(url=f'{self.oauth_server}/refresh', params={'token': self.refresh_token})  # Запрашиваем новый JWT токен с сервера аутентификации
-            except SSLError:  # Ошибка соединения SSL
-                self.logger.error('Ошибка соединения SSL')  # Событие ошибки
-                self.jwt_token = None  # Сбрасываем токен JWT
-                self.jwt_token_decoded = None  # Сбрасываем данные о портфелях
-                self.jwt_token_issued = 0  # Сбрасываем время выдачи токена JWT
-                return self.jwt_token
-            if response.status_code != 200:  # Если при получении токена возникла ошибка
-                self.logger.error(f'Ошибка получения JWT токена: {response.status_code}')  # Событие ошибки
-                self.jwt_token = None  # Сбрасываем токен JWT
-                self.jwt_token_decoded = None  # Сбрасываем данные о портфелях
-                self.jwt_token_issued = 0  # Сбрасываем время выдачи токена JWT
-                return self.jwt_token
-            # Токен получен
-            token = response.json()  # Читаем данные JSON
-            self.jwt_token = token['AccessToken']  # Получаем токен JWT
-            self.jwt_token_decoded = decode(self.jwt_token, options={'verify_signature': False})  # Получаем из него данные о портфелях
-            self.jwt_token_issued = now  # Дата выдачи токена JWT
+        if self.jwt_token is None or time() >= self.jwt_token_expires:  # Если токен JWT не был выдан или был просрочен (поток обновления не успел его обновить)
+            with self.jwt_token_lock:  # Токен обновляет только один поток
+                if self.jwt_token is None or time() >= self.jwt_token_expires:  # Если токен не был обновлен другим потоком, пока ждали
+                    self.refresh_jwt_token()  # то обновляем токен JWT
+        return self.jwt_token
+
+    def refresh_jwt_token(self):
+        """Получение нового токена JWT с сервера аутентификации. Вызывается под блокировкой jwt_token_lock
+
+        :return: JWT токен или None в случае ошибки
+        """
+        try:
+            response = self.oauth_session.post(url=f'{self.oauth_server}/refresh', params={'token': self.refresh_token})  # Запрашиваем новый JWT токен с сервера аутентификации
+        except SSLError:  # Ошибка соединения SSL
+            self.logger.error('Ошибка соединения SSL')  # Событие ошибки
+            return self.set_jwt_token(None)
+        if response.status_code != 200:  # Если при получении токена возникла ошибка
+            self.logger.error(f'Ошибка получения JWT токена: {response.status_code}')  # Событие ошибки
+            return self.set_jwt_token(None)
+        return self.set_jwt_token(response.json())  # Токен получен
+
+    def set_jwt_token(self, token):
+        """Установка токена JWT из ответа сервера аутентификации
+
+        :param dict token: Ответ сервера аутентификации. None - сбросить токен после ошибки
+        :return: JWT токен или None в случае ошибки
+        """
+        if token is None:  # Если токен не получен
+            self.jwt_token = None  # Сбрасываем токен JWT
+            self.jwt_token_decoded = None  # Сбрасываем данные о портфелях
+            self.jwt_token_expires = 0  # Сбрасываем время окончания действия токена JWT
+            return self.jwt_token
+        jwt_token = token['AccessToken']  # Получаем токен JWT
+        jwt_token_decoded = decode(jwt_token, options={'verify_signature': False})  # Получаем из него данные о портфелях
+        self.headers = {'Content-Type': 'application/json', 'Authorization': f'Bearer {jwt_token}'}  # Заменяем хедеры для запросов целиком
+        self.jwt_token_decoded = jwt_token_decoded
+        self.jwt_token_expires = jwt_token_decoded.get('exp', time() + self.jwt_token_ttl)  # Время окончания действия токена JWT из токена
+        self.jwt_token = jwt_token
         return self.jwt_token
 
+    def get_jwt_token_timeout(self):
+        """Время до обновления токена JWT в секундах. Токен обновляется заранее, до окончания его действия
+
+        :return: Время в секундах, не меньше 1
+        """
+        if self.jwt_token is None:  # Если токен получить не удалось
+            timeout = self.ws_reconnect_timeout  # то повторим попытку через время переподключения
+        else:  # Если токен действует
+            remaining = self.jwt_token_expires - time()  # Оставшееся время действия токена в секундах
+            timeout = remaining - self.jwt_token_refresh_before if remaining > 2 * self.jwt_token_refresh_before else remaining / 2  # Обновим его заранее
+        return max(timeout, 1)
+
+    @staticmethod
+    def jwt_token_thread(ap_ref, stop):
+        """Поток обновления токена JWT до окончания его действия
+
+        :param ap_ref: Слабая ссылка на провайдер. Поток завершается, когда провайдер удален
+        :param ThreadEvent stop: Остановка потока
+        """
+        while True:
+            ap = ap_ref()  # Провайдер
+            if ap is None:  # Если провайдер удален
+                break  # то выходим, дальше не продолжаем
+            timeout = ap.get_jwt_token_timeout()  # Время до обновления токена
+            del ap  # Во время ожидания провайдер не удерживаем
+            if stop.wait(timeout):  # Ждем времени обновления. Если запрошена остановка
+                break  # то выходим, дальше не продолжаем
+            ap = ap_ref()
+            if ap is None:  # Если провайдер удален во время ожидания
+                break
+            try:
+                with ap.jwt_token_lock:  # Токен обновляет только один поток
+                    ap.refresh_jwt_token()  # Обновляем токен JWT
+            except Exception as ex:  # При ошибке соединения
+                ap.logger.error(f'JWT Token Thread: Ошибка {ex}')  # Событие ошибки. Попробуем еще раз
+            del ap
+
     # О клиенте
 
     def get_orders(self, portfolio, exchange, format='Simple'):  # https://alor.dev/docs/api/http/md-v-2-clients-exchange-portfolio-orders-get
@@ -159,7 +326,7 @@ class AlorPy:
         :return: Запрос возвращает информацию обо всех биржевых заявках с участием указанного портфеля
         """
         params = {'format': format}
-        return self.check_result(get(url=f'{self.api_server}/md/v2/clients/{exchange}/{portfolio}/orders', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/clients/{exchange}/{portfolio}/orders', params=params, headers=self.get_headers()))
 
     def get_order(self, portfolio, exchange, order_id, format='Simple'):  # https://alor.dev/docs/api/http/md-v-2-clients-exchange-portfolio-orders-order-id-get
         """Выбранная биржевая заявка
@@ -171,7 +338,7 @@ class AlorPy:
         :return: Запрос возвращает информацию об определённой биржевой заявке
         """
         params = {'format': format}
-        return self.check_result(get(url=f'{self.api_server}/md/v2/clients/{exchange}/{portfolio}/orders/{order_id}', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/clients/{exchange}/{portfolio}/orders/{order_id}', params=params, headers=self.get_headers()))
 
     def get_stop_orders(self, portfolio, exchange, format='Simple'):  # https://alor.dev/docs/api/http/md-v-2-clients-exchange-portfolio-stop-orders-get
         """Все условные заявки
@@ -182,7 +349,7 @@ class AlorPy:
         :return: Запрос возвращает информацию обо всех стоп-заявках с участием указанного портфеля
         """
         params = {'format': format}
-        return self.check_result(get(url=f'{self.api_server}/md/v2/clients/{exchange}/{portfolio}/stoporders', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/clients/{exchange}/{portfolio}/stoporders', params=params, headers=self.get_headers()))
 
     def get_stop_order(self, portfolio, exchange, order_id, format='Simple'):  # https://alor.dev/docs/api/http/md-v-2-clients-exchange-portfolio-stop-orders-order-id-get
         """Выбранная условная заявка
@@ -194,7 +361,7 @@ class AlorPy:
         :return: Запрос возвращает информацию об определённой стоп-заявке
         """
         params = {'format': format}
-        return self.check_result(get(url=f'{self.api_server}/md/v2/clients/{exchange}/{portfolio}/stoporders/{order_id}', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/clients/{exchange}/{portfolio}/stoporders/{order_id}', params=params, headers=self.get_headers()))
 
     def get_portfolio_summary(self, portfolio, exchange, format='Simple'):  # https://alor.dev/docs/api/http/md-v-2-clients-exchange-portfolio-summary-get
         """Сводная информация о портфеле
@@ -205,7 +372,7 @@ class AlorPy:
         :return: Запрос возвращает сводную информацию об указанном портфеле
         """
         params = {'format': format}
-        return self.check_result(get(url=f'{self.api_server}/md/v2/clients/{exchange}/{portfolio}/summary', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/clients/{exchange}/{portfolio}/summary', params=params, headers=self.get_headers()))
 
     def get_positions(self, portfolio, exchange, without_currency=False, format='Simple'):  # https://alor.dev/docs/api/http/md-v-2-clients-exchange-portfolio-positions-get
         """Позиции в портфеле (Все)
@@ -217,7 +384,7 @@ class AlorPy:
         :return: Запрос возвращает информацию о наличии и свойствах позиций финансовых и валютных инструментов в указанном портфеле
         """
         params = {'withoutCurrency': without_currency, 'format': format}
-        return self.check_result(get(url=f'{self.api_server}/md/v2/Clients/{exchange}/{portfolio}/positions', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/Clients/{exchange}/{portfolio}/positions', params=params, headers=self.get_headers()))
 
     def get_position(self, portfolio, exchange, symbol, format='Simple'):  # https://alor.dev/docs/api/http/md-v-2-clients-exchange-portfolio-positions-symbol-get
         """Позиции в портфеле (По инструменту)
@@ -229,7 +396,7 @@ class AlorPy:
         :return: Запрос возвращает информацию обо всех открытых позициях выбранного инструмента в указанном портфеле
         """
         params = {'format': format}
-        return self.check_result(get(url=f'{self.api_server}/md/v2/Clients/{exchange}/{portfolio}/positions/{symbol}', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/Clients/{exchange}/{portfolio}/positions/{symbol}', params=params, headers=self.get_headers()))
 
     def get_trades(self, portfolio, exchange, with_repo=None, format='Simple'):  # https://alor.dev/docs/api/http/md-v-2-clients-exchange-portfolio-trades-get
         """Сделки по портфелю (Все | Текущая сессия)
@@ -243,7 +410,7 @@ class AlorPy:
         params: dict[str, Any] = {'format': format}
         if with_repo:
             params['withRepo'] = with_repo
-        return self.check_result(get(url=f'{self.api_server}/md/v2/Clients/{exchange}/{portfolio}/trades', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/Clients/{exchange}/{portfolio}/trades', params=params, headers=self.get_headers()))
 
     def get_trade(self, portfolio, exchange, symbol, format='Simple'):  # https://alor.dev/docs/api/http/md-v-2-clients-exchange-portfolio-symbol-trades-get
         """Сделки по портфелю (Инструмент | Текущая сессия)
@@ -255,7 +422,7 @@ class AlorPy:
         :return: Запрос возвращает информацию обо всех сделках с участием указанного в portfolio портфеля по указанному в symbol финансовому инструменту за текущую торговую сессию
         """
         params = {'format': format}
-        return self.check_result(get(url=f'{self.api_server}/md/v2/Clients/{exchange}/{portfolio}/{symbol}/trades', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/Clients/{exchange}/{portfolio}/{symbol}/trades', params=params, headers=self.get_headers()))
 
     def get_forts_risk(self, portfolio, exchange, format='Simple'):  # https://alor.dev/docs/api/http/md-v-2-clients-exchange-portfolio-fortsrisk-get
         """Риски на срочном рынке
@@ -266,7 +433,7 @@ class AlorPy:
         :return: Запрос возвращает информацию по рискам срочного рынка (FORTS) для указанного портфеля
         """
         params = {'format': format}
-        return self.check_result(get(url=f'{self.api_server}/md/v2/Clients/{exchange}/{portfolio}/fortsrisk', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/Clients/{exchange}/{portfolio}/fortsrisk', params=params, headers=self.get_headers()))
 
     def get_risk(self, portfolio, exchange, format='Simple'):  # https://alor.dev/docs/api/http/md-v-2-clients-exchange-portfolio-risk-get
         """Все риски
@@ -277,7 +444,7 @@ class AlorPy:
         :return: Запрос возвращает сводную информацию по портфельным рискам для указанного портфеля
         """
         params = {'format': format}
-        return self.check_result(get(url=f'{self.api_server}/md/v2/Clients/{exchange}/{portfolio}/risk', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/Clients/{exchange}/{portfolio}/risk', params=params, headers=self.get_headers()))
 
     def get_login_positions(self, login, without_currency=None, format='Simple'):  # https://alor.dev/docs/api/http/md-v-2-clients-login-positions-get
         """Все позиции для выбранного логина
@@ -290,7 +457,7 @@ class AlorPy:
         params: dict[str, Any] = {'format': format}
         if without_currency:
             params['withoutCurrency'] = without_currency
-        return self.check_result(get(url=f'{self.api_server}/md/v2/Clients/{login}/positions', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/Clients/{login}/positions', params=params, headers=self.get_headers()))
 
     def get_trades_history_v2(self, portfolio, exchange, instrument_group=None, date_from=None, ticker=None, id_from=None,
                               limit=None, order_by_trade_date=None, descending=None, with_repo=None, side=None, format='Simple'):  # https://alor.dev/docs/api/http/md-v-2-stats-exchange-portfolio-history-trades-get
@@ -329,7 +496,7 @@ class AlorPy:
             params['withRepo'] = with_repo
         if side:
             params['side'] = side
-        return self.check_result(get(url=f'{self.api_server}/md/v2/Stats/{exchange}/{portfolio}/history/trades', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/Stats/{exchange}/{portfolio}/history/trades', params=params, headers=self.get_headers()))
 
     def get_trades_symbol_v2(self, portfolio, exchange, symbol, instrument_group=None, date_from=None, id_from=None,
                              limit=None, order_by_trade_date=None, descending=None, with_repo=None, side=None, format='Simple'):  # https://alor.dev/docs/api/http/md-v-2-stats-exchange-portfolio-history-trades-symbol-get
@@ -366,7 +533,7 @@ class AlorPy:
             params['withRepo'] = with_repo
         if side:
             params['side'] = side
-        return self.check_result(get(url=f'{self.api_server}/md/v2/Stats/{exchange}/{portfolio}/history/trades/{symbol}', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/Stats/{exchange}/{portfolio}/history/trades/{symbol}', params=params, headers=self.get_headers()))
 
     # Об инструменте
 
@@ -401,7 +568,7 @@ class AlorPy:
             params['instrumentGroup'] = instrument_group
         if include_non_base_boards:
             params['includeNonBaseBoards'] = include_non_base_boards
-        return self.check_result(get(url=f'{self.api_server}/md/v2/Securities', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/Securities', params=params, headers=self.get_headers()))
 
     def get_securities_exchange(self, exchange, market=None, include_old=None, limit=None, include_non_base_boards=None, offset=None, format='Simple'):  # https://alor.dev/docs/api/http/md-v-2-securities-exchange-get
         """Все торговые инструменты выбранной биржи
@@ -426,7 +593,7 @@ class AlorPy:
             params['includeNonBaseBoards'] = include_non_base_boards
         if offset:
             params['offset'] = offset
-        return self.check_result(get(url=f'{self.api_server}/md/v2/Securities/{exchange}', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/Securities/{exchange}', params=params, headers=self.get_headers()))
 
     def get_symbol(self, exchange, symbol, instrument_group=None, format='Simple') -> dict | None:  # https://alor.dev/docs/api/http/md-v-2-securities-exchange-symbol-get
         """Выбранный торговый инструмент
@@ -440,7 +607,7 @@ class AlorPy:
         params = {'format': format}
         if instrument_group:
             params['instrumentGroup'] = instrument_group
-        result: dict = self.check_result(get(url=f'{self.api_server}/md/v2/Securities/{exchange}/{symbol}', params=params, headers=self.get_headers()))  # Результат в виде словаря
+        result: dict = self.check_result(self.session.get(url=f'{self.api_server}/md/v2/Securities/{exchange}/{symbol}', params=params, headers=self.get_headers()))  # Результат в виде словаря
         if result is not None:  # Если данные тикера получены
             result['decimals'] = int(log10(1 / result['minstep']) + 0.99)  # Кол-во десятичных знаков получаем из шага цены, добавляем в полученный словарь
         return result
@@ -452,11 +619,11 @@ class AlorPy:
         :param str symbol: Тикер
         :return: Запрос возвращает список всех кодов режимов торгов, в которых представлен выбранный финансовый инструмент
         """
-        return self.check_result(get(url=f'{self.api_server}/md/v2/Securities/{exchange}/{symbol}/availableBoards', headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/Securities/{exchange}/{symbol}/availableBoards', headers=self.get_headers()))
 
     def get_all_trades(self, exchange, symbol,
                        instrument_group=None, seconds_from=None, seconds_to=None, id_from=None, id_to=None, qty_from=None, qty_to=None, price_from=None, price_to=None,
-                       side=None, offset=None, take=None, descending=None, include_virtual_trades=None, format='Simple'):  # https://alor.dev/docs/api/http/md-v-2-securities-exchange-symbol-alltrades-get
+                       side=None, offset=None, take=None, descending=None, include_virtual_trades=None, format='Simple', result_type='dict'):  # https://alor.dev/docs/api/http/md-v-2-securities-exchange-symbol-alltrades-get
         """Сделки по инструменту (Текущая сессия)
 
         :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
@@ -476,8 +643,10 @@ class AlorPy:
         :param bool descending: Флаг обратной сортировки выдачи
         :param bool include_virtual_trades: Флаг загрузки виртуальных (индикативных) сделок, полученных из заявок на питерской бирже
         :param str format: Формат возвращаемого сервером JSON-объекта: 'Simple', 'Slim', 'Heavy'
+        :param str result_type: Тип результата: 'dict' - справочник из JSON, 'record' - компактные записи Trade (только для формата 'Simple')
         :return: Запрос возвращает обезличенную информацию обо всех сделках с участием указанного в symbol инструмента, совершённых всеми участниками торгов за текущую торговую сессию
         """
+        self.check_result_type(result_type, format)  # До запроса проверяем, что результат можно получить
         params: dict[str, Any] = {'format': format}
         if instrument_group:
             params['instrumentGroup'] = instrument_group
@@ -507,9 +676,9 @@ class AlorPy:
             params['descending'] = descending
         if include_virtual_trades:
             params['includeVirtualTrades'] = include_virtual_trades
-        return self.check_result(get(url=f'{self.api_server}/md/v2/Securities/{exchange}/{symbol}/alltrades', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/Securities/{exchange}/{symbol}/alltrades', params=params, headers=self.get_headers()), Trade.convert if result_type == 'record' else None)
 
-    def get_all_trades_history(self, exchange, symbol, instrument_group=None, seconds_from=None, seconds_to=None, limit=50000, offset=None, format='Simple'):  # https://alor.dev/docs/api/http/md-v-2-securities-exchange-symbol-alltrades-history-get
+    def get_all_trades_history(self, exchange, symbol, instrument_group=None, seconds_from=None, seconds_to=None, limit=50000, offset=None, format='Simple', result_type='dict'):  # https://alor.dev/docs/api/http/md-v-2-securities-exchange-symbol-alltrades-history-get
         """Сделки по инструменту (Прошлые сессии)
 
         :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
@@ -520,8 +689,10 @@ class AlorPy:
         :param int limit: Ограничение на количество выдаваемых результатов поиска (1-50000)
         :param int offset: Смещение начала выборки (для пагинации)
         :param str format: Формат возвращаемого сервером JSON-объекта: 'Simple', 'Slim', 'Heavy'
+        :param str result_type: Тип результата: 'dict' - справочник из JSON, 'record' - компактные записи Trade (только для формата 'Simple')
         :return: Запрос возвращает обезличенную информацию обо всех сделках с участием указанного в symbol инструмента, совершённых всеми участниками торгов за прошлые торговые сессии
         """
+        self.check_result_type(result_type, format)  # До запроса проверяем, что результат можно получить
         params = {'limit': limit, 'format': format}
         if instrument_group:
             params['instrumentGroup'] = instrument_group
@@ -531,7 +702,7 @@ class AlorPy:
             params['to'] = seconds_to
         if offset:
             params['offset'] = offset
-        return self.check_result(get(url=f'{self.api_server}/md/v2/Securities/{exchange}/{symbol}/alltrades/history', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/Securities/{exchange}/{symbol}/alltrades/history', params=params, headers=self.get_headers()), Trade.convert if result_type == 'record' else None)
 
     def get_actual_futures_quote(self, exchange, symbol, format='Simple'):  # https://alor.dev/docs/api/http/md-v-2-securities-exchange-symbol-actual-futures-quote-get
         """Котировки по ближайшему фьючерсу (код)
@@ -542,17 +713,19 @@ class AlorPy:
         :return: Запрос возвращает информацию о текущем активном фьючерсе с ближайшей датой экспирации
         """
         params = {'format': format}
-        return self.check_result(get(url=f'{self.api_server}/md/v2/Securities/{exchange}/{symbol}/actualFuturesQuote', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/Securities/{exchange}/{symbol}/actualFuturesQuote', params=params, headers=self.get_headers()))
 
-    def get_quotes(self, symbols, format='Simple'):  # https://alor.dev/docs/api/http/md-v-2-securities-symbols-quotes-get
+    def get_quotes(self, symbols, format='Simple', result_type='dict'):  # https://alor.dev/docs/api/http/md-v-2-securities-symbols-quotes-get
         """Котировки для выбранных инструментов
 
         :param str symbols: Принимает несколько пар биржа-тикер. Пары отделены запятыми. Биржа и тикер разделены двоеточием. Пример: MOEX:SBER,MOEX:GAZP,SPBX:AAPL
         :param str format: Формат возвращаемого сервером JSON-объекта: 'Simple', 'Slim', 'Heavy'
+        :param str result_type: Тип результата: 'dict' - справочник из JSON, 'record' - компактные записи Quote (только для формата 'Simple')
         :return: Запрос возвращает информацию о котировках для выбранного финансового инструмента на указанной бирже
         """
+        self.check_result_type(result_type, format)  # До запроса проверяем, что результат можно получить
         params = {'format': format}
-        return self.check_result(get(url=f'{self.api_server}/md/v2/Securities/{symbols}/quotes', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/Securities/{symbols}/quotes', params=params, headers=self.get_headers()), Quote.convert if result_type == 'record' else None)
 
     def get_currency_pairs(self, format='Simple'):  # https://alor.dev/docs/api/http/md-v-2-securities-currency-pairs-get
         """Валютные пары
@@ -561,9 +734,9 @@ class AlorPy:
         :return: Запрос возвращает список всех доступных валютных пар
         """
         params = {'format': format}
-        return self.check_result(get(url=f'{self.api_server}/md/v2/Securities/currencyPairs', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/Securities/currencyPairs', params=params, headers=self.get_headers()))
 
-    def get_order_book(self, exchange, symbol, instrument_group=None, depth=None, format='Simple'):  # https://alor.dev/docs/api/http/md-v-2-orderbooks-exchange-symbol-get
+    def get_order_book(self, exchange, symbol, instrument_group=None, depth=None, format='Simple', result_type='dict'):  # https://alor.dev/docs/api/http/md-v-2-orderbooks-exchange-symbol-get
         """Биржевой стакан
 
         :param exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
@@ -571,14 +744,16 @@ class AlorPy:
         :param str instrument_group: Код режима торгов
         :param int depth: Глубина стакана. Стандартное значение — 20 (20х20), максимальное — 50 (50х50)
         :param str format: Формат возвращаемого сервером JSON-объекта: 'Simple', 'Slim', 'Heavy'
+        :param str result_type: Тип результата: 'dict' - справочник из JSON, 'record' - компактные записи OrderBookSnapshot (только для формата 'Simple')
         :return: Запрос возвращает информацию о текущем количестве лотов и их цене в бидах и асках биржевого стакана для указанного финансового инструмента
         """
+        self.check_result_type(result_type, format)  # До запроса проверяем, что результат можно получить
         params: dict[str, Any] = {'format': format}
         if depth:
             params['depth'] = depth
         if instrument_group:
             params['instrumentGroup'] = instrument_group
-        return self.check_result(get(url=f'{self.api_server}/md/v2/orderbooks/{exchange}/{symbol}', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/orderbooks/{exchange}/{symbol}', params=params, headers=self.get_headers()), OrderBookSnapshot.convert if result_type == 'record' else None)
 
     def get_risk_rates(self, exchange, ticker=None, risk_category_id=None, search=None, limit=None, offset=None):  # https://alor.dev/docs/api/http/md-v-2-risk-rates-get
         """Ставки риска
@@ -602,10 +777,10 @@ class AlorPy:
             params['limit'] = limit
         if offset:
             params['offset'] = offset
-        return self.check_result(get(url=f'{self.api_server}/md/v2/risk/rates', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/risk/rates', params=params, headers=self.get_headers()))
 
     def get_history(self, exchange, symbol, tf, seconds_from=0, seconds_to=32536799999,
-                    instrument_group=None, count_back=None, untraded=None, split_adjust=None, format='Simple'):  # https://alor.dev/docs/api/http/md-v-2-history-get
+                    instrument_group=None, count_back=None, untraded=None, split_adjust=None, format='Simple', result_type='dict'):  # https://alor.dev/docs/api/http/md-v-2-history-get
         """История рынка для выбранных биржи и инструмента
 
         :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
@@ -618,8 +793,10 @@ class AlorPy:
         :param bool untraded: Флаг для поиска данных по устаревшим или экспирированным инструментам. При использовании требуется точное совпадение тикера
         :param bool split_adjust: Флаг коррекции исторических свечей инструмента с учётом сплитов, консолидаций и прочих факторов
         :param str format: Формат возвращаемого сервером JSON-объекта: 'Simple', 'Slim', 'Heavy'
+        :param str result_type: Тип результата: 'dict' - справочник из JSON, 'record' - компактные записи Bar (только для формата 'Simple')
         :return: Запрос возвращает исторические данные о состоянии рынка для выбранных биржи и финансового инструмента
         """
+        self.check_result_type(result_type, format)  # До запроса проверяем, что результат можно получить
         params = {'exchange': exchange, 'symbol': symbol, 'tf': tf, 'from': seconds_from, 'to': seconds_to, 'format': format}
         if instrument_group:
             params['instrumentGroup'] = instrument_group
@@ -629,7 +806,7 @@ class AlorPy:
             params['untraded'] = untraded
         if split_adjust:
             params['splitAdjust'] = split_adjust
-        return self.check_result(get(url=f'{self.api_server}/md/v2/history', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/history', params=params, headers=self.get_headers()), Bar.convert if result_type == 'record' else None)
 
     # Биржевые заявки
 
@@ -660,7 +837,7 @@ class AlorPy:
             params['timeInForce'] = time_in_force
         if allow_margin:
             params['allowMargin'] = allow_margin
-        return self.check_result(post(url=f'{self.api_server}/commandapi/warptrans/TRADE/v2/client/orders/actions/market', headers=headers, json=params))
+        return self.check_result(self.session.post(url=f'{self.api_server}/commandapi/warptrans/TRADE/v2/client/orders/actions/market', headers=headers, json=params))
 
     def create_limit_order(self, portfolio, exchange, symbol, side, quantity, price,
                            instrument_group=None, comment=None, time_in_force=None, allow_margin=None, iceberg_fixed=None, iceberg_variance=None):  # https://alor.dev/docs/api/http/commandapi-warptrans-trade-v-2-client-orders-actions-limit-post
@@ -696,7 +873,7 @@ class AlorPy:
             params['icebergFixed'] = iceberg_fixed
         if iceberg_variance:
             params['icebergVariance'] = iceberg_variance
-        return self.check_result(post(url=f'{self.api_server}/commandapi/warptrans/TRADE/v2/client/orders/actions/limit', headers=headers, json=params))
+        return self.check_result(self.session.post(url=f'{self.api_server}/commandapi/warptrans/TRADE/v2/client/orders/actions/limit', headers=headers, json=params))
 
     def edit_market_order(self, portfolio, exchange, order_id, symbol, side, quantity,
                           instrument_group=None, comment=None, time_in_force=None, allow_margin=None):  # https://alor.dev/docs/api/http/commandapi-warptrans-trade-v-2-client-orders-actions-market-order-id-put
@@ -726,7 +903,7 @@ class AlorPy:
             params['timeInForce'] = time_in_force
         if allow_margin:
             params['allowMargin'] = allow_margin
-        return self.check_result(put(url=f'{self.api_server}/commandapi/warptrans/TRADE/v2/client/orders/actions/market/{order_id}', headers=headers, json=params))
+        return self.check_result(self.session.put(url=f'{self.api_server}/commandapi/warptrans/TRADE/v2/client/orders/actions/market/{order_id}', headers=headers, json=params))
 
     def edit_limit_order(self, portfolio, exchange, order_id, symbol, side, quantity, price,
                          instrument_group=None, comment=None, time_in_force=None, allow_margin=None, iceberg_fixed=None, iceberg_variance=None):  # https://alor.dev/docs/api/http/commandapi-warptrans-trade-v-2-client-orders-actions-limit-order-id-put
@@ -763,7 +940,7 @@ class AlorPy:
             params['icebergFixed'] = iceberg_fixed
         if iceberg_variance:
             params['icebergVariance'] = iceberg_variance
-        return self.check_result(put(url=f'{self.api_server}/commandapi/warptrans/TRADE/v2/client/orders/actions/limit/{order_id}', headers=headers, json=params))
+        return self.check_result(self.session.put(url=f'{self.api_server}/commandapi/warptrans/TRADE/v2/client/orders/actions/limit/{order_id}', headers=headers, json=params))
 
     def estimate_order(self, portfolio, exchange, symbol, price, quantity=None, budget=None, board=None, include_limit_orders=False):  # https://alor.dev/docs/api/http/commandapi-warptrans-trade-v-2-client-orders-estimate-post
         """Провести оценку одной заявки
@@ -787,7 +964,7 @@ class AlorPy:
             params['board'] = board
         if include_limit_orders:
             params['includeLimitOrders'] = include_limit_orders
-        return self.check_result(post(url=f'{self.api_server}/commandapi/warptrans/TRADE/v2/client/orders/estimate', json=params))
+        return self.check_result(self.session.post(url=f'{self.api_server}/commandapi/warptrans/TRADE/v2/client/orders/estimate', json=params))
 
     def estimate_orders(self, orders):  # https://alor.dev/docs/api/http/commandapi-warptrans-trade-v-2-client-orders-estimate-all-post
         """Провести оценку нескольких заявок
@@ -795,7 +972,7 @@ class AlorPy:
         :param dict orders: Список параметров заявок. Оформлять каждую заявку как в EstimateOrder:
         {'portfolio': portfolio, 'ticker': symbol, 'exchange': exchange, 'price': price, 'lotQuantity': quantity, 'budget': budget, 'board': board, 'includeLimitOrders': include_limit_orders}
         """
-        return self.check_result(post(url=f'{self.api_server}/commandapi/warptrans/TRADE/v2/client/orders/estimate/all', json=orders))
+        return self.check_result(self.session.post(url=f'{self.api_server}/commandapi/warptrans/TRADE/v2/client/orders/estimate/all', json=orders))
 
     def delete_order(self, portfolio, exchange, order_id, stop=False, format='Simple'):  # https://alor.dev/docs/api/http/commandapi-warptrans-trade-v-2-client-orders-order-id-delete
         """Снять одну заявку
@@ -808,7 +985,7 @@ class AlorPy:
         :return: Запрос снимает выставленную ранее заявку. Для определения отменяемой заявки используется её номер в параметре orderid
         """
         params = {'portfolio': portfolio, 'exchange': exchange, 'stop': stop, 'format': format}
-        return self.check_result(delete(url=f'{self.api_server}/commandapi/warptrans/TRADE/v2/client/orders/{order_id}', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.delete(url=f'{self.api_server}/commandapi/warptrans/TRADE/v2/client/orders/{order_id}', params=params, headers=self.get_headers()))
 
     def delete_all_orders(self, portfolio, exchange, stop=False):  # https://alor.dev/docs/api/http/commandapi-warptrans-trade-v-2-client-orders-all-delete
         """Снять все заявки
@@ -819,7 +996,7 @@ class AlorPy:
         :return: Запрос снимает все биржевые и/или условные заявки для указанного портфеля
         """
         params = {'portfolio': portfolio, 'exchange': exchange, 'stop': stop}
-        return self.check_result(delete(url=f'{self.api_server}/commandapi/warptrans/TRADE/v2/client/orders/all', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.delete(url=f'{self.api_server}/commandapi/warptrans/TRADE/v2/client/orders/all', params=params, headers=self.get_headers()))
 
     # Условные заявки
 
@@ -853,7 +1030,7 @@ class AlorPy:
             params['allowMargin'] = allow_margin
         if comment:
             params['comment'] = comment
-        return self.check_result(post(url=f'{self.api_server}/commandapi/warptrans/TRADE/v2/client/orders/actions/stop', headers=headers, json=params))
+        return self.check_result(self.session.post(url=f'{self.api_server}/commandapi/warptrans/TRADE/v2/client/orders/actions/stop', headers=headers, json=params))
 
     def create_stop_limit_order(self, portfolio, exchange, symbol, side, quantity, trigger_price, price,
                                 instrument_group=None, condition='Less', stop_end_unix_time=0, time_in_force=None, allow_margin=None,
@@ -896,7 +1073,7 @@ class AlorPy:
             params['icebergVariance'] = iceberg_variance
         if comment:
             params['comment'] = comment
-        return self.check_result(post(url=f'{self.api_server}/commandapi/warptrans/TRADE/v2/client/orders/actions/stopLimit', headers=headers, json=params))
+        return self.check_result(self.session.post(url=f'{self.api_server}/commandapi/warptrans/TRADE/v2/client/orders/actions/stopLimit', headers=headers, json=params))
 
     def edit_stop_order(self, portfolio, exchange, order_id, symbol, side, quantity, trigger_price,
                         instrument_group=None, condition='Less', stop_end_unix_time=0, allow_margin=None, protecting_seconds=15, comment=None, activate=True):  # https://alor.dev/docs/api/http/commandapi-warptrans-trade-v-2-client-orders-actions-stop-stop-order-id-put
@@ -929,7 +1106,7 @@ class AlorPy:
             params['allowMargin'] = allow_margin
         if comment:
             params['comment'] = comment
-        return self.check_result(put(url=f'{self.api_server}/commandapi/warptrans/TRADE/v2/client/orders/actions/stop/{order_id}', headers=headers, json=params))
+        return self.check_result(self.session.put(url=f'{self.api_server}/commandapi/warptrans/TRADE/v2/client/orders/actions/stop/{order_id}', headers=headers, json=params))
 
     def edit_stop_limit_order(self, portfolio, exchange, order_id, symbol, side, quantity, trigger_price, price,
                               instrument_group=None, condition='Less', stop_end_unix_time=0, time_in_force=None, allow_margin=None,
@@ -973,7 +1150,7 @@ class AlorPy:
             params['icebergVariance'] = iceberg_variance
         if comment:
             params['comment'] = comment
-        return self.check_result(put(url=f'{self.api_server}/commandapi/warptrans/TRADE/v2/client/orders/actions/stopLimit/{order_id}', headers=headers, json=params))
+        return self.check_result(self.session.put(url=f'{self.api_server}/commandapi/warptrans/TRADE/v2/client/orders/actions/stopLimit/{order_id}', headers=headers, json=params))
 
     # Группы заявок
 
@@ -982,7 +1159,7 @@ class AlorPy:
 
         :return: Запрос возвращает список групп заявок для логина, выписавшего токен
         """
-        return self.check_result(get(url=f'{self.api_server}/commandapi/api/orderGroups', headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/commandapi/api/orderGroups', headers=self.get_headers()))
 
     def get_order_group(self, order_group_id):  # https://alor.dev/docs/api/http/commandapi-api-order-groups-order-group-id-get
         """Выбранная группа заявок
@@ -990,7 +1167,7 @@ class AlorPy:
         :param str order_group_id: Идентификатор группы заявок
         :return: Запрос возвращает информацию об определённой группе заявок, идентификатор которой указан в параметре orderGroupId
         """
-        return self.check_result(get(url=f'{self.api_server}/commandapi/api/orderGroups{order_group_id}', headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/commandapi/api/orderGroups{order_group_id}', headers=self.get_headers()))
 
     def create_order_group(self, orders, execution_policy):  # https://alor.dev/docs/api/http/commandapi-api-order-groups-post
         """Создать группу заявок
@@ -1007,7 +1184,7 @@ class AlorPy:
         :return: Создание группы заявок на основе уже созданных заявок
         """
         params = {'orders': orders, 'executionPolicy': execution_policy}
-        return self.check_result(post(url=f'{self.api_server}/commandapi/api/orderGroups', headers=self.get_headers(), json=params))
+        return self.check_result(self.session.post(url=f'{self.api_server}/commandapi/api/orderGroups', headers=self.get_headers(), json=params))
 
     def edit_order_group(self, order_group_id, orders, execution_policy):  # https://alor.dev/docs/api/http/commandapi-api-order-groups-order-group-id-put
         """Изменить группу заявок
@@ -1025,7 +1202,7 @@ class AlorPy:
         :return: Изменение характеристик группы заявок с указанным в параметре orderGroupId идентификатором: связывание новых заявок, изменение типа связи и так далее
         """
         params = {'orders': orders, 'executionPolicy': execution_policy}
-        return self.check_result(put(url=f'{self.api_server}/commandapi/api/orderGroups{order_group_id}', headers=self.get_headers(), json=params))
+        return self.check_result(self.session.put(url=f'{self.api_server}/commandapi/api/orderGroups{order_group_id}', headers=self.get_headers(), json=params))
 
     def delete_order_group(self, order_group_id):  # https://alor.dev/docs/api/http/commandapi-api-order-groups-order-group-id-delete
         """Удалить группу заявок
@@ -1033,7 +1210,7 @@ class AlorPy:
         :param str order_group_id: Идентификатор группы заявок
         :return: Снятие группы заявок с идентификатором, указанным в параметре orderGroupId. При снятии группы заявок также будут сняты все заявки, входившие в эту группу
         """
-        return self.check_result(delete(url=f'{self.api_server}/commandapi/api/orderGroups{order_group_id}', headers=self.get_headers()))
+        return self.check_result(self.session.delete(url=f'{self.api_server}/commandapi/api/orderGroups{order_group_id}', headers=self.get_headers()))
 
     # Другое
 
@@ -1041,7 +1218,7 @@ class AlorPy:
         """Текущее UTC время
         :return: Запрос возвращает текущее значение UTC времени в формате Unix Time Seconds
         """
-        return self.check_result(get(url=f'{self.api_server}/md/v2/time', headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/time', headers=self.get_headers()))
 
     # Устаревшее
 
@@ -1054,7 +1231,7 @@ class AlorPy:
         :return: Запрос информации о позиции по деньгам. Вызов существует для обратной совместимости с API v1, предпочтительно использовать другие вызовы (/summary, /risk, /positions)
         """
         params = {'format': format}
-        return self.check_result(get(url=f'{self.api_server}/md/v2/clients/legacy/{exchange}/{portfolio}/money', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/v2/clients/legacy/{exchange}/{portfolio}/money', params=params, headers=self.get_headers()))
 
     def get_trades_history(self, portfolio, exchange, symbol=None, date_from=None, side=None, id_from=None, limit=None, order_by_trade_date=None, descending=None, with_repo=None, format='Simple'):  # https://alor.dev/docs/api/http/trade-stats
         """Вся история сделок
@@ -1089,7 +1266,7 @@ class AlorPy:
             params['descending'] = descending
         if with_repo:
             params['withRepo'] = with_repo
-        return self.check_result(get(url=f'{self.api_server}/md/stats/{exchange}/{portfolio}/history/trades', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/stats/{exchange}/{portfolio}/history/trades', params=params, headers=self.get_headers()))
 
     def get_trades_symbol(self, portfolio, exchange, symbol, date_from=None, id_from=None, limit=None, order_by_trade_date=None, descending=None, with_repo=None, format='Simple'):  # https://alor.dev/docs/api/http/trade-stats-by-symbol
         """История сделок для выбранного инструмента
@@ -1119,7 +1296,7 @@ class AlorPy:
             params['descending'] = descending
         if with_repo:
             params['withRepo'] = with_repo
-        return self.check_result(get(url=f'{self.api_server}/md/stats/{exchange}/{portfolio}/history/trades/{symbol}', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/stats/{exchange}/{portfolio}/history/trades/{symbol}', params=params, headers=self.get_headers()))
 
     def get_exchange_market(self, exchange, market, format='Simple'):  # https://alor.dev/docs/api/http/dev-trading-session-status
         """Статус торгов
@@ -1130,7 +1307,7 @@ class AlorPy:
         :return: Возвращает информацию о статусе торгов для указанного рынка на выбранной бирже
         """
         params = {'format': format}
-        return self.check_result(get(url=f'{self.api_server}/md/status/{exchange}/{market}', params=params, headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/md/status/{exchange}/{market}', params=params, headers=self.get_headers()))
 
     def create_stop_loss_order(self, trade_server_code, account, portfolio, exchange, symbol, side, quantity, trigger_price, comment=None, order_end_unix_time=0):  # https://alor.dev/docs/api/http/v-2-client-orders-actions-stop-loss
         """Создать стоп-лосс заявку
@@ -1153,7 +1330,7 @@ class AlorPy:
                   'User': {'Account': account, 'Portfolio': portfolio}, 'OrderEndUnixTime': order_end_unix_time}
         if comment:
             params['comment'] = comment
-        return self.check_result(post(url=f'{self.api_server}/warptrans/{trade_server_code}/v2/client/orders/actions/stopLoss', headers=headers, json=params))
+        return self.check_result(self.session.post(url=f'{self.api_server}/warptrans/{trade_server_code}/v2/client/orders/actions/stopLoss', headers=headers, json=params))
 
     def create_take_profit_order(self, trade_server_code, account, portfolio, exchange, symbol, side, quantity, trigger_price, comment=None, order_end_unix_time=0):  # https://alor.dev/docs/api/http/v-2-client-orders-actions-take-profit
         """Создать стоп-заявку
@@ -1176,7 +1353,7 @@ class AlorPy:
                   'User': {'Account': account, 'Portfolio': portfolio}, 'OrderEndUnixTime': order_end_unix_time}
         if comment:
             params['comment'] = comment
-        return self.check_result(post(url=f'{self.api_server}/warptrans/{trade_server_code}/v2/client/orders/actions/takeProfit', headers=headers, json=params))
+        return self.check_result(self.session.post(url=f'{self.api_server}/warptrans/{trade_server_code}/v2/client/orders/actions/takeProfit', headers=headers, json=params))
 
     def create_take_profit_limit_order(self, trade_server_code, account, portfolio, exchange, symbol, side, quantity, trigger_price, price,
                                        comment=None, order_end_unix_time=0, time_in_force=None, iceberg_fixed=None, iceberg_variance=None):  # https://alor.dev/docs/api/http/v-2-client-orders-actions-take-profit-limit
@@ -1210,7 +1387,7 @@ class AlorPy:
             params['icebergFixed'] = iceberg_fixed
         if iceberg_variance:
             params['icebergVariance'] = iceberg_variance
-        return self.check_result(post(url=f'{self.api_server}/warptrans/{trade_server_code}/v2/client/orders/actions/takeProfitLimit', headers=headers, json=params))
+        return self.check_result(self.session.post(url=f'{self.api_server}/warptrans/{trade_server_code}/v2/client/orders/actions/takeProfitLimit', headers=headers, json=params))
 
     def create_stop_loss_limit_order(self, trade_server_code, account, portfolio, exchange, symbol, side, quantity, trigger_price, price,
                                      comment=None, order_end_unix_time=0, time_in_force=None, iceberg_fixed=None, iceberg_variance=None):  # https://alor.dev/docs/api/http/v-2-client-orders-actions-stop-loss-limit
@@ -1244,7 +1421,7 @@ class AlorPy:
             params['icebergFixed'] = iceberg_fixed
         if iceberg_variance:
             params['icebergVariance'] = iceberg_variance
-        return self.check_result(post(url=f'{self.api_server}/warptrans/{trade_server_code}/v2/client/orders/actions/stopLossLimit', headers=headers, json=params))
+        return self.check_result(self.session.post(url=f'{self.api_server}/warptrans/{trade_server_code}/v2/client/orders/actions/stopLossLimit', headers=headers, json=params))
 
     def edit_stop_loss_order(self, trade_server_code, account, portfolio, exchange, order_id, symbol, side, quantity, trigger_price, comment=None, order_end_unix_time=0):  # https://alor.dev/docs/api/http/v-2-client-orders-actions-stop-loss-order-id
         """Изменить стоп-лосс заявку
@@ -1268,7 +1445,7 @@ class AlorPy:
                   'User': {'Account': account, 'Portfolio': portfolio}, 'OrderEndUnixTime': order_end_unix_time}
         if comment:
             params['comment'] = comment
-        return self.check_result(put(url=f'{self.api_server}/warptrans/{trade_server_code}/v2/client/orders/actions/stopLoss/{order_id}', headers=headers, json=params))
+        return self.check_result(self.session.put(url=f'{self.api_server}/warptrans/{trade_server_code}/v2/client/orders/actions/stopLoss/{order_id}', headers=headers, json=params))
 
     def edit_take_profit_order(self, trade_server_code, account, portfolio, exchange, order_id, symbol, side, quantity, trigger_price, comment=None, order_end_unix_time=0):
         """Изменить стоп-заявку
@@ -1292,7 +1469,7 @@ class AlorPy:
                   'User': {'Account': account, 'Portfolio': portfolio}, 'OrderEndUnixTime': order_end_unix_time}
         if comment:
             params['comment'] = comment
-        return self.check_result(put(url=f'{self.api_server}/warptrans/{trade_server_code}/v2/client/orders/actions/takeProfit/{order_id}', headers=headers, json=params))
+        return self.check_result(self.session.put(url=f'{self.api_server}/warptrans/{trade_server_code}/v2/client/orders/actions/takeProfit/{order_id}', headers=headers, json=params))
 
     def edit_take_profit_limit_order(self, trade_server_code, account, portfolio, exchange, order_id, symbol, side, quantity, trigger_price, price,
                                      comment=None, order_end_unix_time=0, time_in_force=None, iceberg_fixed=None, iceberg_variance=None):  # https://alor.dev/docs/api/http/v-2-client-orders-actions-take-profit-limit-order-id
@@ -1327,7 +1504,7 @@ class AlorPy:
             params['icebergFixed'] = iceberg_fixed
         if iceberg_variance:
             params['icebergVariance'] = iceberg_variance
-        return self.check_result(put(url=f'{self.api_server}/warptrans/{trade_server_code}/v2/client/orders/actions/takeProfitLimit/{order_id}', headers=headers, json=params))
+        return self.check_result(self.session.put(url=f'{self.api_server}/warptrans/{trade_server_code}/v2/client/orders/actions/takeProfitLimit/{order_id}', headers=headers, json=params))
 
     def edit_stop_loss_limit_order(self, trade_server_code, account, portfolio, exchange, order_id, symbol, side, quantity, trigger_price, price,
                                    comment=None, order_end_unix_time=0, time_in_force=None, iceberg_fixed=None, iceberg_variance=None):  # https://alor.dev/docs/api/http/v-2-client-orders-actions-stop-loss-limit-order-id
@@ -1362,7 +1539,7 @@ class AlorPy:
             params['icebergFixed'] = iceberg_fixed
         if iceberg_variance:
             params['icebergVariance'] = iceberg_variance
-        return self.check_result(put(url=f'{self.api_server}/warptrans/{trade_server_code}/v2/client/orders/actions/stopLossLimit/{order_id}', headers=headers, json=params))
+        return self.check_result(self.session.put(url=f'{self.api_server}/warptrans/{trade_server_code}/v2/client/orders/actions/stopLossLimit/{order_id}', headers=headers, json=params))
 
     def delete_stop_order(self, trade_server_code, portfolio, order_id, stop=True):  # https://alor.dev/docs/api/http/v-2-client-orders-actions-order-id
         """Снять стоп-заявку
@@ -1376,28 +1553,29 @@ class AlorPy:
         headers = self.get_headers()
         headers['X-REQID'] = self.get_request_id()  # Уникальный идентификатор запроса
         params = {'portfolio': portfolio, 'stop': stop}
-        return self.check_result(delete(url=f'{self.api_server}/warptrans/{trade_server_code}/v2/client/orders/{order_id}', headers=headers, params=params))
+        return self.check_result(self.session.delete(url=f'{self.api_server}/warptrans/{trade_server_code}/v2/client/orders/{order_id}', headers=headers, params=params))
 
     def get_portfolios(self, user_name):
         """Получение списка серверов портфелей
 
         :param str user_name: Номер счета
         """
-        return self.check_result(get(url=f'{self.api_server}/client/v1.0/users/{user_name}/portfolios', headers=self.get_headers()))
+        return self.check_result(self.session.get(url=f'{self.api_server}/client/v1.0/users/{user_name}/portfolios', headers=self.get_headers()))
 
-    def stop_orders_get_and_subscribe(self, portfolio, exchange) -> str:
+    def stop_orders_get_and_subscribe(self, portfolio, exchange, callback=None) -> str:
         """Подписка на информацию о текущих стоп-заявках на рынке для выбранных биржи и финансового инструмента
 
         :param str portfolio: Идентификатор клиентского портфеля
         :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
-        :return: Уникальный идентификатор подписки
+        :param callback: Функция, получающая данные только этой подписки. Если не задана, то вызывается общее событие on_stop_order
+        :return: Подписка. Уникальный идентификатор подписки с отменой unsubscribe()
         """
         request = {'opcode': 'StopOrdersGetAndSubscribe', 'exchange': exchange, 'portfolio': portfolio, 'format': 'Simple'}  # Запрос на подписку
-        return self.subscribe(request)  # Отправляем запрос, возвращаем уникальный идентификатор подписки
+        return self.subscribe(request, callback)  # Отправляем запрос, возвращаем подписку
 
     # WebSocket API - Управление подписками
 
-    def order_book_get_and_subscribe(self, exchange, symbol, instrument_group=None, depth=20, frequency=0, format='Simple'):  # https://alor.dev/docs/api/websocket/data-subscriptions/OrderBookGetAndSubscribe
+    def order_book_get_and_subscribe(self, exchange, symbol, instrument_group=None, depth=20, frequency=0, format='Simple', result_type='dict', callback=None, conflate=False):  # https://alor.dev/docs/api/websocket/data-subscriptions/OrderBookGetAndSubscribe
         """Биржевой стакан
 
         :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
@@ -1406,14 +1584,22 @@ class AlorPy:
         :param int depth: Глубина стакана. Стандартное значение — 20 (20x20), максимальное — 50 (50х50)
         :param int frequency: Максимальная частота отдачи данных сервером в миллисекундах
         :param str format: Формат возвращаемого сервером JSON-объекта: 'Simple', 'Slim', 'Heavy'
-        :return: Уникальный идентификатор подписки
+        :param str result_type: Тип данных подписки: 'dict' - справочник из JSON, 'record' - компактная запись OrderBookSnapshot (только для формата 'Simple')
+        :param callback: Функция, получающая данные только этой подписки. Если не задана, то вызывается общее событие on_change_order_book
+        :param bool conflate: Обрабатывать только последние данные. Если обработчик не успевает, то ждущие данные заменяются новыми. Кол-во пропущенных данных передается в ключе skipped. Только с потоками обработки dispatch_workers > 0
+        :return: Подписка. Уникальный идентификатор подписки с отменой unsubscribe()
         """
         request = {'opcode': 'OrderBookGetAndSubscribe', 'exchange': exchange, 'code': symbol, 'depth': depth, 'frequency': frequency, 'format': format}  # Запрос на подписку
         if instrument_group:
             request['instrumentGroup'] = instrument_group
-        return self.subscribe(request)  # Отправляем запрос, возвращаем уникальный идентификатор подписки
-
-    def bars_get_and_subscribe(self, exchange, symbol, tf, instrument_group=None, seconds_from=0, skip_history=False, split_adjust=None, frequency=0, format='Simple'):  # https://alor.dev/docs/api/websocket/data-subscriptions/BarsGetAndSubscribe
+        if self.check_result_type(result_type, format):  # Если данные подписки нужны в компактных записях
+            request['result_type'] = result_type  # Данные подписки будем переводить в компактные записи
+        if conflate:
+            self.check_conflate()  # Без очереди обработки заменять нечего
+            request['conflate'] = conflate  # Будем обрабатывать только последние данные подписки
+        return self.subscribe(request, callback)  # Отправляем запрос, возвращаем подписку
+
+    def bars_get_and_subscribe(self, exchange, symbol, tf, instrument_group=None, seconds_from=0, skip_history=False, split_adjust=None, frequency=0, format='Simple', result_type='dict', callback=None, close_by_timer=False):  # https://alor.dev/docs/api/websocket/data-subscriptions/BarsGetAndSubscribe
         """История цен (свечи)
 
         :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
@@ -1425,16 +1611,23 @@ class AlorPy:
         :param bool split_adjust: Флаг коррекции исторических свечей инструмента с учётом сплитов, консолидаций и прочих факторов
         :param int frequency: Максимальная частота отдачи данных сервером в миллисекундах
         :param str format: Формат возвращаемого сервером JSON-объекта: 'Simple', 'Slim', 'Heavy'
-        :return: Уникальный идентификатор подписки
+        :param str result_type: Тип данных подписки: 'dict' - справочник из JSON, 'record' - компактная запись Bar (только для формата 'Simple')
+        :param callback: Функция, получающая завершенные бары только этой подписки. Если не задана, то вызывается общее событие on_new_bar
+        :param bool close_by_timer: Завершать бар по таймеру по окончании его интервала по времени сервера, не дожидаясь первых данных следующего бара. Для интервалов в секундах
+        :return: Подписка. Уникальный идентификатор подписки с отменой unsubscribe()
         """
         request = {'opcode': 'BarsGetAndSubscribe', 'exchange': exchange, 'code': symbol, 'tf': tf, 'from': int(seconds_from), 'skipHistory': skip_history, 'frequency': frequency, 'format': format}  # Запрос на подписку
         if instrument_group:
             request['instrumentGroup'] = instrument_group
         if split_adjust:
             request['splitAdjust'] = split_adjust
-        return self.subscribe(request)  # Отправляем запрос, возвращаем уникальный идентификатор подписки
+        if self.check_result_type(result_type, format):  # Если данные подписки нужны в компактных записях
+            request['result_type'] = result_type  # Данные подписки будем переводить в компактные записи
+        if close_by_timer and isinstance(tf, int):  # Таймер работает только с интервалами в секундах
+            request['close_by_timer'] = close_by_timer  # Бары будем завершать по таймеру
+        return self.subscribe(request, callback)  # Отправляем запрос, возвращаем подписку
 
-    def quotes_subscribe(self, exchange, symbol, instrument_group=None, frequency=0, format='Simple'):  # https://alor.dev/docs/api/websocket/data-subscriptions/QuotesSubscribe
+    def quotes_subscribe(self, exchange, symbol, instrument_group=None, frequency=0, format='Simple', result_type='dict', callback=None, conflate=False):  # https://alor.dev/docs/api/websocket/data-subscriptions/QuotesSubscribe
         """Котировки
 
         :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
@@ -1442,14 +1635,22 @@ class AlorPy:
         :param str instrument_group: Код режима торгов
         :param int frequency: Максимальная частота отдачи данных сервером в миллисекундах
         :param str format: Формат возвращаемого сервером JSON-объекта: 'Simple', 'Slim', 'Heavy'
-        :return: Уникальный идентификатор подписки
+        :param str result_type: Тип данных подписки: 'dict' - справочник из JSON, 'record' - компактная запись Quote (только для формата 'Simple')
+        :param callback: Функция, получающая данные только этой подписки. Если не задана, то вызывается общее событие on_new_quotes
+        :param bool conflate: Обрабатывать только последние данные. Если обработчик не успевает, то ждущие данные заменяются новыми. Кол-во пропущенных данных передается в ключе skipped. Только с потоками обработки dispatch_workers > 0
+        :return: Подписка. Уникальный идентификатор подписки с отменой unsubscribe()
         """
         request = {'opcode': 'QuotesSubscribe', 'exchange': exchange, 'code': symbol, 'frequency': frequency, 'format': format}  # Запрос на подписку
         if instrument_group:
             request['instrumentGroup'] = instrument_group
-        return self.subscribe(request)  # Отправляем запрос, возвращаем уникальный идентификатор подписки
-
-    def trades_get_and_subscribe_v2(self, portfolio, exchange, instrument_group=None, skip_history=False, format='Simple'):  # https://alor.dev/docs/api/websocket/data-subscriptions/TradesGetAndSubscribe
+        if self.check_result_type(result_type, format):  # Если данные подписки нужны в компактных записях
+            request['result_type'] = result_type  # Данные подписки будем переводить в компактные записи
+        if conflate:
+            self.check_conflate()  # Без очереди обработки заменять нечего
+            request['conflate'] = conflate  # Будем обрабатывать только последние данные подписки
+        return self.subscribe(request, callback)  # Отправляем запрос, возвращаем подписку
+
+    def trades_get_and_subscribe_v2(self, portfolio, exchange, instrument_group=None, skip_history=False, format='Simple', callback=None):  # https://alor.dev/docs/api/websocket/data-subscriptions/TradesGetAndSubscribe
         """Все сделки по портфелю
 
         :param str portfolio: Идентификатор клиентского портфеля
@@ -1457,14 +1658,15 @@ class AlorPy:
         :param str instrument_group: Код режима торгов
         :param bool skip_history: Флаг отсеивания исторических данных: True — отображать только новые данные, False — отображать в том числе данные из истории
         :param str format: Формат возвращаемого сервером JSON-объекта: 'Simple', 'Slim', 'Heavy'
-        :return: Уникальный идентификатор подписки
+        :param callback: Функция, получающая данные только этой подписки. Если не задана, то вызывается общее событие on_trade
+        :return: Подписка. Уникальный идентификатор подписки с отменой unsubscribe()
         """
         request = {'opcode': 'TradesGetAndSubscribeV2', 'exchange': exchange, 'portfolio': portfolio, 'skipHistory': skip_history, 'format': format}  # Запрос на подписку
         if instrument_group:
             request['instrumentGroup'] = instrument_group
-        return self.subscribe(request)  # Отправляем запрос, возвращаем уникальный идентификатор подписки
+        return self.subscribe(request, callback)  # Отправляем запрос, возвращаем подписку
 
-    def all_trades_subscribe(self, exchange, symbol, instrument_group=None, depth=0, include_virtual_trades=False, format='Simple'):  # https://alor.dev/docs/api/websocket/data-subscriptions/AllTradesGetAndSubscribe
+    def all_trades_subscribe(self, exchange, symbol, instrument_group=None, depth=0, include_virtual_trades=False, format='Simple', result_type='dict', callback=None):  # https://alor.dev/docs/api/websocket/data-subscriptions/AllTradesGetAndSubscribe
         """Все сделки по инструменту
 
         :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
@@ -1473,14 +1675,18 @@ class AlorPy:
         :param int depth: Если указать, то перед актуальными данными придут данные о последних N сделках. Максимум 5000
         :param bool include_virtual_trades: Указывает, нужно ли отправлять виртуальные (индикативные) сделки
         :param str format: Формат возвращаемого сервером JSON-объекта: 'Simple', 'Slim', 'Heavy'
-        :return: Уникальный идентификатор подписки
+        :param str result_type: Тип данных подписки: 'dict' - справочник из JSON, 'record' - компактная запись Trade (только для формата 'Simple')
+        :param callback: Функция, получающая данные только этой подписки. Если не задана, то вызывается общее событие on_all_trades
+        :return: Подписка. Уникальный идентификатор подписки с отменой unsubscribe()
         """
         request = {'opcode': 'AllTradesGetAndSubscribe', 'code': symbol, 'exchange': exchange, 'depth': depth, 'includeVirtualTrades': include_virtual_trades, 'format': format}  # Запрос на подписку
         if instrument_group:
             request['instrumentGroup'] = instrument_group
-        return self.subscribe(request)  # Отправляем запрос, возвращаем уникальный идентификатор подписки
+        if self.check_result_type(result_type, format):  # Если данные подписки нужны в компактных записях
+            request['result_type'] = result_type  # Данные подписки будем переводить в компактные записи
+        return self.subscribe(request, callback)  # Отправляем запрос, возвращаем подписку
 
-    def positions_get_and_subscribe_v2(self, portfolio, exchange, instrument_group=None, skip_history=False, format='Simple'):  # https://alor.dev/docs/api/websocket/data-subscriptions/PositionsGetAndSubscribe
+    def positions_get_and_subscribe_v2(self, portfolio, exchange, instrument_group=None, skip_history=False, format='Simple', callback=None):  # https://alor.dev/docs/api/websocket/data-subscriptions/PositionsGetAndSubscribe
         """Текущие позиции по торговым инструментам и деньгам
 
         :param str portfolio: Идентификатор клиентского портфеля
@@ -1488,14 +1694,15 @@ class AlorPy:
         :param str instrument_group: Код режима торгов
         :param bool skip_history: Флаг отсеивания исторических данных: True — отображать только новые данные, False — отображать в том числе данные из истории
         :param str format: Формат возвращаемого сервером JSON-объекта: 'Simple', 'Slim', 'Heavy'
-        :return: Уникальный идентификатор подписки
+        :param callback: Функция, получающая данные только этой подписки. Если не задана, то вызывается общее событие on_position
+        :return: Подписка. Уникальный идентификатор подписки с отменой unsubscribe()
         """
         request = {'opcode': 'PositionsGetAndSubscribeV2', 'exchange': exchange, 'portfolio': portfolio, 'skipHistory': skip_history, 'format': format}  # Запрос на подписку
         if instrument_group:
             request['instrumentGroup'] = instrument_group
-        return self.subscribe(request)  # Отправляем запрос, возвращаем уникальный идентификатор подписки
+        return self.subscribe(request, callback)  # Отправляем запрос, возвращаем подписку
 
-    def summaries_get_and_subscribe_v2(self, portfolio, exchange, instrument_group=None, skip_history=False, format='Simple'):  # https://alor.dev/docs/api/websocket/data-subscriptions/SummariesGetAndSubscribeV2
+    def summaries_get_and_subscribe_v2(self, portfolio, exchange, instrument_group=None, skip_history=False, format='Simple', callback=None):  # https://alor.dev/docs/api/websocket/data-subscriptions/SummariesGetAndSubscribeV2
         """Сводная информация о портфеле
 
         :param str portfolio: Идентификатор клиентского портфеля
@@ -1503,14 +1710,15 @@ class AlorPy:
         :param str instrument_group: Код режима торгов
         :param bool skip_history: Флаг отсеивания исторических данных: True — отображать только новые данные, False — отображать в том числе данные из истории
         :param str format: Формат возвращаемого сервером JSON-объекта: 'Simple', 'Slim', 'Heavy'
-        :return: Уникальный идентификатор подписки
+        :param callback: Функция, получающая данные только этой подписки. Если не задана, то вызывается общее событие on_summary
+        :return: Подписка. Уникальный идентификатор подписки с отменой unsubscribe()
         """
         request = {'opcode': 'SummariesGetAndSubscribeV2', 'exchange': exchange, 'portfolio': portfolio, 'skipHistory': skip_history, 'format': format}  # Запрос на подписку
         if instrument_group:
             request['instrumentGroup'] = instrument_group
-        return self.subscribe(request)  # Отправляем запрос, возвращаем уникальный идентификатор подписки
+        return self.subscribe(request, callback)  # Отправляем запрос, возвращаем подписку
 
-    def risks_get_and_subscribe(self, portfolio, exchange, instrument_group=None, skip_history=False, format='Simple'):  # https://alor.dev/docs/api/websocket/data-subscriptions/RisksGetAndSubscribe
+    def risks_get_and_subscribe(self, portfolio, exchange, instrument_group=None, skip_history=False, format='Simple', callback=None):  # https://alor.dev/docs/api/websocket/data-subscriptions/RisksGetAndSubscribe
         """Портфельные риски
 
         :param str portfolio: Идентификатор клиентского портфеля
@@ -1518,14 +1726,15 @@ class AlorPy:
         :param str instrument_group: Код режима торгов
         :param bool skip_history: Флаг отсеивания исторических данных: True — отображать только новые данные, False — отображать в том числе данные из истории
         :param str format: Формат возвращаемого сервером JSON-объекта: 'Simple', 'Slim', 'Heavy'
-        :return: Уникальный идентификатор подписки
+        :param callback: Функция, получающая данные только этой подписки. Если не задана, то вызывается общее событие on_risk
+        :return: Подписка. Уникальный идентификатор подписки с отменой unsubscribe()
         """
         request = {'opcode': 'RisksGetAndSubscribe', 'exchange': exchange, 'portfolio': portfolio, 'skipHistory': skip_history, 'format': format}  # Запрос на подписку
         if instrument_group:
             request['instrumentGroup'] = instrument_group
-        return self.subscribe(request)  # Отправляем запрос, возвращаем уникальный идентификатор подписки
+        return self.subscribe(request, callback)  # Отправляем запрос, возвращаем подписку
 
-    def spectra_risks_get_and_subscribe(self, portfolio, exchange, instrument_group=None, skip_history=False, format='Simple'):  # https://alor.dev/docs/api/websocket/data-subscriptions/SpectraRisksGetAndSubscribe
+    def spectra_risks_get_and_subscribe(self, portfolio, exchange, instrument_group=None, skip_history=False, format='Simple', callback=None):  # https://alor.dev/docs/api/websocket/data-subscriptions/SpectraRisksGetAndSubscribe
         """Риски срочного рынка (FORTS)
 
         :param str portfolio: Идентификатор клиентского портфеля
@@ -1533,28 +1742,30 @@ class AlorPy:
         :param str instrument_group: Код режима торгов
         :param bool skip_history: Флаг отсеивания исторических данных: True — отображать только новые данные, False — отображать в том числе данные из истории
         :param str format: Формат возвращаемого сервером JSON-объекта: 'Simple', 'Slim', 'Heavy'
-        :return: Уникальный идентификатор подписки
+        :param callback: Функция, получающая данные только этой подписки. Если не задана, то вызывается общее событие on_spectra_risk
+        :return: Подписка. Уникальный идентификатор подписки с отменой unsubscribe()
         """
         request = {'opcode': 'SpectraRisksGetAndSubscribe', 'exchange': exchange, 'portfolio': portfolio, 'skipHistory': skip_history, 'format': format}  # Запрос на подписку
         if instrument_group:
             request['instrumentGroup'] = instrument_group
-        return self.subscribe(request)  # Отправляем запрос, возвращаем уникальный идентификатор подписки
+        return self.subscribe(request, callback)  # Отправляем запрос, возвращаем подписку
 
-    def instruments_get_and_subscribe_v2(self, exchange, symbol, instrument_group=None, format='Simple'):  # https://alor.dev/docs/api/websocket/data-subscriptions/InstrumentsGetAndSubscribeV2
+    def instruments_get_and_subscribe_v2(self, exchange, symbol, instrument_group=None, format='Simple', callback=None):  # https://alor.dev/docs/api/websocket/data-subscriptions/InstrumentsGetAndSubscribeV2
         """Изменения информации о финансовых инструментах
 
         :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
         :param str symbol: Тикер
         :param str instrument_group: Код режима торгов
         :param str format: Формат возвращаемого сервером JSON-объекта: 'Simple', 'Slim', 'Heavy'
-        :return: Уникальный идентификатор подписки
+        :param callback: Функция, получающая данные только этой подписки. Если не задана, то вызывается общее событие on_symbol
+        :return: Подписка. Уникальный идентификатор подписки с отменой unsubscribe()
         """
         request = {'opcode': 'InstrumentsGetAndSubscribeV2', 'code': symbol, 'exchange': exchange, 'format': format}  # Запрос на подписку
         if instrument_group:
             request['instrumentGroup'] = instrument_group
-        return self.subscribe(request)  # Отправляем запрос, возвращаем уникальный идентификатор подписки
+        return self.subscribe(request, callback)  # Отправляем запрос, возвращаем подписку
 
-    def orders_get_and_subscribe_v2(self, portfolio, exchange, instrument_group=None, order_statuses=None, skip_history=False, format='Simple'):  # https://alor.dev/docs/api/websocket/data-subscriptions/OrdersGetAndSubscribe
+    def orders_get_and_subscribe_v2(self, portfolio, exchange, instrument_group=None, order_statuses=None, skip_history=False, format='Simple', callback=None):  # https://alor.dev/docs/api/websocket/data-subscriptions/OrdersGetAndSubscribe
         """Все заявки по портфелю
 
         :param str portfolio: Идентификатор клиентского портфеля
@@ -1564,16 +1775,17 @@ class AlorPy:
         Влияет только на фильтрацию первичных исторических данных при подписке  Пример: order_statuses=['filled', 'canceled']
         :param bool skip_history: Флаг отсеивания исторических данных: True — отображать только новые данные, False — отображать в том числе данные из истории
         :param str format: Формат возвращаемого сервером JSON-объекта: 'Simple', 'Slim', 'Heavy'
-        :return: Уникальный идентификатор подписки
+        :param callback: Функция, получающая данные только этой подписки. Если не задана, то вызывается общее событие on_order
+        :return: Подписка. Уникальный идентификатор подписки с отменой unsubscribe()
         """
         request: dict[str, Any] = {'opcode': 'OrdersGetAndSubscribeV2', 'exchange': exchange, 'portfolio': portfolio, 'skipHistory': skip_history, 'format': format}  # Запрос на подписку
         if instrument_group:
             request['instrumentGroup'] = instrument_group
         if order_statuses:
             request['orderStatuses'] = order_statuses
-        return self.subscribe(request)  # Отправляем запрос, возвращаем уникальный идентификатор подписки
+        return self.subscribe(request, callback)  # Отправляем запрос, возвращаем подписку
 
-    def stop_orders_get_and_subscribe_v2(self, portfolio, exchange, instrument_group=None, order_statuses=None, skip_history=False, format='Simple'):  # https://alor.dev/docs/api/websocket/data-subscriptions/StopOrdersGetAndSubscribeV2
+    def stop_orders_get_and_subscribe_v2(self, portfolio, exchange, instrument_group=None, order_statuses=None, skip_history=False, format='Simple', callback=None):  # https://alor.dev/docs/api/websocket/data-subscriptions/StopOrdersGetAndSubscribeV2
         """Все стоп-заявки по портфелю
 
         :param str portfolio: Идентификатор клиентского портфеля
@@ -1583,25 +1795,151 @@ class AlorPy:
         Влияет только на фильтрацию первичных исторических данных при подписке  Пример: order_statuses=['filled', 'canceled']
         :param bool skip_history: Флаг отсеивания исторических данных: True — отображать только новые данные, False — отображать в том числе данные из истории
         :param str format: Формат возвращаемого сервером JSON-объекта: 'Simple', 'Slim', 'Heavy'
-        :return: Уникальный идентификатор подписки
+        :param callback: Функция, получающая данные только этой подписки. Если не задана, то вызывается общее событие on_stop_order_v2
+        :return: Подписка. Уникальный идентификатор подписки с отменой unsubscribe()
         """
         request: dict[str, Any] = {'opcode': 'StopOrdersGetAndSubscribeV2', 'exchange': exchange, 'portfolio': portfolio, 'skipHistory': skip_history, 'format': format}  # Запрос на подписку
         if instrument_group:
             request['instrumentGroup'] = instrument_group
         if order_statuses:
             request['orderStatuses'] = order_statuses
-        return self.subscribe(request)  # Отправляем запрос, возвращаем уникальный идентификатор подписки
+        return self.subscribe(request, callback)  # Отправляем запрос, возвращаем подписку
 
     def unsubscribe(self, guid):  # https://alor.dev/docs/api/websocket/data-subscriptions/Unsubscribe
-        """Отмена существующей подписки
+        """Отмена существующей подписки. Повторная отмена ничего не делает. Без подключения к серверу удаляется только сама подписка, и она не возобновится при переподключении
 
         :param str guid: Уникальный идентификатор подписки
-        :return: Уникальный идентификатор подписки
+        :return: Уникальный идентификатор подписки. None, если подписка не найдена
+        """
+        request = self.subscriptions.pop(guid, None)  # Удаляем подписку из справочника
+        if request is None:  # Если подписка уже отменена
+            return None  # то выходим, дальше не продолжаем
+        self.handlers.pop(guid, None)  # Удаляем обработчик подписки
+        self.conflated.discard(guid)
+        ws_socket = self.ws_sockets[request.get('shard', 0)]  # Подключение подписки
+        if ws_socket is None:  # Если подключение переподключается
+            return guid  # то отменять на сервере нечего. Новое подключение подписку не возобновит
+        try:
+            ws_socket.send(self.codec.dumps({'opcode': 'unsubscribe', 'token': str(self.get_jwt_token()), 'guid': guid}))  # Отправляем запрос на отмену подписки в подключение подписки
+        except ConnectionClosed:  # Если подключение закрылось во время отправки
+            pass  # то подписка на сервере закрылась вместе с ним
+        return guid
+
+    # WebSocket API - Потоки подписок
+
+    def check_conflate(self):
+        """Проверка, что данные подписок обрабатываются через очередь. Иначе обработка только последних данных невозможна"""
+        if not self.dispatch_workers:  # Если данные подписок обрабатываются в потоке (задаче) чтения WebSocket
+            raise ValueError('Параметр conflate работает только с потоками обработки подписок. Укажите dispatch_workers > 0')
+
+    def stream(self, subscribe, *args, maxsize=0, **kwargs):
+        """Поток данных подписки. Подписка оформляется при получении первых данных и отменяется при закрытии потока
+
+        :param subscribe: Функция подписки с параметром callback. Например, quotes_subscribe
+        :param args: Параметры функции подписки
+        :param int maxsize: Максимальное кол-во неполученных данных в буфере подписки. При переполнении самые старые данные удаляются. 0 - без ограничения
+        :param kwargs: Именованные параметры функции подписки
+        :return: Генератор данных подписки
+        """
+        buffer = Queue(maxsize)  # Буфер данных подписки
+
+        def put(response):
+            while True:  # Поток обработки подписок нельзя блокировать ожиданием медленного получателя
+                try:
+                    buffer.put_nowait(response)
+                    return
+                except Full:  # Если буфер заполнен
+                    try:
+                        buffer.get_nowait()  # то удаляем самые старые данные
+                    except Empty:  # Буфер успел освободиться
+                        pass
+
+        subscription = subscribe(*args, callback=put, **kwargs)  # Данные подписки получает только буфер
+        try:
+            while True:
+                yield buffer.get()  # Ждем и отдаем данные подписки
+        finally:  # При закрытии потока
+            if self.ws_running and subscription in self.subscriptions:  # Если подписка еще действует
+                subscription.unsubscribe()  # то отменяем ее
+
+    def stream_quotes(self, exchange, symbol, **kwargs):
+        """Поток котировок. Параметры как в quotes_subscribe"""
+        return self.stream(self.quotes_subscribe, exchange, symbol, **kwargs)
+
+    def stream_order_book(self, exchange, symbol, **kwargs):
+        """Поток биржевого стакана. Параметры как в order_book_get_and_subscribe"""
+        return self.stream(self.order_book_get_and_subscribe, exchange, symbol, **kwargs)
+
+    def stream_bars(self, exchange, symbol, tf, **kwargs):
+        """Поток завершенных баров. Параметры как в bars_get_and_subscribe"""
+        return self.stream(self.bars_get_and_subscribe, exchange, symbol, tf, **kwargs)
+
+    def stream_all_trades(self, exchange, symbol, **kwargs):
+        """Поток всех сделок по инструменту. Параметры как в all_trades_subscribe"""
+        return self.stream(self.all_trades_subscribe, exchange, symbol, **kwargs)
+
+    def stream_orders(self, portfolio, exchange, **kwargs):
+        """Поток заявок. Параметры как в orders_get_and_subscribe_v2"""
+        return self.stream(self.orders_get_and_subscribe_v2, portfolio, exchange, **kwargs)
+
+    def stream_trades(self, portfolio, exchange, **kwargs):
+        """Поток сделок по портфелю. Параметры как в trades_get_and_subscribe_v2"""
+        return self.stream(self.trades_get_and_subscribe_v2, portfolio, exchange, **kwargs)
+
+    def stream_positions(self, portfolio, exchange, **kwargs):
+        """Поток позиций. Параметры как в positions_get_and_subscribe_v2"""
+        return self.stream(self.positions_get_and_subscribe_v2, portfolio, exchange, **kwargs)
+
+    def subscribe_order_book(self, exchange, symbol, levels=5, callback=None, **kwargs) -> OrderBook:
+        """Биржевой стакан, обновляемый подпиской
+
+        :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
+        :param str symbol: Тикер
+        :param int levels: Кол-во лучших уровней, изменение которых вызывает функцию callback
+        :param callback: Функция, вызываемая со стаканом при изменении лучших уровней
+        :param kwargs: Параметры order_book_get_and_subscribe. Формат только 'Simple'
+        :return: Стакан. Подписка в атрибуте subscription
         """
-        request = {'opcode': 'unsubscribe', 'token': str(self.get_jwt_token()), 'guid': guid}  # Запрос на отмену подписки
-        self.ws_socket.send(dumps(request))  # Отправляем запрос на сервер подписок и событий WebSocket
-        del self.subscriptions[guid]  # Удаляем подписку из справочника
-        return self.subscribe(request)  # Отправляем запрос, возвращаем уникальный идентификатор подписки
+        order_book = OrderBook(levels, callback)  # Стакан
+        order_book.subscription = self.order_book_get_and_subscribe(exchange, symbol, callback=order_book.on_response, **kwargs)  # Данные подписки получает только стакан
+        return order_book
+
+    def subscribe_bar_aggregator(self, exchange, symbol, series, callback=None, source='trades', **kwargs) -> BarAggregator:
+        """Сборка баров нескольких типов и размеров по одной подписке
+
+        :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
+        :param str symbol: Тикер
+        :param series: Типы и размеры баров. Например, (('time', 60), ('time', 300), ('volume', 1000), ('tick', 100), ('range', 0.5))
+        :param callback: Функция, вызываемая с завершенным баром в формате события on_new_bar. По умолчанию событие on_new_bar
+        :param str source: Источник: 'trades' - все сделки all_trades_subscribe, 'bars' - минутные бары bars_get_and_subscribe
+        :param kwargs: Параметры функции подписки. Формат только 'Simple'
+        :return: Сборщик баров. Подписка в атрибуте subscription
+        """
+        aggregator = BarAggregator(series, callback or self.on_new_bar.trigger)  # Сборщик баров
+        if source == 'bars':  # Если собираем бары из минутных баров
+            aggregator.subscription = self.bars_get_and_subscribe(exchange, symbol, 60, callback=aggregator.on_bar, **kwargs)
+        else:  # Если собираем бары из сделок
+            aggregator.subscription = self.all_trades_subscribe(exchange, symbol, callback=aggregator.on_trade, **kwargs)
+        return aggregator
+
+    def subscribe_tick_store(self, exchange, symbol, store=None, trades=True, quotes=True, capacity=100_000, **kwargs) -> TickStore:
+        """Хранилище сделок и котировок, заполняемое подписками. Нужен NumPy
+
+        :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
+        :param str symbol: Тикер
+        :param TickStore store: Хранилище. Для нескольких тикеров в одном хранилище. По умолчанию создается новое
+        :param bool trades: Подписаться на все сделки
+        :param bool quotes: Подписаться на котировки
+        :param int capacity: Максимальное кол-во сделок и котировок по тикеру для нового хранилища
+        :param kwargs: Параметры функций подписки. Формат только 'Simple'
+        :return: Хранилище. Подписки в атрибуте subscriptions
+        """
+        store = store or TickStore(capacity)  # Хранилище
+        if trades:  # Если нужны сделки
+            store.subscriptions.append(self.all_trades_subscribe(exchange, symbol, callback=partial(store.on_trade, exchange), **kwargs))
+        if quotes:  # Если нужны котировки
+            store.subscriptions.append(self.quotes_subscribe(exchange, symbol, callback=partial(store.on_quote, exchange), **kwargs))
+        return store
 
     # WebSocket API - Управление заявками
 
@@ -1958,161 +2296,582 @@ class AlorPy:
 
     def get_headers(self):
         """Получение хедеров для запросов"""
-        return {'Content-Type': 'application/json', 'Authorization': f'Bearer {self.get_jwt_token()}'}
+        self.get_jwt_token()  # Токен обновляется в отдельном потоке. Здесь получаем его, только если он не был выдан или просрочен
+        return dict(self.headers)  # Копия готовых хедеров, т.к. в нее могут добавить хедеры запроса
 
     @staticmethod
     def get_request_id():
         """Получение уникального кода запроса"""
         return f'{time_ns()}'  # Текущее время в наносекундах, прошедших с 01.01.1970 в UTC
 
-    def check_result(self, response):
+    @staticmethod
+    def check_result_type(result_type, format='Simple') -> bool:
+        """Проверка типа результата
+
+        :param str result_type: Тип результата: 'dict' - справочник из JSON, 'record' - компактные записи
+        :param str format: Формат возвращаемого сервером JSON-объекта. Компактные записи только для формата 'Simple'
+        :return: True, если результат нужно перевести в компактные записи
+        """
+        if result_type not in ('dict', 'record'):  # Если тип результата неизвестен
+            raise ValueError(f'Тип результата {result_type} не поддерживается. Укажите \'dict\' или \'record\'')
+        if result_type == 'record' and format != 'Simple':  # Компактные записи заполняются только из полей формата Simple
+            raise ValueError(f'Тип результата \'record\' работает только с форматом \'Simple\', а не {format}')
+        return result_type == 'record'
+
+    def check_result(self, response, convert=None):
         """Анализ результата запроса
 
         :param Response response: Результат запроса
-        :return: Справочник из JSON, текст, None в случае веб ошибки
+        :param convert: Функция перевода справочника из JSON в результат. Например, в компактные записи Bar.convert. None - не переводить
+        :return: Справочник из JSON (результат перевода), текст, None в случае веб ошибки. Исключение RateLimitError, если лимит запросов превышен после всех повторов, и задан raise_rate_limit
         """
         if response is None:  # Если ответ не пришел. Например, при таймауте
             self.logger.error('Ошибка запроса: Таймаут')  # Событие ошибки
             return None  # то возвращаем пустое значение
-        content = response.content.decode('utf-8')  # Результат запроса
+        content = response.content  # Результат запроса в байтах. В текст переводим только при необходимости
+        if response.status_code == 429:  # Если лимит запросов был превышен и после всех повторов
+            self.logger.error(f'Ошибка запроса: Превышен лимит запросов Запрос: {response.request.path_url}')  # Событие ошибки
+            if self.raise_rate_limit:  # Если превышение лимита нужно отличать от пустого результата
+                raise RateLimitError(response.request.path_url)  # то вызываем исключение. Запрос можно повторить позже
+            return None  # Иначе, возвращаем пустое значение
         if response.status_code != 200:  # Если статус ошибки
-            self.logger.error(f'Ошибка запроса: {response.status_code} Запрос: {response.request.path_url} Ответ: {content}')  # Событие ошибки
+            self.logger.error(f'Ошибка запроса: {response.status_code} Запрос: {response.request.path_url} Ответ: {content.decode("utf-8", "replace")}')  # Событие ошибки
             return None  # то возвращаем пустое значение
-        self.logger.debug(f'Запрос : {response.request.path_url}')
-        self.logger.debug(f'Ответ  : {content}')
+        if self.logger.isEnabledFor(logging.DEBUG):  # Ответ переводим в текст только для отладки
+            self.logger.debug(f'Запрос : {response.request.path_url}')
+            self.logger.debug(f'Ответ  : {content.decode("utf-8", "replace")}')
         try:
-            return loads(content)  # Декодируем JSON в справочник, возвращаем его. Ошибки также могут приходить в виде JSON
-        except JSONDecodeError:  # Если произошла ошибка при декодировании JSON, например, при удалении заявок
-            return content  # то возвращаем значение в виде текста
+            result = self.codec.loads(content)  # Декодируем JSON из байт в справочник. Ошибки также могут приходить в виде JSON
+        except self.codec.decode_errors:  # Если произошла ошибка при декодировании JSON, например, при удалении заявок
+            return content.decode('utf-8')  # то возвращаем значение в виде текста
+        return result if convert is None else convert(result)  # Если задан перевод, то переводим справочник в результат
+
+    # Пакетные запросы REST
+
+    def batch(self, calls) -> list:
+        """Параллельное выполнение запросов в пуле потоков
+
+        :param calls: Запросы. Функции без параметров (functools.partial, lambda) или кортежи (функция, параметр1, параметр2, ...)
+        :return: Результаты в порядке запросов. Вместо результата запроса, завершившегося исключением, возвращается исключение
+        """
+        futures = [self.executor.submit(call) if callable(call) else self.executor.submit(*call) for call in calls]  # Ставим все запросы в очередь пула потоков
+        results = []  # Результаты запросов
+        for future in futures:  # Пробегаемся по запросам в порядке их постановки
+            try:
+                results.append(future.result())  # Дожидаемся результата запроса
+            except Exception as ex:  # Если запрос завершился ошибкой
+                results.append(ex)  # то вместо результата возвращаем ошибку
+        return results
+
+    def map_requests(self, func, *iterables) -> list:
+        """Параллельное выполнение одного запроса с разными параметрами
+
+        :param func: Функция запроса. Например, ap_provider.get_positions
+        :param iterables: Последовательности параметров функции. Например, (portfolio1, portfolio2), ('MOEX', 'MOEX')
+        :return: Результаты в порядке параметров. Вместо результата запроса, завершившегося исключением, возвращается исключение
+        """
+        return self.batch((func, *args) for args in zip(*iterables))
+
+    def get_history_parallel(self, exchange, symbol, tf, seconds_from=0, seconds_to=None, window_bars=10000, retries=3, completed=None, **kwargs) -> dict | None:
+        """История рынка для выбранных биржи и инструмента, загружаемая параллельно по временнЫм окнам
+
+        :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
+        :param str symbol: Тикер
+        :param int|str tf: Длительность временнОго интервала в секундах или код ("D" - дни, "W" - недели, "M" - месяцы, "Y" - годы)
+        :param int seconds_from: Дата и время UTC в секундах для первого запрашиваемого бара
+        :param int seconds_to: Дата и время UTC в секундах для последнего запрашиваемого бара. По умолчанию, текущее время
+        :param int window_bars: Размер окна в барах временнОго интервала
+        :param int retries: Кол-во попыток загрузки окна
+        :param dict completed: Загруженные окна {начало окна: бары}. Чтобы продолжить загрузку после ошибки, передайте тот же справочник повторно
+        :param kwargs: Остальные параметры get_history, кроме count_back
+        :return: Справочник с барами в history без дубликатов, отсортированными по времени. None, если хотя бы одно окно не удалось загрузить
+        """
+        if seconds_to is None:  # Если время последнего бара не задано
+            seconds_to = int(time())  # то загружаем историю до текущего времени
+        if not isinstance(tf, int):  # Дневные/недельные/месячные/годовые бары
+            return self.get_history(exchange, symbol, tf, seconds_from, seconds_to, **kwargs)  # загружаем одним запросом
+        window = tf * window_bars  # Размер окна в секундах
+        completed = {} if completed is None else completed  # Загруженные окна
+
+        def load_window(start):
+            """Загрузка окна с повтором при ошибке"""
+            for _ in range(retries):  # Пробуем загрузить окно несколько раз
+                try:
+                    history = self.get_history(exchange, symbol, tf, start, min(start + window - 1, seconds_to), **kwargs)  # Бары окна
+                except RateLimitError:  # Если лимит запросов превышен
+                    continue  # то пробуем еще раз. Незагруженное окно можно догрузить с тем же completed
+                if history and 'history' in history:  # Если бары получены
+                    return history
+            return None  # Окно загрузить не удалось
+
+        if seconds_from not in completed:  # Первое окно загружаем отдельно, чтобы пропустить время до первого бара тикера
+            history = load_window(seconds_from)
+            if history is None:  # Если окно загрузить не удалось
+                self.logger.error(f'Ошибка загрузки истории {exchange}.{symbol} {tf} с {seconds_from}')
+                return None
+            if not history['history'] and history.get('next') and seconds_from < history['next'] <= seconds_to:  # Если в окне нет бар, и сервер сообщил время следующего бара
+                seconds_from = history['next']  # то начинаем загрузку с него. Первое окно загружаем вместе с остальными
+            else:  # Если бары в первом окне есть или их нет дальше
+                completed[seconds_from] = history['history']  # то запоминаем загруженное окно
+        futures = {self.nested_executor.submit(load_window, start): start for start in range(seconds_from, seconds_to + 1, window) if start not in completed}  # Загружаем оставшиеся окна в пуле потоков
+        failed = 0  # Кол-во незагруженных окон
+        for future in as_completed(futures):  # Пробегаемся по окнам по мере их загрузки
+            history = future.result()  # Бары окна
+            if history is None:  # Если окно загрузить не удалось
+                failed += 1
+                continue
+            completed[futures[future]] = history['history']  # Запоминаем загруженное окно
+        if failed:  # Если не удалось загрузить хотя бы одно окно
+            self.logger.error(f'Ошибка загрузки истории {exchange}.{symbol} {tf}: не загружено окон {failed}. Повторите запрос с тем же completed')
+            return None
+        bars = {bar['time']: bar for start in sorted(completed) for bar in completed[start]}  # Объединяем бары окон. Дубликаты на границах окон заменяем последними
+        return {'history': [bars[seconds] for seconds in sorted(bars)]}
+
+    def get_history_cached(self, exchange, symbol, tf, seconds_from=0, seconds_to=None, **kwargs):
+        """История рынка из кэша бар bar_cache. Нужен NumPy.
+        Из Alor загружаются только бары после последнего бара кэша и бары с seconds_from до начала кэша.
+        Пустой кэш заполняется с seconds_from до текущего времени. По умолчанию (seconds_from=0) загружается вся история тикера
+
+        :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
+        :param str symbol: Тикер
+        :param int|str tf: Длительность временнОго интервала в секундах или код ("D" - дни, "W" - недели, "M" - месяцы, "Y" - годы)
+        :param int seconds_from: Дата и время UTC в секундах для первого запрашиваемого бара
+        :param int seconds_to: Дата и время UTC в секундах для последнего запрашиваемого бара. По умолчанию, текущее время
+        :param kwargs: Остальные параметры get_history_parallel. Формат только 'Simple'
+        :return: Структурированный массив NumPy бар с колонками time, open, high, low, close, volume
+        """
+        if self.bar_cache is None:  # Если кэш бар не задан
+            raise ValueError('Кэш бар не задан. Укажите параметр bar_cache при создании AlorPy')
+        seconds_start = self.bar_cache.get_start(exchange, symbol, tf)  # Начало истории в кэше
+        if seconds_start is None or seconds_from < seconds_start:  # Если кэш пуст, или запрашиваются бары до начала кэша
+            history = self.get_history_parallel(exchange, symbol, tf, seconds_from, None if seconds_start is None else seconds_start - 1, **kwargs)  # Загружаем бары до начала кэша
+            self.put_history_to_cache(exchange, symbol, tf, seconds_from, history, keep_empty=True)
+        seconds_from_top_up = None if seconds_start is None else self.get_top_up_time(exchange, symbol, tf, seconds_to)  # Время начала загрузки новых бар. Пустой кэш только что заполнен до текущего времени
+        if seconds_from_top_up is not None:  # Если нужны новые бары
+            history = self.get_history_parallel(exchange, symbol, tf, seconds_from_top_up, **kwargs)  # Загружаем только новые бары
+            self.put_history_to_cache(exchange, symbol, tf, seconds_from_top_up, history)
+        return self.bar_cache.load(exchange, symbol, tf, seconds_from, seconds_to)
+
+    def get_top_up_time(self, exchange, symbol, tf, seconds_to=None):
+        """Время начала загрузки новых бар в кэш
+
+        :param str exchange: Код биржи
+        :param str symbol: Тикер
+        :param int|str tf: Временной интервал Alor
+        :param int seconds_to: Дата и время UTC в секундах последнего запрашиваемого бара. По умолчанию, текущее время
+        :return: Время последнего бара кэша UTC в секундах. Начало истории в кэше, если бар в нем нет. None, если запрашиваемые бары уже есть в кэше
+        """
+        bars = self.bar_cache.load(exchange, symbol, tf)  # Бары кэша
+        if not len(bars):  # Если бар в кэше нет
+            return self.bar_cache.get_start(exchange, symbol, tf) or 0  # то загружаем историю с начала кэша
+        last_seconds = int(bars['time'][-1])  # Последний бар мог быть получен, когда он еще не был завершен. Поэтому, загрузим новые бары вместе с ним
+        return None if seconds_to is not None and seconds_to < last_seconds else last_seconds
+
+    def put_history_to_cache(self, exchange, symbol, tf, seconds_from, history, keep_empty=False):
+        """Запись загруженных бар в кэш новой частью
+
+        :param str exchange: Код биржи
+        :param str symbol: Тикер
+        :param int|str tf: Временной интервал Alor
+        :param int seconds_from: Дата и время UTC в секундах начала загрузки
+        :param dict history: Результат get_history_parallel
+        :param bool keep_empty: Записывать часть без бар. Для истории до начала кэша, чтобы ее не загружать повторно
+        """
+        if not history or 'history' not in history:  # Если бары не получены
+            self.logger.warning(f'Бары {exchange}.{symbol} {tf} с {seconds_from} не получены. История только из кэша')
+            return
+        if history['history'] or keep_empty:  # Если есть бары. Пустая часть новых бар заменила бы последний бар кэша
+            self.bar_cache.append(exchange, symbol, tf, seconds_from, self.bar_cache.from_history(history['history']))
+
+    # Постраничные запросы REST
+
+    def iter_all_trades(self, exchange, symbol, take=1000, prefetch=1, **kwargs):
+        """Сделки по инструменту (Текущая сессия) с автоматической загрузкой всех страниц
+
+        :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
+        :param str symbol: Тикер
+        :param int take: Количество загружаемых элементов на странице
+        :param int prefetch: Кол-во страниц, загружаемых заранее
+        :param kwargs: Остальные параметры get_all_trades, кроме offset
+        :return: Генератор сделок
+        """
+        return self.iter_offset_pages(lambda offset: self.get_all_trades(exchange, symbol, offset=offset, take=take, **kwargs), take, prefetch)
+
+    def iter_all_trades_history(self, exchange, symbol, limit=50000, prefetch=1, **kwargs):
+        """Сделки по инструменту (Прошлые сессии) с автоматической загрузкой всех страниц
+
+        :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
+        :param str symbol: Тикер
+        :param int limit: Количество загружаемых элементов на странице (1-50000)
+        :param int prefetch: Кол-во страниц, загружаемых заранее
+        :param kwargs: Остальные параметры get_all_trades_history, кроме offset
+        :return: Генератор сделок
+        """
+        return self.iter_offset_pages(lambda offset: self.get_all_trades_history(exchange, symbol, limit=limit, offset=offset, **kwargs), limit, prefetch)
+
+    def iter_securities(self, limit=1000, prefetch=1, **kwargs):
+        """Все торговые инструменты с автоматической загрузкой всех страниц
+
+        :param int limit: Количество загружаемых элементов на странице
+        :param int prefetch: Кол-во страниц, загружаемых заранее
+        :param kwargs: Остальные параметры get_securities, кроме offset
+        :return: Генератор торговых инструментов
+        """
+        return self.iter_offset_pages(lambda offset: self.get_securities(limit=limit, offset=offset, **kwargs), limit, prefetch)
+
+    def iter_risk_rates(self, exchange, limit=1000, prefetch=1, **kwargs):
+        """Ставки риска с автоматической загрузкой всех страниц
+
+        :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
+        :param int limit: Количество загружаемых элементов на странице
+        :param int prefetch: Кол-во страниц, загружаемых заранее
+        :param kwargs: Остальные параметры get_risk_rates, кроме offset
+        :return: Генератор ставок риска
+        """
+        return self.iter_offset_pages(lambda offset: self.get_risk_rates(exchange, limit=limit, offset=offset, **kwargs), limit, prefetch)
+
+    def iter_trades_history_v2(self, portfolio, exchange, id_from=None, limit=1000, **kwargs):
+        """Сделки по портфелю (Все | Прошлые сессии) с автоматической загрузкой всех страниц
+
+        :param str portfolio: Идентификатор клиентского портфеля
+        :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
+        :param int id_from: Начальный номер сделки
+        :param int limit: Количество загружаемых элементов на странице (1-1000)
+        :param kwargs: Остальные параметры get_trades_history_v2, кроме id_from и descending
+        :return: Генератор сделок
+        """
+        return self.iter_id_pages(lambda from_id: self.get_trades_history_v2(portfolio, exchange, id_from=from_id, limit=limit, **kwargs), id_from, limit)
+
+    def iter_trades_symbol_v2(self, portfolio, exchange, symbol, id_from=None, limit=1000, **kwargs):
+        """Сделки по портфелю (Инструмент | Прошлые сессии) с автоматической загрузкой всех страниц
+
+        :param str portfolio: Идентификатор клиентского портфеля
+        :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
+        :param str symbol: Тикер
+        :param int id_from: Начальный номер сделки
+        :param int limit: Количество загружаемых элементов на странице (1-1000)
+        :param kwargs: Остальные параметры get_trades_symbol_v2, кроме id_from и descending
+        :return: Генератор сделок
+        """
+        return self.iter_id_pages(lambda from_id: self.get_trades_symbol_v2(portfolio, exchange, symbol, id_from=from_id, limit=limit, **kwargs), id_from, limit)
+
+    @staticmethod
+    def get_page_records(page) -> list:
+        """Записи страницы
+
+        :param page: Ответ постраничного запроса. Список записей или справочник со списком записей в list
+        :return: Список записей. None, если страница не получена
+        """
+        if isinstance(page, dict):  # Если записи вернулись в справочнике
+            page = page.get('list')  # то получаем их список
+        return page if isinstance(page, list) else None
+
+    def load_page(self, get_page, start) -> list:
+        """Записи страницы с повтором загрузки при ошибке
+
+        :param get_page: Функция получения страницы
+        :param int start: Смещение или начальный номер записи страницы
+        :return: Список записей. Исключение PageLoadError, если страница не получена за page_retries попыток
+        """
+        for attempt in range(1, self.page_retries + 1):  # Пробуем загрузить страницу
+            records = self.get_page_records(get_page(start))
+            if records is not None:  # Если страница получена
+                return records  # то возвращаем ее записи. Короткая или пустая страница завершает перебор
+            self.logger.warning(f'Страница с {start} не получена. Попытка {attempt} из {self.page_retries}')
+        raise PageLoadError(start)
+
+    def iter_offset_pages(self, get_page, page_size, prefetch=1):
+        """Генератор записей постраничного запроса со смещением. Следующие страницы загружаются в пуле потоков, пока обрабатывается текущая
+
+        :param get_page: Функция получения страницы по смещению
+        :param int page_size: Кол-во записей на странице
+        :param int prefetch: Кол-во страниц, загружаемых заранее
+        :return: Генератор записей. Исключение PageLoadError, если страница не получена
+        """
+        pages = deque(self.nested_executor.submit(self.load_page, get_page, page * page_size) for page in range(prefetch + 1))  # Загружаем текущую и следующие страницы
+        next_page = prefetch + 1  # Номер следующей страницы для загрузки
+        try:
+            while pages:  # Пока есть загружаемые страницы
+                records = pages.popleft().result()  # Дожидаемся загрузки страницы
+                if len(records) == page_size:  # Если страница полная, то за ней могут быть еще записи
+                    pages.append(self.nested_executor.submit(self.load_page, get_page, next_page * page_size))  # Загружаем следующую страницу
+                    next_page += 1
+                yield from records  # Отдаем записи страницы
+                if len(records) < page_size:  # Если страница последняя
+                    break  # то записей больше нет
+        finally:
+            for page in pages:  # Загрузку оставшихся страниц
+                page.cancel()  # отменяем
+
+    def iter_id_pages(self, get_page, id_from, page_size):
+        """Генератор записей постраничного запроса с начальным номером. Следующая страница загружается в пуле потоков, пока обрабатывается текущая
+
+        :param get_page: Функция получения страницы по начальному номеру
+        :param int id_from: Начальный номер записи
+        :param int page_size: Кол-во записей на странице
+        :return: Генератор записей. Исключение PageLoadError, если страница не получена
+        """
+        page = self.nested_executor.submit(self.load_page, get_page, id_from)  # Загружаем первую страницу
+        try:
+            while page:  # Пока есть загружаемая страница
+                records = page.result()  # Дожидаемся загрузки страницы
+                page = self.nested_executor.submit(self.load_page, get_page, int(records[-1]['id']) + 1) if len(records) == page_size else None  # Если страница полная, то загружаем следующую после последнего номера
+                yield from records  # Отдаем записи страницы
+        finally:
+            if page:  # Загрузку оставшейся страницы
+                page.cancel()  # отменяем
 
     # Запросы WebSocket
 
-    def send_websocket(self, request):
-        """Отправка запроса через командный WebSocket
+    def send_websocket(self, request, timeout=None):
+        """Отправка запроса через командный WebSocket с ожиданием ответа. Запросы из разных потоков выполняются одновременно
 
         :param request: Запрос JSON
-        :return: Ответ JSON
+        :param float timeout: Время ожидания ответа в секундах. По умолчанию cws_timeout
+        :return: Ответ JSON, None в случае ошибки или таймаута
         """
-        if not self.cws_socket:  # Если не было подключения к серверу заявок WebSocket
-            self.cws_socket = connect(self.cws_server)  # то пробуем к нему подключиться
-        request['guid'] = str(uuid4())  # Получаем уникальный идентификатор запроса, ставим его в запрос
-        self.cws_socket.send(dumps(request))  # Переводим JSON в строку, отправляем запрос
-        response = self.cws_socket.recv()  # Дожидаемся ответа от сервера заявок WebSocket
-        return self.check_websocket_result(response)
+        future = self.send_websocket_future(request)  # Отправляем запрос
+        try:
+            return future.result(self.cws_timeout if timeout is None else timeout)  # Дожидаемся ответа
+        except FutureTimeoutError:  # Если ответ не пришел
+            self.cws_pending.pop(request['guid'], None)  # то больше его не ждем
+            self.logger.error(f'Ошибка сервера заявок: Таймаут ответа на запрос {request["guid"]}')
+            return None
+        except ConnectionError as ex:  # Если соединение закрылось до ответа
+            self.logger.error(f'Ошибка сервера заявок: {ex}. Запрос {request["guid"]}')
+            return None
+
+    def send_websocket_future(self, request) -> Future:
+        """Отправка запроса через командный WebSocket без ожидания ответа
+
+        :param request: Запрос JSON
+        :return: Future с ответом JSON, None в случае ошибки. Ответы сопоставляются с запросами по уникальному идентификатору запроса
+        """
+        guid = str(uuid4())  # Уникальный идентификатор запроса
+        request['guid'] = guid  # Ставим его в запрос
+        future = Future()  # Ответ на запрос
+        with self.cws_lock:  # Подключаемся и отправляем команды по одной
+            if not self.cws_socket:  # Если не было подключения к серверу заявок WebSocket
+                self.cws_socket = connect(self.cws_server)  # то пробуем к нему подключиться
+                Thread(target=self.command_websocket_thread, args=(self.cws_socket,), name='CommandWebSocketThread', daemon=True).start()  # Ответы читаем в отдельном потоке
+            self.cws_pending[guid] = future  # Ответ может прийти сразу после отправки
+            try:
+                self.cws_socket.send(self.codec.dumps(request))  # Переводим JSON в строку, отправляем запрос
+            except Exception:  # Если запрос не отправлен
+                del self.cws_pending[guid]  # то ответ не ждем
+                raise
+        return future
+
+    def command_websocket_thread(self, cws_socket):
+        """Поток чтения ответов сервера заявок WebSocket
+
+        :param cws_socket: Подключение к серверу заявок WebSocket
+        """
+        try:
+            while True:
+                response_json = cws_socket.recv(decode=False)  # Ожидаем ответ сервера заявок WebSocket
+                try:
+                    response = self.codec.loads(response_json)  # Переводим JSON в словарь
+                except self.codec.decode_errors:  # Если ответ не в формате JSON, то не можем определить запрос
+                    self.logger.warning(f'Command WebSocket Thread: Пришел ответ не в формате JSON {response_json}. Пропуск')
+                    continue
+                future = self.cws_pending.pop(response.get('requestGuid'), None)  # Ответ ищем по уникальному идентификатору запроса
+                if future is None:  # Если запрос не найден. Например, после таймаута
+                    self.logger.debug(f'Command WebSocket Thread: Пришел ответ на неизвестный запрос {response}. Пропуск')
+                    continue
+                try:
+                    future.set_result(self.check_websocket_result(response))  # Отдаем ответ ждущему потоку
+                except Exception as ex:  # Ошибка разбора одного ответа не останавливает чтение остальных
+                    future.set_exception(ex)
+        except ConnectionClosed:  # Отключились от сервера заявок WebSocket
+            self.logger.debug('Command WebSocket Thread: Отключен от сервера')
+        except Exception as ex:  # При других типах ошибок
+            self.logger.error(f'Command WebSocket Thread: Ошибка {ex}')
+        finally:
+            with self.cws_lock:  # Новые команды отправятся через новое подключение
+                if self.cws_socket is cws_socket:
+                    self.cws_socket = None
+                pending, self.cws_pending = self.cws_pending, {}  # Ответы на отправленные команды уже не придут
+            for future in pending.values():
+                future.set_exception(ConnectionError('Соединение с сервером заявок WebSocket закрыто'))
+            try:
+                cws_socket.close()  # Закрываем подключение, если оно еще открыто
+            except Exception:  # Ошибки при закрытии подключения
+                pass  # не обрабатываем
 
     def check_websocket_result(self, response):
         """Анализ результата запроса WebSocket
 
-        :param response: Ответ JSON
+        :param response: Ответ JSON в байтах, тексте или справочнике
         :return: JSON, текст, None в случае веб ошибки
         """
-        try:
-            json_response = loads(response)  # Декодируем JSON в справочник, возвращаем его. Ошибки также могут приходить в виде JSON
-        except JSONDecodeError:  # Если произошла ошибка при декодировании JSON, например, при удалении заявок
-            return response  # то возвращаем значение в виде текста
-        http_code = json_response['httpCode']  # Код 200 или ошибки
+        if isinstance(response, dict):  # Если ответ уже декодирован
+            json_response = response
+        else:  # Если ответ в байтах или тексте
+            try:
+                json_response = self.codec.loads(response)  # Декодируем JSON в справочник, возвращаем его. Ошибки также могут приходить в виде JSON
+            except self.codec.decode_errors:  # Если произошла ошибка при декодировании JSON, например, при удалении заявок
+                return response.decode('utf-8') if isinstance(response, bytes) else response  # то возвращаем значение в виде текста
+        http_code = json_response.get('httpCode')  # Код 200 или ошибки
         if http_code != 200:  # Если в результате запроса произошла ошибка
-            self.logger.error(f'Ошибка сервера: {http_code} {response["message"]}')  # Событие ошибки
+            self.logger.error(f'Ошибка сервера: {http_code} {json_response.get("message")}')  # Событие ошибки
             return None  # то возвращаем пустое значение
         return json_response  # Возвращаем JSON
 
     # Подписки WebSocket
 
-    def subscribe(self, request) -> str:
+    def subscribe(self, request, callback=None) -> str:
         """Запуск WebSocket, если не запущен. Отправка запроса подписки на сервер WebSocket
 
         :param request request: Запрос
-        :return: Уникальный идентификатор подписки
-        """
+        :param callback: Функция, получающая данные только этой подписки. Если не задана, то вызывается общее событие по типу подписки
+        :return: Подписка. Уникальный идентификатор подписки с отменой unsubscribe()
+        """
+        if callback:  # Если задана функция подписки
+            request['callback'] = callback  # то данные подписки будем передавать только ей
+        self.start_websocket()  # Запускаем WebSocket, если не запущен
+        request['shard'] = shard = self.get_shard(request)  # Подключение подписки
+        self.ws_shards_ready[shard].wait()  # Подключение к серверу WebSocket выполняется в отдельном потоке. Подождем, пока подключение не будет готово принимать запросы
+        guid = str(uuid4())  # Уникальный идентификатор подписки
+        self.subscribe_call(request, guid)
+        return Subscription(guid, self)
+
+    def subscribe_many(self, requests, callback=None, timeout=10) -> list:
+        """Отправка сразу нескольких запросов подписки на сервер WebSocket без ожидания ответа на каждый из них
+
+        :param requests: Запросы подписок. Справочники как в функциях подписок. Например, {'opcode': 'QuotesSubscribe', 'exchange': 'MOEX', 'code': 'SBER', 'format': 'Simple'}. Функцию подписки можно задать в ключе callback
+        :param callback: Функция, получающая данные подписок без своей функции. Если не задана, то вызывается общее событие по типу подписки
+        :param float timeout: Время ожидания подтверждения подписок сервером в секундах. 0 - не ждать
+        :return: Подписки в порядке запросов. Подтверждение сервера в атрибуте acknowledged: True - подписка оформлена, False - отклонена, None - ответ не получен
+        """
+        self.start_websocket()  # Запускаем WebSocket, если не запущен
+        for request in requests:  # Пробегаемся по всем запросам
+            if callback and 'callback' not in request:  # Если задана общая функция подписок, а у подписки своей функции нет
+                request['callback'] = callback  # то данные подписки будем передавать общей функции
+            request['shard'] = self.get_shard(request)  # Подключение подписки
+        for shard in {request['shard'] for request in requests}:  # Пробегаемся по всем подключениям подписок
+            self.ws_shards_ready[shard].wait()  # Подождем, пока подключение не будет готово принимать запросы
+        token = self.get_jwt_token()  # Токен JWT один для всех подписок
+        guids = [str(uuid4()) for _ in requests]  # Уникальные идентификаторы подписок
+        frames = [self.get_subscribe_frame(request, guid, token) for request, guid in zip(requests, guids)]  # Готовим все запросы подписок
+        acks = {guid: Future() for guid in guids} if timeout else {}  # Подтверждения подписок
+        self.subscribe_acks.update(acks)  # Подтверждение может прийти сразу после отправки
+        for request, frame in zip(requests, frames):  # Отправляем запросы подряд без ожидания ответов
+            self.ws_sockets[request['shard']].send(frame)
+        if acks:  # Если ждем подтверждения подписок
+            wait(acks.values(), timeout)  # то ждем их, но не дольше таймаута
+        subscriptions = []  # Подписки
+        for guid in guids:  # Пробегаемся по всем подпискам
+            subscription = Subscription(guid, self)
+            ack = self.subscribe_acks.pop(guid, None)  # Подтверждение подписки
+            subscription.acknowledged = ack.result() if ack and ack.done() else None  # True/False или None, если ответ не получен
+            subscriptions.append(subscription)
+        return subscriptions
+
+    def start_websocket(self):
+        """Запуск WebSocket, если не запущен"""
         if not self.ws_ready and not self.ws_running:  # Если WebSocket не готов принимать запросы
             self.ws_running = True  # Запуск потока только один раз
             self.logger.debug(f'WebSocket Main: Запуск')
             self.on_entering.trigger()  # Событие начала входа
-            Thread(target=self.websocket_thread, name='WebSocketThread').start()  # Создаем и запускаем поток управления подписками
-        while not self.ws_ready:  # Подключение к серверу WebSocket выполняется в отдельном потоке
-            sleep(self.ws_reconnect_timeout/10)  # Подождем, пока WebSocket не будет готов принимать запросы
-        guid = str(uuid4())  # Уникальный идентификатор подписки
-        self.subscribe_call(request, guid)
-        return guid
-
-    def websocket_thread(self):
-        """Поток управления подписками"""
+            if self.dispatch_workers and self.dispatcher is None:  # Если данные подписок обрабатываем в отдельных потоках
+                self.dispatcher = Dispatcher(self.dispatch, self.dispatch_workers, self.dispatch_queue_size, self.dispatch_policy, self.logger)  # то запускаем их
+            for shard in range(self.ws_shards):  # Для каждого подключения
+                Thread(target=self.websocket_thread, args=(shard,), name=f'WebSocketThread{shard}' if shard else 'WebSocketThread').start()  # Создаем и запускаем поток управления подписками
+
+    @property
+    def ws_socket(self):
+        """Подключение к серверу подписок и событий WebSocket. Первое, если подключений несколько"""
+        return self.ws_sockets[0]
+
+    @ws_socket.setter
+    def ws_socket(self, ws_socket):
+        self.ws_sockets[0] = ws_socket
+
+    @property
+    def ws_ready(self) -> bool:
+        """Все подключения к серверу WebSocket готовы принимать запросы"""
+        return all(ready.is_set() for ready in self.ws_shards_ready)
+
+    @ws_ready.setter
+    def ws_ready(self, ready):
+        for shard_ready in self.ws_shards_ready:  # Пробегаемся по всем подключениям
+            if ready:
+                shard_ready.set()
+            else:
+                shard_ready.clear()
+
+    def get_reconnect_delay(self, attempt) -> float:
+        """Задержка перед попыткой переподключиться к серверу WebSocket
+
+        :param int attempt: Номер попытки после разрыва соединения, начиная с 0
+        :return: Задержка в секундах. Первая попытка сразу. Далее экспоненциальная со случайной добавкой, не более ws_reconnect_timeout
+        """
+        if attempt == 0:  # Первую попытку делаем сразу
+            return 0
+        return min(self.ws_reconnect_backoff * 2 ** (attempt - 1), self.ws_reconnect_timeout) * (0.5 + random() / 2)  # Случайная добавка разводит переподключения разных клиентов после сбоя сервера
+
+    def get_shard(self, request) -> int:
+        """Номер подключения к серверу WebSocket для подписки
+
+        :param dict request: Запрос подписки
+        :return: Номер подключения. Подписки одного типа или тикера попадают в одно и то же подключение при каждом запуске
+        """
+        if self.ws_shards == 1:  # Если подключение одно
+            return 0  # то все подписки идут в него
+        shard = self.ws_shard_map.get(request['opcode'])  # Подключение, закрепленное за типом подписки
+        if shard is not None:  # Если тип подписки закреплен
+            return shard % self.ws_shards
+        if self.ws_shard_by == 'symbol':  # Если распределяем по тикеру
+            key = f'{request.get("exchange")}:{request.get("code") or request.get("portfolio")}'  # Подписки на портфель распределяем по портфелю
+        else:  # Если распределяем по типу подписки
+            key = request['opcode']
+        return crc32(key.encode()) % self.ws_shards  # Встроенный hash строк меняется от запуска к запуску
+
+    def websocket_thread(self, shard=0):
+        """Поток управления подписками
+
+        :param int shard: Номер подключения к серверу WebSocket
+        """
         self.logger.debug(f'WebSocket Thread: Запущен')
         self.on_enter.trigger()  # Событие входа
+        attempt = 0  # Номер попытки переподключения
         while self.ws_running:  # Будем держать соединение с сервером WebSocket до отмены
+            connected = None  # Время готовности подключения
             try:
-                # Для всех подписок используем 1 WebSocket. У Алора нет ограничений на кол-во соединений
-                # Но подключение сбрасывается, если в очереди соединения находится более 5000 непрочитанных сообщений
-                # Это может быть из-за медленного компьютера или слабого канала связи
-                # В любом из этих случаев создание дополнительных подключений проблему не решит
+                # Подписки распределяются по ws_shards подключениям. У Алора нет ограничений на кол-во соединений
+                # Подключение сбрасывается, если в очереди соединения находится более 5000 непрочитанных сообщений
+                # Тяжелые подписки (все сделки, стаканы) можно вынести в отдельное подключение через ws_shard_map,
+                # чтобы их сброс не затрагивал заявки и позиции
                 ssl_context = ssl.create_default_context()  # Контекст SSL
                 ssl_context.check_hostname = False  # Не проверяем имя сервера
                 ssl_context.verify_mode = ssl.CERT_NONE  # Не проверяем сертификат
-                self.ws_socket = connect(uri=self.ws_server, ssl=ssl_context)  # Пробуем подключиться к серверу подписок и событий WebSocket
+                self.ws_sockets[shard] = ws_socket = connect(uri=self.ws_server, ssl=ssl_context)  # Пробуем подключиться к серверу подписок и событий WebSocket
                 self.logger.debug(f'WebSocket Thread: Подключен к серверу')
                 self.on_connect.trigger()  # Событие подключения к серверу
 
-                if len(self.subscriptions) > 0:  # Если есть подписки, то будем их возобновлять
-                    self.logger.debug(f'WebSocket Thread: Возобновление подписок ({len(self.subscriptions)})')
+                subscriptions = [(guid, request) for guid, request in list(self.subscriptions.items()) if request.get('shard', 0) == shard]  # Подписки подключения
+                if len(subscriptions) > 0:  # Если есть подписки, то будем их возобновлять
+                    self.logger.debug(f'WebSocket Thread: Возобновление подписок ({len(subscriptions)})')
                     self.on_resubscribe.trigger()  # Событие возобновления подписок
-                    for guid, request in self.subscriptions.items():  # Пробегаемся по всем подпискам
+                    for guid, request in subscriptions:  # Пробегаемся по всем подпискам подключения
                         self.subscribe_call(request, guid)  # Переподписываемся с тем же уникальным идентификатором
-                self.ws_ready = True  # Готов принимать запросы
+                self.ws_shards_ready[shard].set()  # Готов принимать запросы. Отпускаем ожидающие подписки
+                connected = monotonic()  # Задержку переподключения сбросим, только если подключение проработает ws_stable_time
                 self.logger.debug(f'WebSocket Thread: Готов')
                 self.on_ready.trigger()  # Событие готовности к работе
 
                 while self.ws_running:  # Получаем подписки до отмены
-                    response_json = self.ws_socket.recv()  # Ожидаем ответ с сервера подписок и событий WebSocket
+                    response_json = ws_socket.recv(decode=False)  # Ожидаем ответ с сервера подписок и событий WebSocket. Получаем байты без перевода в текст
                     try:
-                        response = loads(response_json)  # Переводим JSON в словарь
-                    except JSONDecodeError:  # Если вместо JSON сообщений получаем текст (проверка на всякий случай)
+                        response = self.codec.loads(response_json)  # Переводим JSON в словарь
+                    except self.codec.decode_errors:  # Если вместо JSON сообщений получаем текст (проверка на всякий случай)
                         self.logger.warning(f'WebSocket Thread: Пришли данные подписки не в формате JSON {response_json}. Пропуск')
                         continue  # то его не разбираем, пропускаем
-                    if 'data' not in response:  # Если пришло сервисное сообщение о подписке/отписке
-                        continue  # то его не разбираем, пропускаем
-                    guid = response['guid']  # GUID подписки
-                    if guid not in self.subscriptions:  # Если подписка не найдена
-                        self.logger.debug(f'WebSocket Thread: Поступившая подписка с кодом {guid} не найдена. Пропуск')
-                        continue  # то мы не можем сказать, что это за подписка, пропускаем ее
-                    subscription = self.subscriptions[guid]  # Поиск подписки по GUID
-                    opcode = subscription['opcode']  # Разбираем по типу подписки
-                    self.logger.debug(f'WebSocket Thread: Пришли данные подписки {opcode} - {guid} - {response}')
-                    if opcode == 'OrderBookGetAndSubscribe':  # Биржевой стакан
-                        self.on_change_order_book.trigger(response)
-                    elif opcode == 'BarsGetAndSubscribe':  # Новый бар
-                        if subscription['prev']:  # Если есть предыдущее значение
-                            seconds = response['data']['time']  # Время пришедшего бара
-                            prev_seconds = subscription['prev']['data']['time']  # Время предыдущего бара
-                            if seconds == prev_seconds:  # Пришла обновленная версия текущего бара
-                                subscription['prev'] = response  # то запоминаем пришедший бар
-                            elif seconds > prev_seconds:  # Пришел новый бар
-                                self.logger.debug(f'WebSocket Thread: OnNewBar {subscription["prev"]}')
-                                self.on_new_bar.trigger(subscription['prev'])
-                                subscription['prev'] = response  # Запоминаем пришедший бар
-                        else:  # Если пришло первое значение
-                            subscription['prev'] = response  # то запоминаем пришедший бар
-                    elif opcode == 'QuotesSubscribe':  # Котировки
-                        self.on_new_quotes.trigger(response)
-                    elif opcode == 'AllTradesGetAndSubscribe':  # Все сделки
-                        self.on_all_trades.trigger(response)
-                    elif opcode == 'PositionsGetAndSubscribeV2':  # Позиции по ценным бумагам и деньгам
-                        self.on_position.trigger(response)
-                    elif opcode == 'SummariesGetAndSubscribeV2':  # Сводная информация по портфелю
-                        self.on_summary.trigger(response)
-                    elif opcode == 'RisksGetAndSubscribe':  # Портфельные риски
-                        self.on_risk.trigger(response)
-                    elif opcode == 'SpectraRisksGetAndSubscribe':  # Риски срочного рынка (FORTS)
-                        self.on_spectra_risk.trigger(response)
-                    elif opcode == 'TradesGetAndSubscribeV2':  # Сделки
-                        self.on_trade.trigger(response)
-                    elif opcode == 'StopOrdersGetAndSubscribe':  # Стоп заявки
-                        self.on_stop_order.trigger(response)
-                    elif opcode == 'StopOrdersGetAndSubscribeV2':  # Стоп заявки v2
-                        self.on_stop_order_v2.trigger(response)
-                    elif opcode == 'OrdersGetAndSubscribeV2':  # Заявки
-                        self.on_order.trigger(response)
-                    elif opcode == 'InstrumentsGetAndSubscribeV2':  # Информация о финансовых инструментах
-                        self.on_symbol.trigger(response)
+                    if self.dispatcher:  # Если данные подписок обрабатываются в отдельных потоках
+                        self.dispatcher.put(response, response.get('guid') in self.conflated)  # то ставим их в очередь. Поток чтения не ждет обработчиков, и очередь соединения не растет
+                    else:  # Если отдельных потоков нет
+                        self.dispatch(response)  # то разбираем данные подписки сразу
             except ConnectionClosed:  # Отключились от сервера WebSockets
                 self.logger.debug(f'WebSocket Thread: Отключен от сервера')
                 self.on_disconnect.trigger()  # Событие отключения от сервера
@@ -2124,14 +2883,196 @@ class AlorPy:
             except Exception as ex:  # При других типах ошибок
                 self.logger.error(f'WebSocket Thread: Ошибка {ex}')  # Событие ошибки
             finally:
-                self.ws_ready = False  # Не готов принимать запросы
-                self.ws_socket = None  # Сбрасываем подключение сервера подписок и событий WebSocket
+                self.ws_shards_ready[shard].clear()  # Не готов принимать запросы. Новые подписки будут ждать переподключения
+                self.ws_sockets[shard] = None  # Сбрасываем подключение сервера подписок и событий WebSocket
+            if connected is not None and monotonic() - connected >= self.ws_stable_time:  # Если подключение работало долго
+                attempt = 0  # то следующее переподключение начнем сразу. Сервер, сразу закрывающий подключение, получит растущую задержку
             if self.ws_running:  # Если отключение не было запрошено пользователем
-                self.logger.debug(f'WebSocket Thread: попытка переподключения к вебсокету через {self.ws_reconnect_timeout} секунд')
-                sleep(self.ws_reconnect_timeout)  # выжидаем время до следующей попытки подключиться
+                delay = self.get_reconnect_delay(attempt)  # Задержка до следующей попытки подключиться
+                attempt += 1
+                self.logger.debug(f'WebSocket Thread: попытка переподключения к вебсокету через {delay:.2f} секунд')
+                sleep(delay)  # выжидаем время до следующей попытки подключиться
         self.logger.debug(f'WebSocket Thread: Завершение')
         self.on_exit.trigger()  # Событие выхода
 
+    def dispatch(self, response):
+        """Разбор данных подписки. Вызов обработчика, привязанного к подписке
+
+        :param dict response: Данные подписки
+        """
+        if 'data' not in response:  # Если пришло сервисное сообщение о подписке/отписке
+            if self.subscribe_acks:  # Если ждем подтверждения подписок
+                ack = self.subscribe_acks.get(response.get('requestGuid'))  # Подтверждение подписки
+                if ack and not ack.done():  # Если подтверждение ждут
+                    if response.get('httpCode') != 200:  # Если подписка отклонена
+                        self.logger.error(f'Ошибка подписки {response.get("requestGuid")}: {response.get("httpCode")} {response.get("message")}')
+                    ack.set_result(response.get('httpCode') == 200)  # то отдаем его
+            return  # Сервисные сообщения дальше не разбираем
+        handler = self.handlers.get(response['guid'])  # Обработчик подписки по GUID
+        if handler is None:  # Если подписка не найдена
+            self.logger.debug(f'WebSocket Thread: Поступившая подписка с кодом {response["guid"]} не найдена. Пропуск')
+            return  # то мы не можем сказать, что это за подписка, пропускаем ее
+        if self.logger.isEnabledFor(logging.DEBUG):  # Данные подписки переводим в текст только для отладки
+            self.logger.debug(f'WebSocket Thread: Пришли данные подписки {response["guid"]} - {response}')
+        handler(response)  # Вызываем обработчик подписки
+
+    @classmethod
+    def register_subscription_handler(cls, opcode, handler_factory):
+        """Регистрация обработчика данных для типа подписки
+
+        :param str opcode: Тип подписки
+        :param handler_factory: Функция (AlorPy, подписка) -> обработчик. Обработчик вызывается с данными подписки. Функция подписки передается в подписке с ключом callback
+        """
+        cls.subscription_handlers = {**cls.subscription_handlers, opcode: handler_factory}  # Копия справочника, чтобы регистрация в классе-наследнике не меняла родительский класс
+
+    @staticmethod
+    def event_handler(event_name):
+        """Фабрика обработчика данных подписки, вызывающего функцию подписки или, если она не задана, общее событие
+
+        :param str event_name: Название общего события. Например, 'on_new_quotes'
+        :return: Фабрика обработчика
+        """
+        return lambda ap, subscription: subscription.get('callback') or getattr(ap, event_name).trigger
+
+    def new_bar_handler(self, subscription):
+        """Фабрика обработчика подписки на бары. Вызывает событие нового бара, когда приходит бар со следующим временем или по таймеру.
+        На каждое изменение текущего бара вызывает событие on_bar_in_progress
+
+        :param dict subscription: Подписка
+        :return: Обработчик
+        """
+        subscription.setdefault('prev', None)  # Последний полученный бар подписки. Сохраняется при возобновлении подписки
+        subscription.setdefault('closed', None)  # Время последнего завершенного бара подписки
+        on_new_bar = subscription.get('callback') or self.on_new_bar.trigger  # Функция подписки или общее событие нового бара
+        on_bar_in_progress = self.on_bar_in_progress.trigger  # Событие изменения текущего бара
+        bar_lock = self.bar_lock  # Блокировка завершения баров
+        if subscription.get('close_by_timer'):  # Если бары завершаем по таймеру
+            self.start_bar_timer()  # то запускаем его
+
+        def handler(response):
+            closed = None  # Завершенный бар
+            with bar_lock:  # Бар может завершиться по таймеру в это же время
+                prev = subscription['prev']  # Предыдущее значение
+                if prev:  # Если есть предыдущее значение
+                    seconds = response['data']['time']  # Время пришедшего бара
+                    prev_seconds = prev['data']['time']  # Время предыдущего бара
+                    if seconds < prev_seconds:  # Пришел бар с прошлым временем
+                        return  # то его не запоминаем
+                    if seconds > prev_seconds:  # Пришел новый бар
+                        closed = self.close_bar(subscription)  # Завершаем предыдущий бар, если он не был завершен по таймеру
+                subscription['prev'] = response  # Запоминаем пришедший бар. Первый или обновленную версию текущего бара
+            if closed:  # Если бар завершен
+                self.logger.debug(f'WebSocket Thread: OnNewBar {closed}')
+                on_new_bar(closed)
+            on_bar_in_progress(response)
+        return handler
+
+    @staticmethod
+    def close_bar(subscription):
+        """Завершение последнего полученного бара подписки. Вызывается под блокировкой bar_lock
+
+        :param dict subscription: Подписка на бары
+        :return: Завершенный бар. None, если бар уже был завершен
+        """
+        prev = subscription['prev']  # Последний полученный бар
+        if prev is None:  # Если баров еще не было
+            return None  # то завершать нечего
+        seconds = prev['data']['time']  # Время последнего полученного бара
+        if subscription['closed'] is not None and seconds <= subscription['closed']:  # Если бар уже завершен
+            return None  # то второй раз его не завершаем
+        subscription['closed'] = seconds  # Запоминаем время завершенного бара
+        return prev
+
+    def close_bars_by_timer(self) -> float:
+        """Завершение баров подписок, интервал которых закончился по времени сервера
+
+        :return: Время до следующей проверки в секундах
+        """
+        now = time() + self.server_time_offset  # Текущее время сервера
+        timeout = 1.0  # Новые подписки проверяем не реже раза в секунду
+        for subscription in list(self.subscriptions.values()):  # Пробегаемся по копии подписок. Подписки могут меняться в других потоках
+            if not subscription.get('close_by_timer') or subscription['prev'] is None:  # Если бары подписки не завершаем по таймеру, или баров еще нет
+                continue  # то переходим к следующей подписке
+            close_time = subscription['prev']['data']['time'] + subscription['tf'] + self.bar_close_delay  # Время завершения бара
+            if now < close_time:  # Если интервал бара не закончился
+                timeout = min(timeout, close_time - now)  # то проверим его к времени завершения
+                continue
+            with self.bar_lock:
+                closed = self.close_bar(subscription)  # Завершаем бар, если он не был завершен по приходу следующего бара
+            if closed:  # Если бар завершен
+                self.logger.debug(f'Bar Timer: OnNewBar {closed}')
+                try:
+                    (subscription.get('callback') or self.on_new_bar.trigger)(closed)
+                except Exception as ex:  # Ошибка обработчика не должна останавливать таймер
+                    self.logger.error(f'Bar Timer: Ошибка обработчика {ex}')
+        return timeout
+
+    def set_server_time_offset(self, server_time):
+        """Запоминание разницы между временем сервера и локальным временем
+
+        :param server_time: Результат get_time. Время сервера UTC в секундах
+        """
+        if isinstance(server_time, int):  # Если время сервера получено
+            self.server_time_offset = server_time - time()  # то запоминаем разницу с локальным временем
+        else:  # Если время сервера не получено
+            self.logger.warning(f'Bar Timer: Время сервера не получено {server_time}. Используем прошлую разницу {self.server_time_offset:.3f} с')
+
+    def start_bar_timer(self):
+        """Запуск таймера завершения баров, если не запущен"""
+        if not self.bar_timer_running:  # Если таймер не запущен
+            self.bar_timer_running = True  # Запуск только один раз
+            Thread(target=self.bar_timer_thread, name='BarTimerThread', daemon=True).start()
+
+    def bar_timer_thread(self):
+        """Поток таймера завершения баров"""
+        synced = None  # Время последнего обновления разницы времени сервера
+        try:
+            while self.ws_running:  # Пока работает WebSocket
+                if synced is None or monotonic() - synced >= self.server_time_interval:  # Если пора обновить разницу времени сервера
+                    synced = monotonic()
+                    try:
+                        self.set_server_time_offset(self.get_time())
+                    except Exception as ex:  # Ошибка запроса не должна останавливать таймер
+                        self.logger.error(f'Bar Timer: Ошибка получения времени сервера {ex}')
+                try:
+                    timeout = self.close_bars_by_timer()  # Завершаем бары
+                except Exception as ex:  # Ошибка завершения баров не должна останавливать таймер
+                    self.logger.error(f'Bar Timer: Ошибка {ex}')
+                    timeout = 1.0
+                sleep(timeout)  # Ждем до следующей проверки
+        finally:
+            self.bar_timer_running = False  # Таймер можно запустить снова
+
+    def bind_handler(self, request, guid):
+        """Привязка обработчика данных к подписке
+
+        :param dict request: Запрос подписки
+        :param str guid: Уникальный идентификатор подписки
+        """
+        opcode = request['opcode']  # Тип подписки
+        handler = self.subscription_handlers[opcode](self, request)  # Обработчик данных подписки
+        if request.get('result_type') == 'record':  # Если данные подписки нужно перевести в компактную запись
+            handler = self.record_handler(handler, self.subscription_records[opcode])  # то переводим их перед вызовом обработчика
+        self.subscriptions[guid] = request  # Заносим подписку в справочник
+        self.handlers[guid] = handler  # Заносим обработчик в справочник
+        if request.get('conflate'):  # Если обрабатываем только последние данные подписки
+            self.conflated.add(guid)  # то отмечаем подписку для очереди обработки
+
+    @staticmethod
+    def record_handler(handler, record):
+        """Обработчик, переводящий данные подписки в компактную запись
+
+        :param handler: Обработчик данных подписки
+        :param record: Класс компактной записи
+        :return: Обработчик
+        """
+        convert = record.convert  # Функция перевода
+
+        def record_handler(response):
+            response['data'] = convert(response['data'])  # Переводим данные подписки в компактную запись
+            handler(response)
+        return record_handler
+
     def subscribe_call(self, request, guid):
         """Отправка запроса (пере)подписки на сервер WebSocket
 
@@ -2139,29 +3080,57 @@ class AlorPy:
         :param str guid: Уникальный идентификатор подписки
         :return: Справочник из JSON, текст, None в случае веб ошибки
         """
-        if request['opcode'] == 'BarsGetAndSubscribe' and 'prev' not in request:  # Для подписки на новые бары если нет последнего полученного бара (для подписки)
-            request['prev'] = None  # то ставим пустую дату и время последнего полученного бара UTC в секундах
-        self.subscriptions[guid] = request  # Заносим подписку в справочник
-        request['token'] = self.get_jwt_token()  # Получаем JWT токен, ставим его в запрос
+        self.ws_sockets[request.get('shard', 0)].send(self.get_subscribe_frame(request, guid))  # Отправляем запрос в подключение подписки
+
+    def get_subscribe_frame(self, request, guid, token=None) -> str:
+        """Привязка обработчика и подготовка запроса (пере)подписки для отправки на сервер WebSocket
+
+        :param dict request: Запрос
+        :param str guid: Уникальный идентификатор подписки
+        :param str token: Токен JWT. Если не задан, то получаем текущий
+        :return: Запрос JSON в виде текста
+        """
+        self.bind_handler(request, guid)  # Заносим подписку и ее обработчик в справочники
+        request['token'] = token or self.get_jwt_token()  # Ставим JWT токен в запрос
         request['guid'] = guid  # Уникальный идентификатор подписки тоже ставим в запрос
-        self.ws_socket.send(dumps(request))  # Отправляем запрос на сервер подписок и событий WebSocket
+        return self.codec.dumps(self.get_server_request(request))
+
+    def get_server_request(self, request) -> dict:
+        """Запрос подписки без служебных ключей для отправки на сервер WebSocket
+
+        :param dict request: Запрос подписки
+        :return: Запрос для сервера WebSocket
+        """
+        return {key: value for key, value in request.items() if key not in self.subscription_local_keys}
 
     # Выход и закрытие
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Выход из класса, например, с with"""
         self.close_web_socket()  # Закрываем соединение с сервером WebSocket
+        self.executor.shutdown(wait=False)  # Останавливаем потоки пакетных запросов
+        self.nested_executor.shutdown(wait=False)  # Останавливаем потоки окон истории и страниц
+        self.session.close()  # Закрываем соединения пула HTTP API
 
     def __del__(self):
         self.close_web_socket()  # Закрываем соединение с сервером WebSocket
 
     def close_web_socket(self):
-        """Закрытие соединения с сервером WebSocket"""
+        """Закрытие соединения с сервером WebSocket. Атрибуты берем через getattr, т.к. вызывается и из __del__ после ошибки в __init__"""
         self.ws_running = False
-        if self.ws_socket:  # Если работатет сервер подписок и событий WebSocket
-            self.ws_socket.close()  # то закрываем соединение с ним
-        if self.cws_socket:  # Если работает сервер заявок WebSocket
-            self.cws_socket.close()  # то закрываем соединение с ним
+        jwt_token_stop = getattr(self, 'jwt_token_stop', None)
+        if jwt_token_stop:  # Если поток обновления токена JWT был создан
+            jwt_token_stop.set()  # то останавливаем его
+        dispatcher = getattr(self, 'dispatcher', None)
+        if dispatcher:  # Если работают потоки обработки данных подписок
+            dispatcher.stop()  # то останавливаем их
+            self.dispatcher = None
+        for ws_socket in getattr(self, 'ws_sockets', ()):  # Пробегаемся по всем подключениям к серверу подписок и событий WebSocket
+            if ws_socket:  # Если подключение работает
+                ws_socket.close()  # то закрываем его
+        cws_socket = getattr(self, 'cws_socket', None)
+        if cws_socket:  # Если работает сервер заявок WebSocket
+            cws_socket.close()  # то закрываем соединение с ним
 
     # Функции конвертации
 
@@ -2294,22 +3263,7 @@ class AlorPy:
         :param float price: Цена в рублях за штуку
         :return: Цена в Алор
         """
-        si = self.get_symbol_info(exchange, symbol)  # Спецификация тикера
-        board = si['primary_board']  # Режим торгов
-        if board in ('TQOB', 'TQCB', 'TQRD', 'TQIR'):  # Для облигаций (Т+ Гособлигации, Т+ Облигации, Т+ Облигации Д, Т+ Облигации ПИР)
-            nominal = si['facevalue']  # Номинал облигации. Обычно, 1000 руб.
-            alor_price = price * 100 / nominal  # Цена -> % от номинала облигации
-        elif board == 'RFUD':  # Для фьючерсов
-            lot_size = 1 if si['cfiCode'] in ('FCXCSX', 'FFCCSX') else si['facevalue']  # Рамер лота в штуках. Для фьючерсов на сырье и вечных фьючерсов (тип ценной бумаги согласно стандарту ISO 10962) не используется
-            alor_price = price * lot_size
-        elif board == 'CETS':  # Для валют
-            alor_price = price
-        else:  # Для акций
-            alor_price = price
-        decimals = si['decimals']  # Кол-во десятичных знаков
-        min_price_step = si['minstep']  # Шаг цены
-        alor_price = round(alor_price // min_price_step * min_price_step, decimals)  # Проверяем цену в Алор на корректность. Округляем по кол-ву десятичных знаков тикера
-        return int(alor_price) if alor_price.is_integer() else alor_price
+        return self.si_price_to_alor_price(self.get_symbol_info(exchange, symbol), price)
 
     def alor_price_to_price(self, exchange, symbol, alor_price) -> float:
         """Перевод цены Алор в цену в рублях за штуку
@@ -2319,32 +3273,97 @@ class AlorPy:
         :param float alor_price: Цена в Алор
         :return: Цена в рублях за штуку
         """
-        si = self.get_symbol_info(exchange, symbol)  # Спецификация тикера
+        return self.si_alor_price_to_price(self.get_symbol_info(exchange, symbol), alor_price)
+
+    def lots_to_size(self, exchange, symbol, lots) -> int:
+        """Перевод лотов в штуки
+
+        :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
+        :param str symbol: Тикер
+        :param int lots: Кол-во лотов
+        :return: Кол-во штук
+        """
+        return self.si_lots_to_size(self.get_symbol_info(exchange, symbol), lots)
+
+    def size_to_lots(self, exchange, symbol, size) -> int:
+        """Перевод штуки в лоты
+
+        :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
+        :param str symbol: Тикер
+        :param int size: Кол-во штук
+        :return: Кол-во лотов
+        """
+        return self.si_size_to_lots(self.get_symbol_info(exchange, symbol), size)
+
+    @staticmethod
+    def si_price_to_alor_price(si, price) -> int | float:
+        """Перевод цены в рублях за штуку в цену Алор по спецификации тикера
+
+        :param dict si: Спецификация тикера
+        :param float price: Цена в рублях за штуку
+        :return: Цена в Алор
+        """
+        alor_price = AlorPy.si_price_to_alor_units(si, price)  # Цена в единицах Алор
         decimals = si['decimals']  # Кол-во десятичных знаков
         min_price_step = si['minstep']  # Шаг цены
         alor_price = round(alor_price // min_price_step * min_price_step, decimals)  # Проверяем цену в Алор на корректность. Округляем по кол-ву десятичных знаков тикера
+        return int(alor_price) if alor_price.is_integer() else alor_price
+
+    @staticmethod
+    def si_alor_price_to_price(si, alor_price) -> float:
+        """Перевод цены Алор в цену в рублях за штуку по спецификации тикера
+
+        :param dict si: Спецификация тикера
+        :param float alor_price: Цена в Алор
+        :return: Цена в рублях за штуку
+        """
+        decimals = si['decimals']  # Кол-во десятичных знаков
+        min_price_step = si['minstep']  # Шаг цены
+        alor_price = round(alor_price // min_price_step * min_price_step, decimals)  # Проверяем цену в Алор на корректность. Округляем по кол-ву десятичных знаков тикера
+        return AlorPy.si_alor_units_to_price(si, alor_price)  # Цена в рублях за штуку
+
+    @staticmethod
+    def si_price_to_alor_units(si, price):
+        """Перевод цены в рублях за штуку в единицы цены Алор без проверки шага цены. Одни и те же действия для числа и массива NumPy
+
+        :param dict si: Спецификация тикера
+        :param price: Цена в рублях за штуку. Число или массив NumPy
+        :return: Цена в единицах Алор
+        """
         board = si['primary_board']  # Режим торгов
         if board in ('TQOB', 'TQCB', 'TQRD', 'TQIR'):  # Для облигаций (Т+ Гособлигации, Т+ Облигации, Т+ Облигации Д, Т+ Облигации ПИР)
             nominal = si['facevalue']  # Номинал облигации. Обычно, 1000 руб.
-            price = alor_price / 100 * nominal  # % от номинала облигации -> Цена
-        elif board == 'RFUD':  # Для фьючерсов
+            return price * 100 / nominal  # Цена -> % от номинала облигации
+        if board == 'RFUD':  # Для фьючерсов
             lot_size = 1 if si['cfiCode'] in ('FCXCSX', 'FFCCSX') else si['facevalue']  # Рамер лота в штуках. Для фьючерсов на сырье и вечных фьючерсов (тип ценной бумаги согласно стандарту ISO 10962) не используется
-            price = alor_price / lot_size
-        elif board == 'CETS':  # Для валют
-            price = alor_price
-        else:  # Для акций
-            price = alor_price
-        return price  # Цена в рублях за штуку
+            return price * lot_size
+        return price  # Для валют и акций
 
-    def lots_to_size(self, exchange, symbol, lots) -> int:
-        """Перевод лотов в штуки
+    @staticmethod
+    def si_alor_units_to_price(si, alor_price):
+        """Перевод цены в единицах Алор в цену в рублях за штуку. Одни и те же действия для числа и массива NumPy
 
-        :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
-        :param str symbol: Тикер
+        :param dict si: Спецификация тикера
+        :param alor_price: Цена в Алор. Число или массив NumPy
+        :return: Цена в рублях за штуку
+        """
+        board = si['primary_board']  # Режим торгов
+        if board in ('TQOB', 'TQCB', 'TQRD', 'TQIR'):  # Для облигаций (Т+ Гособлигации, Т+ Облигации, Т+ Облигации Д, Т+ Облигации ПИР)
+            nominal = si['facevalue']  # Номинал облигации. Обычно, 1000 руб.
+            return alor_price / 100 * nominal  # % от номинала облигации -> Цена
+        if board == 'RFUD':  # Для фьючерсов
+            lot_size = 1 if si['cfiCode'] in ('FCXCSX', 'FFCCSX') else si['facevalue']  # Рамер лота в штуках. Для фьючерсов на сырье и вечных фьючерсов (тип ценной бумаги согласно стандарту ISO 10962) не используется
+            return alor_price / lot_size
+        return alor_price  # Для валют и акций
+
+    @staticmethod
+    def si_lots_to_size(si, lots) -> int:
+        """Перевод лотов в штуки по спецификации тикера
+
+        :param dict|None si: Спецификация тикера
         :param int lots: Кол-во лотов
         :return: Кол-во штук
         """
-        si = self.get_symbol_info(exchange, symbol)  # Спецификация тикера
         if si is None:  # Если тикер не найден
             return lots  # то возвращаем кол-во в лотах
         primary_board = si['primary_board']  # Код режима торгов
@@ -2355,15 +3374,14 @@ class AlorPy:
             return lots  # то возвращаем кол-во в лотах
         return int(lots * lot_size)  # В остальных случаях возвращаем кол-во в штуках
 
-    def size_to_lots(self, exchange, symbol, size) -> int:
-        """Перевод штуки в лоты
+    @staticmethod
+    def si_size_to_lots(si, size) -> int:
+        """Перевод штуки в лоты по спецификации тикера
 
-        :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
-        :param str symbol: Тикер
+        :param dict|None si: Спецификация тикера
         :param int size: Кол-во штук
         :return: Кол-во лотов
         """
-        si = self.get_symbol_info(exchange, symbol)  # Спецификация тикера
         if si is None:  # Если тикер не найден
             return size  # то возвращаем кол-во в штуках
         primary_board = si['primary_board']  # Код режима торгов
@@ -2374,6 +3392,125 @@ class AlorPy:
             return size  # то возвращаем кол-во в штуках
         return size // lot_size  # В остальных случаях возвращаем кол-во в лотах
 
+    def prices_to_alor_prices(self, exchange, symbol, prices):
+        """Перевод массива цен в рублях за штуку в цены Алор. Нужен NumPy
+
+        :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
+        :param str symbol: Тикер
+        :param prices: Цены в рублях за штуку. Массив NumPy, pandas Series или список
+        :return: Цены в Алор. pandas Series для pandas Series, иначе массив NumPy
+        """
+        return self.si_prices_to_alor_prices(self.get_symbol_info(exchange, symbol), prices)
+
+    def alor_prices_to_prices(self, exchange, symbol, alor_prices):
+        """Перевод массива цен Алор в цены в рублях за штуку. Нужен NumPy
+
+        :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
+        :param str symbol: Тикер
+        :param alor_prices: Цены в Алор. Массив NumPy, pandas Series или список
+        :return: Цены в рублях за штуку. pandas Series для pandas Series, иначе массив NumPy
+        """
+        return self.si_alor_prices_to_prices(self.get_symbol_info(exchange, symbol), alor_prices)
+
+    def lots_to_sizes(self, exchange, symbol, lots):
+        """Перевод массива лотов в штуки. Нужен NumPy
+
+        :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
+        :param str symbol: Тикер
+        :param lots: Кол-во лотов. Массив NumPy, pandas Series или список
+        :return: Кол-во штук. pandas Series для pandas Series, иначе массив NumPy
+        """
+        return self.si_lots_to_sizes(self.get_symbol_info(exchange, symbol), lots)
+
+    def sizes_to_lots(self, exchange, symbol, sizes):
+        """Перевод массива штук в лоты. Нужен NumPy
+
+        :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
+        :param str symbol: Тикер
+        :param sizes: Кол-во штук. Массив NumPy, pandas Series или список
+        :return: Кол-во лотов. pandas Series для pandas Series, иначе массив NumPy
+        """
+        return self.si_sizes_to_lots(self.get_symbol_info(exchange, symbol), sizes)
+
+    @staticmethod
+    def to_array(values, dtype):
+        """Массив NumPy из значений без копирования, если тип совпадает
+
+        :param values: Массив NumPy, pandas Series или список
+        :param dtype: Тип значений NumPy
+        :return: Массив NumPy
+        """
+        if np is None:  # Если NumPy не установлен
+            raise ImportError('Для перевода массивов установите NumPy: pip install numpy')
+        return np.asarray(values, dtype=dtype)
+
+    @staticmethod
+    def like(values, result):
+        """Результат перевода в виде исходных значений
+
+        :param values: Исходные значения. Массив NumPy, pandas Series или список
+        :param result: Массив NumPy с результатом перевода
+        :return: pandas Series с индексом исходных значений для pandas Series, иначе массив NumPy
+        """
+        index = getattr(values, 'index', None)  # Индекс есть только у pandas Series. У списка index - функция
+        return type(values)(result, index=index) if index is not None and not callable(index) else result
+
+    @classmethod
+    def si_prices_to_alor_prices(cls, si, prices):
+        """Перевод массива цен в рублях за штуку в цены Алор по спецификации тикера за один проход
+
+        :param dict si: Спецификация тикера
+        :param prices: Цены в рублях за штуку. Массив NumPy, pandas Series или список
+        :return: Цены в Алор, как в si_price_to_alor_price. Целые, если все цены целые
+        """
+        alor_prices = cls.si_price_to_alor_units(si, cls.to_array(prices, 'f8'))  # Те же действия в том же порядке, что и для одной цены
+        decimals = si['decimals']  # Кол-во десятичных знаков
+        min_price_step = si['minstep']  # Шаг цены
+        alor_prices = np.round(alor_prices // min_price_step * min_price_step, decimals)  # Проверяем цены в Алор на корректность. Округляем по кол-ву десятичных знаков тикера
+        if np.all(alor_prices == np.floor(alor_prices)):  # Если все цены целые
+            alor_prices = alor_prices.astype('int64')  # то возвращаем целые, как и для одной цены
+        return cls.like(prices, alor_prices)
+
+    @classmethod
+    def si_alor_prices_to_prices(cls, si, alor_prices):
+        """Перевод массива цен Алор в цены в рублях за штуку по спецификации тикера за один проход
+
+        :param dict si: Спецификация тикера
+        :param alor_prices: Цены в Алор. Массив NumPy, pandas Series или список
+        :return: Цены в рублях за штуку, как в si_alor_price_to_price
+        """
+        decimals = si['decimals']  # Кол-во десятичных знаков
+        min_price_step = si['minstep']  # Шаг цены
+        values = cls.to_array(alor_prices, 'f8')
+        values = np.round(values // min_price_step * min_price_step, decimals)  # Проверяем цены в Алор на корректность. Округляем по кол-ву десятичных знаков тикера
+        return cls.like(alor_prices, cls.si_alor_units_to_price(si, values))  # Те же действия в том же порядке, что и для одной цены
+
+    @classmethod
+    def si_lots_to_sizes(cls, si, lots):
+        """Перевод массива лотов в штуки по спецификации тикера за один проход
+
+        :param dict|None si: Спецификация тикера
+        :param lots: Кол-во лотов. Массив NumPy, pandas Series или список
+        :return: Кол-во штук
+        """
+        values = cls.to_array(lots, 'i8')
+        if si is None or si['primary_board'] == 'RFUD' or si['lotsize'] is None:  # Если тикер не найден, для фьючерсов, или не задано кол-во штук в лоте
+            return cls.like(lots, values)  # то возвращаем кол-во в лотах
+        return cls.like(lots, (values * si['lotsize']).astype('int64'))
+
+    @classmethod
+    def si_sizes_to_lots(cls, si, sizes):
+        """Перевод массива штук в лоты по спецификации тикера за один проход
+
+        :param dict|None si: Спецификация тикера
+        :param sizes: Кол-во штук. Массив NumPy, pandas Series или список
+        :return: Кол-во лотов
+        """
+        values = cls.to_array(sizes, 'i8')
+        if si is None or si['primary_board'] == 'RFUD' or si['lotsize'] is None:  # Если тикер не найден, для фьючерсов, или не задано кол-во штук в лоте
+            return cls.like(sizes, values)  # то возвращаем кол-во в штуках
+        return cls.like(sizes, values // int(si['lotsize']))
+
     def msk_datetime_to_timestamp(self, dt) -> int:
         """Перевод московского времени в кол-во секунд, прошедших с 01.01.1970 00:00 UTC
 
@@ -2394,6 +3531,38 @@ class AlorPy:
         dt_utc = datetime.fromtimestamp(seconds, timezone.utc)  # Переводим кол-во секунд, прошедших с 01.01.1970 в UTC
         return dt_utc.astimezone(self.tz_msk).replace(tzinfo=None)  # Заданное время ставим в зону МСК. Убираем временнУю зону
 
+    def get_msk_offsets(self, seconds, local=False):
+        """Смещения московского времени от UTC. Смещение считается один раз на каждый час, т.к. переходы времени бывают только в начале часа
+
+        :param seconds: Массив NumPy кол-ва секунд
+        :param bool local: Секунды московского времени. По умолчанию секунды UTC
+        :return: Массив NumPy смещений в секундах
+        """
+        hours, inverse = np.unique(seconds // 3600, return_inverse=True)  # Уникальные часы
+        if local:  # Для московского времени смещение берем по времени без временнОй зоны
+            offsets = [self.tz_msk.utcoffset(datetime.fromtimestamp(int(hour) * 3600, timezone.utc).replace(tzinfo=None)) for hour in hours]
+        else:  # Для UTC смещение берем по моменту времени
+            offsets = [datetime.fromtimestamp(int(hour) * 3600, self.tz_msk).utcoffset() for hour in hours]
+        return np.array([int(offset.total_seconds()) for offset in offsets], dtype='i8')[inverse.reshape(-1)]
+
+    def msk_datetimes_to_timestamps(self, dts):
+        """Перевод массива московского времени в кол-во секунд, прошедших с 01.01.1970 00:00 UTC. Нужен NumPy
+
+        :param dts: Московское время без временнОй зоны. Массив NumPy datetime64, pandas Series или список datetime
+        :return: Кол-во секунд. pandas Series для pandas Series, иначе массив NumPy
+        """
+        seconds = self.to_array(dts, 'datetime64[s]').astype('i8')  # Секунды московского времени
+        return self.like(dts, seconds - self.get_msk_offsets(seconds, local=True))
+
+    def timestamps_to_msk_datetimes(self, seconds):
+        """Перевод массива кол-ва секунд, прошедших с 01.01.1970 00:00 UTC, в московское время. Нужен NumPy
+
+        :param seconds: Кол-во секунд. Массив NumPy, pandas Series или список
+        :return: Московское время без временнОй зоны datetime64. pandas Series для pandas Series, иначе массив NumPy
+        """
+        values = self.to_array(seconds, 'i8')
+        return self.like(seconds, (values + self.get_msk_offsets(values)).astype('datetime64[s]'))
+
     def msk_to_utc_datetime(self, dt, tzinfo=False) -> datetime:
         """Перевод времени из московского в UTC
 
@@ -2419,6 +3588,394 @@ class AlorPy:
         return dt_msk if tzinfo else dt_msk.replace(tzinfo=None)
 
 
+class RateLimitError(Exception):
+    """Лимит запросов превышен после всех повторов"""
+    def __init__(self, path_url):
+        """Инициализация
+
+        :param str path_url: Запрос
+        """
+        super().__init__(f'Превышен лимит запросов Запрос: {path_url}')
+        self.path_url = path_url  # Запрос
+
+
+class PageLoadError(Exception):
+    """Страница постраничного запроса не получена после всех попыток"""
+    def __init__(self, start):
+        """Инициализация
+
+        :param int start: Смещение или начальный номер записи страницы
+        """
+        super().__init__(f'Страница с {start} не получена')
+        self.start = start  # Смещение или начальный номер записи страницы
+
+
+class AlorSession(Session):
+    """Сессия HTTP API с ограничением кол-ва одновременных запросов к одному серверу, частоты запросов и повтором запросов при превышении лимитов"""
+    retry_methods = frozenset({'GET', 'PUT', 'DELETE'})  # Методы, запросы которых повторяем при ошибках сервера 5xx. POST запросы повторяем только при превышении лимита 429
+    no_retry_classes = frozenset({'command'})  # Классы запросов, которые не повторяем с задержкой. Ответ с ошибкой на торговую команду возвращаем сразу
+
+    def __init__(self, host_limit, rate_limits=None, status_retries=5, backoff=0.5, backoff_max=10, tracer=None):
+        """Инициализация
+
+        :param int host_limit: Максимальное кол-во одновременных запросов к одному серверу
+        :param dict rate_limits: Максимальное кол-во запросов в секунду по классам запросов 'market', 'client', 'command'. Без ограничения, если не задано
+        :param int status_retries: Кол-во повторов запроса при превышении лимита 429 и ошибках сервера 5xx
+        :param float backoff: Начальная задержка перед повтором запроса в секундах. Удваивается с каждым повтором
+        :param float backoff_max: Максимальная задержка перед повтором запроса в секундах
+        :param Tracer tracer: Трассировка запросов. None - без трассировки
+        """
+        super().__init__()
+        self.tracer = tracer  # Трассировка запросов
+        self.host_limit = host_limit  # Максимальное кол-во одновременных запросов к одному серверу
+        self.host_semaphores: dict[str, BoundedSemaphore] = {}  # Ограничители запросов по серверам
+        self.host_semaphores_lock = Lock()  # Блокировка создания ограничителей
+        self.rate_limiters = {endpoint_class: RateLimiter(rate) for endpoint_class, rate in (rate_limits or {}).items()}  # Ограничители частоты запросов по классам запросов. Общие для всех потоков
+        self.status_retries = status_retries  # Кол-во повторов запроса
+        self.backoff = backoff  # Начальная задержка перед повтором запроса
+        self.backoff_max = backoff_max  # Максимальная задержка перед повтором запроса
+
+    @staticmethod
+    def get_endpoint_class(path) -> str:
+        """Класс запроса для ограничения частоты запросов
+
+        :param str path: Путь запроса
+        :return: 'command' - запросы торговых команд, 'client' - запросы данных клиента, 'market' - запросы рыночных данных
+        """
+        path = path.lower()  # Пути запросов Алор не зависят от регистра
+        if path.startswith(('/commandapi/', '/warptrans/')):  # Биржевые, условные заявки и группы заявок
+            return 'command'
+        if path.startswith(('/md/v2/clients/', '/md/v2/stats/', '/client/')):  # Позиции, заявки, сделки, риски клиента
+            return 'client'
+        return 'market'  # Инструменты, котировки, стаканы, история и т.д.
+
+    def get_retry_delay(self, response, attempt) -> float:
+        """Задержка перед повтором запроса
+
+        :param response: Ответ сервера с ошибкой
+        :param int attempt: Номер попытки, начиная с 0
+        :return: Задержка в секундах. Из заголовка Retry-After, если он есть. Иначе, экспоненциальная со случайной добавкой
+        """
+        retry_after = response.headers.get('Retry-After')  # Сервер может сообщить, через сколько секунд повторить запрос
+        if retry_after and retry_after.replace('.', '', 1).isdigit():  # Если задержка задана в секундах
+            return min(float(retry_after), self.backoff_max)
+        return min(self.backoff * 2 ** attempt, self.backoff_max) * (0.5 + random() / 2)  # Экспоненциальная задержка. Случайная добавка разводит повторы разных потоков
+
+    def request(self, method, url, *args, **kwargs) -> Response:
+        """Выполнение запроса с ожиданием свободного места в лимитах сервера и класса запросов. Повтор запроса при превышении лимита 429 и ошибках сервера 5xx"""
+        url_parts = urlsplit(url)  # Части адреса запроса
+        host = url_parts.netloc  # Сервер запроса
+        semaphore = self.host_semaphores.get(host)  # Ограничитель запросов к серверу
+        if semaphore is None:  # Если к серверу еще не было запросов
+            with self.host_semaphores_lock:  # то создаем ограничитель только в одном потоке
+                semaphore = self.host_semaphores.setdefault(host, BoundedSemaphore(self.host_limit))
+        endpoint_class = self.get_endpoint_class(url_parts.path)  # Класс запроса
+        rate_limiter = self.rate_limiters.get(endpoint_class)  # Ограничитель частоты запросов класса
+        attempt = 0  # Номер попытки
+        while True:
+            if rate_limiter:  # Если частота запросов класса ограничена
+                rate_limiter.acquire()  # то ждем своей очереди
+            with semaphore:  # Ждем, пока кол-во одновременных запросов к серверу не станет меньше лимита
+                if self.tracer is None:  # Если трассировка выключена
+                    response = super().request(method, url, *args, **kwargs)  # то только выполняем запрос
+                else:  # Если трассировка включена
+                    start = monotonic()  # Время начала запроса
+                    response = super().request(method, url, *args, **kwargs)
+                    self.tracer.trace(method.upper(), response.request.path_url, response.status_code, response.content, monotonic() - start, attempt)  # Трассируем каждую попытку
+            status_code = response.status_code  # Код ответа
+            throttled = status_code == 429  # Превышен лимит запросов
+            if not throttled and not (status_code >= 500 and method.upper() in self.retry_methods):  # Если повтор запроса не нужен
+                if rate_limiter and status_code < 400:  # Если частота запросов класса ограничена, и запрос выполнен
+                    rate_limiter.succeeded()  # то постепенно возвращаем частоту к максимальной
+                return response
+            if attempt >= self.status_retries or endpoint_class in self.no_retry_classes:  # Если попытки закончились, или торговую команду не повторяем
+                return response  # то возвращаем ответ с ошибкой
+            delay = self.get_retry_delay(response, attempt)  # Задержка перед повтором запроса
+            if throttled and rate_limiter:  # Если превышен лимит запросов класса
+                rate_limiter.throttled(delay)  # то снижаем частоту и приостанавливаем запросы класса во всех потоках
+            else:  # Если ошибка сервера или частота не ограничена
+                sleep(delay)  # то ждем перед повтором только в этом потоке
+            attempt += 1
+
+
+class RateLimiter:
+    """Ограничитель частоты запросов (token bucket). Частота снижается при превышении лимита сервера и постепенно восстанавливается"""
+    def __init__(self, rate, burst=None):
+        """Инициализация
+
+        :param float rate: Максимальное кол-во запросов в секунду
+        :param int burst: Максимальное кол-во запросов, которые можно выполнить сразу. По умолчанию rate
+        """
+        self.max_rate = rate  # Максимальная частота запросов
+        self.rate = rate  # Текущая частота запросов
+        self.burst = burst or rate  # Размер корзины
+        self.tokens = self.burst  # Доступные запросы. Отрицательное значение - запросы, ожидающие своей очереди
+        self.updated = monotonic()  # Время последнего пополнения корзины
+        self.lock = Lock()  # Корзина общая для всех потоков
+
+    def reserve(self) -> float:
+        """Резервирование запроса
+
+        :return: Время ожидания очереди запроса в секундах
+        """
+        with self.lock:
+            now = monotonic()  # Текущее время
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)  # Пополняем корзину за прошедшее время
+            self.updated = now
+            self.tokens -= 1  # Забираем запрос из корзины
+            return -self.tokens / self.rate if self.tokens < 0 else 0  # Если корзина пуста, то ждем ее пополнения
+
+    def acquire(self) -> None:
+        """Ожидание очереди запроса"""
+        delay = self.reserve()  # Время ожидания очереди запроса
+        if delay > 0:  # Если нужно подождать
+            sleep(delay)  # то ждем
+
+    def throttled(self, delay) -> None:
+        """Превышен лимит сервера. Вдвое снижаем частоту запросов и приостанавливаем все запросы на время задержки
+
+        :param float delay: Время приостановки запросов в секундах
+        """
+        with self.lock:
+            self.rate = max(self.rate / 2, self.max_rate / 16)  # Снижаем частоту запросов не более, чем в 16 раз от максимальной
+            self.tokens = min(self.tokens, -delay * self.rate)  # Следующие запросы будут выполнены не раньше, чем через время задержки
+
+    def succeeded(self) -> None:
+        """Запрос выполнен. Постепенно восстанавливаем частоту запросов"""
+        if self.rate < self.max_rate:  # Если частота запросов была снижена
+            with self.lock:
+                self.rate = min(self.rate + self.max_rate / 20, self.max_rate)  # то восстанавливаем ее за 20 удачных запросов
+
+
+class JsonCodec:
+    """Кодек JSON. Использует orjson или msgspec, если они установлены, иначе стандартную библиотеку json"""
+    def __init__(self, backend=None):
+        """Инициализация
+
+        :param str backend: Библиотека JSON: 'orjson', 'msgspec', 'json'. По умолчанию первая установленная
+        """
+        if backend is None:  # Если библиотека не задана
+            backend = 'orjson' if orjson else 'msgspec' if msgspec else 'json'  # то выбираем самую быструю из установленных
+        self.backend = backend  # Библиотека JSON
+        if backend == 'orjson':
+            self.loads = orjson.loads  # Декодирует JSON из байт и текста
+            self.dumps = lambda obj: orjson.dumps(obj).decode('utf-8')  # WebSocket сервер Алор принимает текстовые сообщения
+            self.decode_errors = (orjson.JSONDecodeError,)
+        elif backend == 'msgspec':
+            self.loads = msgspec.json.decode  # Декодирует JSON из байт и текста
+            self.dumps = lambda obj: msgspec.json.encode(obj).decode('utf-8')  # WebSocket сервер Алор принимает текстовые сообщения
+            self.decode_errors = (msgspec.DecodeError,)
+        elif backend == 'json':
+            self.loads = json.loads  # Декодирует JSON из байт (UTF-8) и текста
+            self.dumps = json.dumps
+            self.decode_errors = (json.JSONDecodeError, UnicodeDecodeError)
+        else:  # Неизвестная библиотека
+            raise ValueError(f'Библиотека JSON {backend} не поддерживается')
+
+
+AlorPy.codec = JsonCodec()  # Кодек по умолчанию для всех экземпляров. Можно заменить для класса или экземпляра
+AlorPy.subscription_handlers = {  # Обработчики подписок по умолчанию. Новые типы подписок добавляются через AlorPy.register_subscription_handler
+    'OrderBookGetAndSubscribe': AlorPy.event_handler('on_change_order_book'),  # Биржевой стакан
+    'BarsGetAndSubscribe': AlorPy.new_bar_handler,  # Новый бар
+    'QuotesSubscribe': AlorPy.event_handler('on_new_quotes'),  # Котировки
+    'AllTradesGetAndSubscribe': AlorPy.event_handler('on_all_trades'),  # Все сделки
+    'PositionsGetAndSubscribeV2': AlorPy.event_handler('on_position'),  # Позиции по ценным бумагам и деньгам
+    'SummariesGetAndSubscribeV2': AlorPy.event_handler('on_summary'),  # Сводная информация по портфелю
+    'RisksGetAndSubscribe': AlorPy.event_handler('on_risk'),  # Портфельные риски
+    'SpectraRisksGetAndSubscribe': AlorPy.event_handler('on_spectra_risk'),  # Риски срочного рынка (FORTS)
+    'TradesGetAndSubscribeV2': AlorPy.event_handler('on_trade'),  # Сделки
+    'StopOrdersGetAndSubscribe': AlorPy.event_handler('on_stop_order'),  # Стоп заявки
+    'StopOrdersGetAndSubscribeV2': AlorPy.event_handler('on_stop_order_v2'),  # Стоп заявки v2
+    'OrdersGetAndSubscribeV2': AlorPy.event_handler('on_order'),  # Заявки
+    'InstrumentsGetAndSubscribeV2': AlorPy.event_handler('on_symbol'),  # Информация о финансовых инструментах
+}
+
+
+class Tracer:
+    """Трассировка запросов HTTP API: метод, путь, код ответа, размер ответа и время выполнения. Тело ответа сохраняется выборочно"""
+    logger = logging.getLogger('AlorPy.Tracer')  # Лог трассировки по умолчанию
+
+    def __init__(self, callback=None, sample_rate=0.0, max_body=4096):
+        """Инициализация
+
+        :param callback: Функция, получающая справочник трассировки запроса. По умолчанию запись в лог AlorPy.Tracer с уровнем INFO
+        :param float sample_rate: Доля запросов от 0 до 1, для которых сохраняется тело ответа. 0 - не сохранять
+        :param int max_body: Максимальный размер сохраняемого тела ответа в байтах
+        """
+        self.callback = callback  # Функция, получающая трассировку
+        self.sample_rate = sample_rate  # Доля запросов с телом ответа
+        self.max_body = max_body  # Максимальный размер тела ответа
+
+    def trace(self, method, path, status_code, content, latency, attempt=0):
+        """Трассировка выполненного запроса
+
+        :param str method: Метод запроса
+        :param str path: Путь запроса с параметрами
+        :param int status_code: Код ответа
+        :param bytes content: Ответ в байтах
+        :param float latency: Время выполнения запроса в секундах
+        :param int attempt: Номер попытки, начиная с 0
+        """
+        body = content[:self.max_body] if self.sample_rate and random() < self.sample_rate else None  # Тело ответа сохраняем выборочно
+        if self.callback:  # Если задана функция трассировки
+            self.callback({'method': method, 'path': path, 'status': status_code, 'bytes': len(content), 'latency': latency, 'attempt': attempt, 'body': body})
+        elif self.logger.isEnabledFor(logging.INFO):  # Иначе, пишем в лог, если он включен
+            self.logger.info('%s %s %s %d байт %.1f мс попытка %d%s', method, path, status_code, len(content), latency * 1000, attempt, '' if body is None else f' {body.decode("utf-8", "replace")}')
+
+
+class DispatchQueue:
+    """Ограниченная очередь данных подписок потока обработки"""
+    policies = ('block', 'drop_oldest', 'coalesce')  # Действия при заполненной очереди
+
+    def __init__(self, maxsize, policy='block'):
+        """Инициализация
+
+        :param int maxsize: Максимальное кол-во данных в очереди
+        :param str policy: Действие при заполненной очереди: 'block' - ждать обработки, 'drop_oldest' - удалить самые старые данные, 'coalesce' - заменить ждущие данные той же подписки новыми
+        """
+        if policy not in self.policies:  # Неизвестное действие
+            raise ValueError(f'Действие при заполненной очереди {policy} не поддерживается')
+        self.maxsize = maxsize  # Максимальное кол-во данных в очереди
+        self.policy = policy  # Действие при заполненной очереди
+        self.items = deque()  # Данные подписок [guid, данные, кол-во пропущенных данных] в порядке поступления
+        self.pending = {}  # Последние ждущие данные по подпискам для замены при 'coalesce' и для подписок только с последними данными
+        self.condition = Condition()  # Ожидание данных и места в очереди
+        self.running = True  # Очередь работает
+        self.dropped = 0  # Кол-во удаленных или замененных данных
+
+    def put(self, guid, response, conflate=False):
+        """Постановка данных подписки в очередь
+
+        :param str guid: Уникальный идентификатор подписки
+        :param dict response: Данные подписки
+        :param bool conflate: Заменить ждущие обработки данные этой подписки новыми
+        """
+        with self.condition:
+            if conflate and guid in self.pending:  # Если обрабатываем только последние данные, и данные подписки ждут обработки
+                slot = self.pending[guid]  # то заменяем их новыми, сохраняя место в очереди
+                slot[1] = response
+                slot[2] += 1  # Кол-во пропущенных данных
+                return
+            if len(self.items) >= self.maxsize:  # Если очередь заполнена
+                if self.policy == 'coalesce' and guid in self.pending:  # Если ждут обработки данные этой же подписки
+                    self.pending[guid][1] = response  # то заменяем их новыми, сохраняя место в очереди
+                    self.dropped += 1
+                    return
+                if self.policy == 'drop_oldest':  # Если удаляем самые старые данные
+                    old_guid, _, _ = slot = self.items.popleft()  # то удаляем их
+                    if self.pending.get(old_guid) is slot:
+                        del self.pending[old_guid]
+                    self.dropped += 1
+                while len(self.items) >= self.maxsize and self.running:  # Ждем места в очереди
+                    self.condition.wait()
+            slot = [guid, response, 0 if conflate else None]  # Место в очереди
+            self.items.append(slot)
+            if conflate or self.policy == 'coalesce':  # Если данные подписки могут быть заменены
+                self.pending[guid] = slot  # то запоминаем место последних данных подписки
+            self.condition.notify_all()  # Будим поток обработки
+
+    def get(self):
+        """Получение данных подписки из очереди. Ожидание, если очередь пуста
+
+        :return: Данные подписки. None, если очередь остановлена
+        """
+        with self.condition:
+            while not self.items:  # Пока очередь пуста
+                if not self.running:  # Если очередь остановлена
+                    return None
+                self.condition.wait()  # то ждем данных
+            guid, response, skipped = slot = self.items.popleft()
+            if self.pending.get(guid) is slot:  # Если это последние данные подписки
+                del self.pending[guid]  # то больше их не заменяем
+            if skipped is not None:  # Если обрабатываем только последние данные подписки
+                response['skipped'] = skipped  # то передаем кол-во пропущенных данных
+            self.condition.notify_all()  # Будим поток чтения, если он ждет места в очереди
+            return response
+
+    def stop(self):
+        """Остановка очереди. Ждущие данные удаляются"""
+        with self.condition:
+            self.running = False
+            self.items.clear()
+            self.pending.clear()
+            self.condition.notify_all()
+
+
+class Dispatcher:
+    """Потоки обработки данных подписок. Данные одной подписки обрабатываются по порядку в одном потоке"""
+    def __init__(self, dispatch, workers=1, queue_size=10000, policy='block', logger=None):
+        """Инициализация и запуск потоков
+
+        :param dispatch: Функция разбора данных подписки
+        :param int workers: Кол-во потоков обработки
+        :param int queue_size: Максимальное кол-во данных в очереди каждого потока
+        :param str policy: Действие при заполненной очереди: 'block', 'drop_oldest', 'coalesce'
+        :param logger: Лог ошибок обработчиков
+        """
+        self.dispatch = dispatch  # Функция разбора данных подписки
+        self.logger = logger or logging.getLogger('AlorPy')  # Лог ошибок обработчиков
+        self.queues = [DispatchQueue(queue_size, policy) for _ in range(workers)]  # Очереди потоков
+        for i, queue in enumerate(self.queues):  # Каждый поток обрабатывает свою очередь
+            Thread(target=self.worker, args=(queue,), name=f'DispatchThread{i}', daemon=True).start()
+
+    @property
+    def dropped(self) -> int:
+        """Кол-во удаленных или замененных данных во всех очередях"""
+        return sum(queue.dropped for queue in self.queues)
+
+    def put(self, response, conflate=False):
+        """Постановка данных подписки в очередь потока подписки
+
+        :param dict response: Данные подписки
+        :param bool conflate: Заменить ждущие обработки данные этой подписки новыми
+        """
+        guid = response.get('guid')  # Сервисные сообщения приходят без GUID
+        self.queues[hash(guid) % len(self.queues)].put(guid, response, conflate)  # Подписка всегда попадает в одну очередь
+
+    def worker(self, queue):
+        """Поток обработки данных подписок
+
+        :param DispatchQueue queue: Очередь потока
+        """
+        while True:
+            response = queue.get()  # Ждем данные подписки
+            if response is None:  # Если очередь остановлена
+                return  # то выходим из потока
+            try:
+                self.dispatch(response)  # Разбираем данные подписки
+            except Exception as ex:  # Ошибка обработчика не должна останавливать поток
+                self.logger.error(f'Dispatch Thread: Ошибка обработчика {ex}')
+
+    def stop(self):
+        """Остановка потоков"""
+        for queue in self.queues:
+            queue.stop()
+
+
+class Subscription(str):
+    """Подписка. Уникальный идентификатор подписки с отменой"""
+    acknowledged = None  # Подтверждение подписки сервером для subscribe_many: True - оформлена, False - отклонена, None - неизвестно
+
+    def __new__(cls, guid, ap):
+        """Создание подписки
+
+        :param str guid: Уникальный идентификатор подписки
+        :param AlorPy ap: Провайдер, через который оформлена подписка
+        """
+        subscription = super().__new__(cls, guid)
+        subscription.ap = ap  # Провайдер
+        return subscription
+
+    @property
+    def guid(self) -> str:
+        """Уникальный идентификатор подписки"""
+        return str(self)
+
+    def unsubscribe(self):
+        """Отмена подписки"""
+        return self.ap.unsubscribe(self.guid)
+
+
 class Event:
     """Событие с подпиской / отменой подписки"""
     def __init__(self):
@@ -0,0 +1,824 @@
+import asyncio  # Асинхронный режим работы
+import ssl
+from collections import deque  # Очередь загружаемых страниц
+from time import time, monotonic  # Текущее время в секундах, прошедших с 01.01.1970 UTC. Время выполнения запроса
+from math import log10  # Кол-во десятичных знаков будем получать из шага цены через десятичный логарифм
+from types import SimpleNamespace  # Объект запроса в ответе
+from urllib.parse import urlsplit  # Путь из адреса запроса
+from random import random  # Случайная добавка к задержке перед повтором запроса
+from uuid import uuid4  # Номера подписок должны быть уникальными во времени и пространстве
+from functools import partial  # Запросы пакета и окна истории запускаем по мере освобождения мест
+from contextlib import nullcontext  # Завершение баров без блокировки
+
+try:
+    import aiohttp  # Асинхронные запросы/ответы через HTTP API
+except ImportError:  # Если aiohttp не установлен
+    aiohttp = None  # то асинхронная версия недоступна. Синхронная версия работает без aiohttp
+from websockets.asyncio.client import connect  # Подключение к серверу WebSockets в асинхронном режиме
+from websockets.exceptions import ConnectionClosed  # Событие закрытия соединения сервера WebSockets
+
+from .AlorPy import AlorPy, AlorSession, RateLimiter, RateLimitError, PageLoadError, Subscription, OrderBook, BarAggregator, TickStore  # Запросы, подписки и функции конвертации берем из синхронной версии
+
+
+class AsyncResponse:
+    """Ответ асинхронного запроса в формате requests.Response"""
+    def __init__(self, status_code, content, path_url):
+        self.status_code = status_code  # Код ответа
+        self.content = content  # Ответ в байтах
+        self.request = SimpleNamespace(path_url=path_url)  # Путь запроса с параметрами
+
+
+class AsyncSession:
+    """Асинхронная сессия HTTP API с пулом соединений. Методы повторяют requests.Session, но возвращают корутины"""
+    def __init__(self, limit=100, rate_limits=None, status_retries=5, backoff=0.5, backoff_max=10, tracer=None, host_limit=10):
+        """Инициализация
+
+        :param int limit: Максимальное кол-во одновременных соединений
+        :param int host_limit: Максимальное кол-во одновременных соединений с одним сервером
+        :param dict rate_limits: Максимальное кол-во запросов в секунду по классам запросов 'market', 'client', 'command'. Без ограничения, если не задано
+        :param int status_retries: Кол-во повторов запроса при превышении лимита 429 и ошибках сервера 5xx
+        :param float backoff: Начальная задержка перед повтором запроса в секундах. Удваивается с каждым повтором
+        :param float backoff_max: Максимальная задержка перед повтором запроса в секундах
+        :param Tracer tracer: Трассировка запросов. None - без трассировки
+        """
+        if aiohttp is None:  # Если aiohttp не установлен
+            raise ImportError('Для асинхронного режима установите aiohttp: pip install aiohttp')
+        self.limit = limit  # Максимальное кол-во одновременных соединений
+        self.host_limit = host_limit  # Максимальное кол-во одновременных соединений с одним сервером
+        self.tracer = tracer  # Трассировка запросов
+        self.session = None  # Сессия aiohttp создается при первом запросе внутри цикла событий
+        self.rate_limiters = {endpoint_class: RateLimiter(rate) for endpoint_class, rate in (rate_limits or {}).items()}  # Ограничители частоты запросов по классам запросов
+        self.status_retries = status_retries  # Кол-во повторов запроса
+        self.backoff = backoff  # Начальная задержка перед повтором запроса
+        self.backoff_max = backoff_max  # Максимальная задержка перед повтором запроса
+
+    def get(self, url, params=None, headers=None):
+        return self.request('GET', url, params=params, headers=headers)
+
+    def post(self, url, params=None, headers=None, json=None):
+        return self.request('POST', url, params=params, headers=headers, json=json)
+
+    def put(self, url, params=None, headers=None, json=None):
+        return self.request('PUT', url, params=params, headers=headers, json=json)
+
+    def delete(self, url, params=None, headers=None, json=None):
+        return self.request('DELETE', url, params=params, headers=headers, json=json)
+
+    async def request(self, method, url, params=None, headers=None, json=None) -> AsyncResponse:
+        """Выполнение запроса с ожиданием очереди в лимите класса запросов. Повтор запроса при превышении лимита 429 и ошибках сервера 5xx
+
+        :param str method: Метод запроса: 'GET', 'POST', 'PUT', 'DELETE'
+        :param str url: Адрес запроса
+        :param dict params: Параметры запроса
+        :param dict headers: Хедеры запроса
+        :param dict json: Тело запроса JSON
+        :return: Ответ
+        """
+        if self.session is None:  # Если сессия еще не создана
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.host_limit))  # то создаем ее с пулом соединений
+        if params:  # aiohttp не принимает логические значения в параметрах
+            params = {key: str(value) if isinstance(value, bool) else value for key, value in params.items()}  # Переводим их в текст так же, как requests
+        endpoint_class = AlorSession.get_endpoint_class(urlsplit(url).path)  # Класс запроса
+        rate_limiter = self.rate_limiters.get(endpoint_class)  # Ограничитель частоты запросов класса
+        attempt = 0  # Номер попытки
+        while True:
+            if rate_limiter:  # Если частота запросов класса ограничена
+                delay = rate_limiter.reserve()  # то резервируем запрос
+                if delay > 0:  # Если нужно подождать своей очереди
+                    await asyncio.sleep(delay)  # то ждем, не блокируя цикл событий
+            start = monotonic()  # Время начала запроса
+            async with self.session.request(method, url, params=params, headers=headers, json=json) as response:
+                content = await response.read()  # Читаем ответ целиком
+            if self.tracer is not None:  # Если трассировка включена
+                self.tracer.trace(method, response.url.path_qs, response.status, content, monotonic() - start, attempt)  # то трассируем каждую попытку
+            status_code = response.status  # Код ответа
+            throttled = status_code == 429  # Превышен лимит запросов
+            if not throttled and not (status_code >= 500 and method in AlorSession.retry_methods) or attempt >= self.status_retries or endpoint_class in AlorSession.no_retry_classes:  # Если повтор не нужен, попытки закончились, или торговую команду не повторяем
+                if rate_limiter and status_code < 400:  # Если частота запросов класса ограничена, и запрос выполнен
+                    rate_limiter.succeeded()  # то постепенно возвращаем частоту к максимальной
+                return AsyncResponse(status_code, content, response.url.path_qs)
+            retry_after = response.headers.get('Retry-After')  # Сервер может сообщить, через сколько секунд повторить запрос
+            if retry_after and retry_after.replace('.', '', 1).isdigit():  # Если задержка задана в секундах
+                delay = min(float(retry_after), self.backoff_max)
+            else:  # Иначе, экспоненциальная задержка со случайной добавкой
+                delay = min(self.backoff * 2 ** attempt, self.backoff_max) * (0.5 + random() / 2)
+            if throttled and rate_limiter:  # Если превышен лимит запросов класса
+                rate_limiter.throttled(delay)  # то снижаем частоту и приостанавливаем запросы класса
+            else:  # Если ошибка сервера или частота не ограничена
+                await asyncio.sleep(delay)  # то ждем перед повтором только этот запрос
+            attempt += 1
+
+    async def close(self):
+        """Закрытие сессии"""
+        if self.session:  # Если сессия была создана
+            await self.session.close()  # то закрываем ее
+            self.session = None
+
+
+# noinspection PyShadowingBuiltins
+class AlorPyAsync(AlorPy):
+    """Работа с АЛОР Брокер API https://alor.dev/docs из Python в асинхронном режиме
+
+    Запросы REST, подписки, команды WebSocket и функции конвертации, которым нужна спецификация тикера, возвращают корутины
+    """
+
+    def __init__(self, refresh_token=None, demo=False, limit=100, rate_limits=None, status_retries=5, tracer=None, bar_cache=None, host_limit=10):
+        """Инициализация без запросов к серверам. Токен JWT и счета получаются в цикле событий при входе в async with или в connect()
+
+        :param str refresh_token: Токен
+        :param bool demo: Режим демо торговли. По умолчанию установлен режим реальной торговли
+        :param int limit: Максимальное кол-во одновременных соединений HTTP API
+        :param dict rate_limits: Максимальное кол-во запросов в секунду по классам запросов 'market', 'client', 'command'. По умолчанию AlorPy.rate_limits. {} - без ограничений
+        :param int status_retries: Кол-во повторов запроса при превышении лимита запросов 429 и ошибках сервера 5xx
+        :param Tracer tracer: Трассировка запросов HTTP API. None - без трассировки
+        :param BarCache|str bar_cache: Кэш бар для get_history_cached или путь к его папке. None - без кэша
+        :param int host_limit: Максимальное кол-во одновременных запросов к одному серверу. Ограничивает пакетные запросы и загрузку окон истории
+        """
+        self.session = AsyncSession(limit, self.rate_limits if rate_limits is None else rate_limits, status_retries, tracer=tracer, host_limit=host_limit)  # Все запросы, в т.ч. к серверу аутентификации, выполняем через асинхронную сессию
+        self.init_state(demo, bar_cache=bar_cache)  # Настройки, события и справочники. Одно подключение к серверу подписок WebSocket
+        self.refresh_token = refresh_token  # Токен. Если не указан, то connect() получит его из системного хранилища
+        self.jwt_token_lock = asyncio.Lock()  # Токен JWT обновляет только одна задача
+        self.jwt_token_task = None  # Задача обновления токена JWT
+        self.bar_lock = nullcontext()  # Данные подписок и таймер завершения баров обрабатываются в одном цикле событий. Блокировка не нужна
+        self.ws_socket = None  # Подключение к серверу подписок и событий WebSocket
+        self.ws_ready = False  # WebSocket готов принимать запросы
+        self.ws_task = None  # Задача управления подписками
+        self.ws_ready_event = asyncio.Event()  # WebSocket готов принимать запросы
+        self.cws_lock = asyncio.Lock()  # Подключение к серверу заявок WebSocket выполняем один раз
+        self.cws_task = None  # Задача чтения ответов сервера заявок WebSocket
+        self.bar_timer_task = None  # Задача таймера завершения баров
+
+    async def __aenter__(self):
+        """Вход в класс с async with. Получение токена JWT и счетов"""
+        await self.connect()
+        return self
+
+    # Авторизация
+
+    async def connect(self):
+        """Получение токена JWT и счетов, запуск задачи обновления токена JWT. Вызывается один раз до первого запроса, если не используется async with"""
+        if self.jwt_token_task is not None:  # Если токен JWT уже получен
+            return  # то выходим, дальше не продолжаем
+        loop = asyncio.get_running_loop()
+        self.refresh_token = await loop.run_in_executor(None, self.load_refresh_token, self.refresh_token)  # Системное хранилище работает синхронно. Не блокируем цикл событий
+        await self.refresh_jwt_token_async()  # Получаем токен JWT
+        self.set_accounts()  # Счета из токена JWT
+        self.jwt_token_task = asyncio.create_task(self.jwt_token_refresher())  # Создаем и запускаем задачу обновления токена JWT
+
+    def get_jwt_token(self):
+        """Текущий токен JWT без запроса к серверу. Токен получает connect() и обновляет задача обновления токена JWT
+
+        :return: JWT токен или None, если он не получен
+        """
+        return self.jwt_token
+
+    async def refresh_jwt_token_async(self):
+        """Получение нового токена JWT с сервера аутентификации в цикле событий
+
+        :return: JWT токен или None в случае ошибки
+        """
+        async with self.jwt_token_lock:  # Токен обновляет только одна задача
+            if self.refresh_token is None:  # Если токен не найден
+                return self.set_jwt_token(None)
+            try:
+                response = await self.session.post(url=f'{self.oauth_server}/refresh', params={'token': self.refresh_token})  # Запрашиваем новый JWT токен с сервера аутентификации
+            except (aiohttp.ClientError, asyncio.TimeoutError) as ex:  # Ошибка соединения
+                self.logger.error(f'Ошибка соединения {ex}')  # Событие ошибки
+                return self.set_jwt_token(None)
+            if response.status_code != 200:  # Если при получении токена возникла ошибка
+                self.logger.error(f'Ошибка получения JWT токена: {response.status_code}')  # Событие ошибки
+                return self.set_jwt_token(None)
+            return self.set_jwt_token(self.codec.loads(response.content))  # Токен получен
+
+    async def jwt_token_refresher(self):
+        """Задача обновления токена JWT до окончания его действия"""
+        while True:
+            await asyncio.sleep(self.get_jwt_token_timeout())  # Ждем времени обновления
+            try:
+                await self.refresh_jwt_token_async()  # Обновляем токен JWT
+            except Exception as ex:  # При ошибке
+                self.logger.error(f'JWT Token Task: Ошибка {ex}')  # Событие ошибки. Попробуем еще раз
+
+    # Об инструменте
+
+    async def get_symbol(self, exchange, symbol, instrument_group=None, format='Simple') -> dict | None:  # https://alor.dev/docs/api/http/md-v-2-securities-exchange-symbol-get
+        """Выбранный торговый инструмент
+
+        :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
+        :param str symbol: Тикер
+        :param str instrument_group: Код режима торгов
+        :param str format: Формат возвращаемого сервером JSON-объекта: 'Simple', 'Slim', 'Heavy'
+        :return: Запрос возвращает полную информацию об указанном финансовом инструменте на выбранной бирже
+        """
+        params = {'format': format}
+        if instrument_group:
+            params['instrumentGroup'] = instrument_group
+        result: dict = await self.check_result(self.session.get(url=f'{self.api_server}/md/v2/Securities/{exchange}/{symbol}', params=params, headers=self.get_headers()))  # Результат в виде словаря
+        if result is not None:  # Если данные тикера получены
+            result['decimals'] = int(log10(1 / result['minstep']) + 0.99)  # Кол-во десятичных знаков получаем из шага цены, добавляем в полученный словарь
+        return result
+
+    # Запросы REST
+
+    def check_result(self, response, convert=None):
+        """Анализ результата асинхронного запроса
+
+        :param response: Корутина запроса
+        :param convert: Функция перевода справочника из JSON в результат. None - не переводить
+        :return: Корутина, возвращающая справочник из JSON (результат перевода), текст, None в случае веб ошибки
+        """
+        return self.check_result_async(response, convert)
+
+    async def check_result_async(self, response, convert=None):
+        """Ожидание и анализ результата асинхронного запроса
+
+        :param response: Корутина запроса
+        :param convert: Функция перевода справочника из JSON в результат. None - не переводить
+        :return: Справочник из JSON (результат перевода), текст, None в случае веб ошибки. Исключение RateLimitError, если лимит запросов превышен после всех повторов, и задан raise_rate_limit
+        """
+        return super().check_result(await response, convert)
+
+    # Пакетные запросы REST
+
+    async def batch(self, calls) -> list:
+        """Параллельное выполнение запросов в цикле событий
+
+        :param calls: Запросы. Функции без параметров (functools.partial, lambda) или кортежи (функция, параметр1, параметр2, ...)
+        :return: Результаты в порядке запросов. Вместо результата запроса, завершившегося исключением, возвращается исключение
+        """
+        return await self.gather_limited([call if callable(call) else partial(*call) for call in calls], return_exceptions=True)
+
+    async def gather_limited(self, calls, return_exceptions=False) -> list:
+        """Выполнение корутин, не более host_limit одновременно
+
+        :param calls: Функции без параметров, возвращающие корутины. Корутина создается только при запуске
+        :param bool return_exceptions: Возвращать исключение вместо результата
+        :return: Результаты в порядке функций
+        """
+        semaphore = asyncio.Semaphore(self.session.host_limit)  # Ограничитель одновременных запросов
+
+        async def run(call):
+            async with semaphore:  # Ждем свободного места
+                return await call()
+
+        return await asyncio.gather(*(run(call) for call in calls), return_exceptions=return_exceptions)
+
+    async def get_history_parallel(self, exchange, symbol, tf, seconds_from=0, seconds_to=None, window_bars=10000, retries=3, completed=None, **kwargs) -> dict | None:
+        """История рынка для выбранных биржи и инструмента, загружаемая параллельно по временнЫм окнам
+
+        :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
+        :param str symbol: Тикер
+        :param int|str tf: Длительность временнОго интервала в секундах или код ("D" - дни, "W" - недели, "M" - месяцы, "Y" - годы)
+        :param int seconds_from: Дата и время UTC в секундах для первого запрашиваемого бара
+        :param int seconds_to: Дата и время UTC в секундах для последнего запрашиваемого бара. По умолчанию, текущее время
+        :param int window_bars: Размер окна в барах временнОго интервала
+        :param int retries: Кол-во попыток загрузки окна
+        :param dict completed: Загруженные окна {начало окна: бары}. Чтобы продолжить загрузку после ошибки, передайте тот же справочник повторно
+        :param kwargs: Остальные параметры get_history, кроме count_back
+        :return: Справочник с барами в history без дубликатов, отсортированными по времени. None, если хотя бы одно окно не удалось загрузить
+        """
+        if seconds_to is None:  # Если время последнего бара не задано
+            seconds_to = int(time())  # то загружаем историю до текущего времени
+        if not isinstance(tf, int):  # Дневные/недельные/месячные/годовые бары
+            return await self.get_history(exchange, symbol, tf, seconds_from, seconds_to, **kwargs)  # загружаем одним запросом
+        window = tf * window_bars  # Размер окна в секундах
+        completed = {} if completed is None else completed  # Загруженные окна
+
+        async def load_window(start):
+            """Загрузка окна с повтором при ошибке"""
+            for _ in range(retries):  # Пробуем загрузить окно несколько раз
+                try:
+                    history = await self.get_history(exchange, symbol, tf, start, min(start + window - 1, seconds_to), **kwargs)  # Бары окна
+                except RateLimitError:  # Если лимит запросов превышен
+                    continue  # то пробуем еще раз. Незагруженное окно можно догрузить с тем же completed
+                if history and 'history' in history:  # Если бары получены
+                    completed[start] = history['history']  # то запоминаем загруженное окно
+                    return history
+            return None  # Окно загрузить не удалось
+
+        if seconds_from not in completed:  # Первое окно загружаем отдельно, чтобы пропустить время до первого бара тикера
+            history = await load_window(seconds_from)
+            if history is None:  # Если окно загрузить не удалось
+                self.logger.error(f'Ошибка загрузки истории {exchange}.{symbol} {tf} с {seconds_from}')
+                return None
+            if not history['history'] and history.get('next') and seconds_from < history['next'] <= seconds_to:  # Если в окне нет бар, и сервер сообщил время следующего бара
+                del completed[seconds_from]  # то пустое окно не запоминаем
+                seconds_from = history['next']  # и начинаем загрузку со следующего бара
+        results = await self.gather_limited([partial(load_window, start) for start in range(seconds_from, seconds_to + 1, window) if start not in completed])  # Загружаем оставшиеся окна
+        failed = sum(history is None for history in results)  # Кол-во незагруженных окон
+        if failed:  # Если не удалось загрузить хотя бы одно окно
+            self.logger.error(f'Ошибка загрузки истории {exchange}.{symbol} {tf}: не загружено окон {failed}. Повторите запрос с тем же completed')
+            return None
+        bars = {bar['time']: bar for start in sorted(completed) for bar in completed[start]}  # Объединяем бары окон. Дубликаты на границах окон заменяем последними
+        return {'history': [bars[seconds] for seconds in sorted(bars)]}
+
+    async def get_history_cached(self, exchange, symbol, tf, seconds_from=0, seconds_to=None, **kwargs):
+        """История рынка из кэша бар bar_cache. Параметры как в AlorPy.get_history_cached. Файлы кэша читаются и пишутся в пуле потоков, не блокируя цикл событий"""
+        if self.bar_cache is None:  # Если кэш бар не задан
+            raise ValueError('Кэш бар не задан. Укажите параметр bar_cache при создании AlorPyAsync')
+        loop = asyncio.get_running_loop()
+        seconds_start = await loop.run_in_executor(None, self.bar_cache.get_start, exchange, symbol, tf)  # Начало истории в кэше
+        if seconds_start is None or seconds_from < seconds_start:  # Если кэш пуст, или запрашиваются бары до начала кэша
+            history = await self.get_history_parallel(exchange, symbol, tf, seconds_from, None if seconds_start is None else seconds_start - 1, **kwargs)  # Загружаем бары до начала кэша
+            await loop.run_in_executor(None, partial(self.put_history_to_cache, exchange, symbol, tf, seconds_from, history, keep_empty=True))
+        seconds_from_top_up = None if seconds_start is None else await loop.run_in_executor(None, self.get_top_up_time, exchange, symbol, tf, seconds_to)  # Время начала загрузки новых бар. Пустой кэш только что заполнен до текущего времени
+        if seconds_from_top_up is not None:  # Если нужны новые бары
+            history = await self.get_history_parallel(exchange, symbol, tf, seconds_from_top_up, **kwargs)  # Загружаем только новые бары
+            await loop.run_in_executor(None, self.put_history_to_cache, exchange, symbol, tf, seconds_from_top_up, history)
+        return await loop.run_in_executor(None, self.bar_cache.load, exchange, symbol, tf, seconds_from, seconds_to)
+
+    # Постраничные запросы REST
+
+    async def load_page(self, get_page, start) -> list:
+        """Записи страницы с повтором загрузки при ошибке. Параметры как в AlorPy.load_page"""
+        for attempt in range(1, self.page_retries + 1):  # Пробуем загрузить страницу
+            records = self.get_page_records(await get_page(start))
+            if records is not None:  # Если страница получена
+                return records  # то возвращаем ее записи. Короткая или пустая страница завершает перебор
+            self.logger.warning(f'Страница с {start} не получена. Попытка {attempt} из {self.page_retries}')
+        raise PageLoadError(start)
+
+    async def iter_offset_pages(self, get_page, page_size, prefetch=1):
+        """Асинхронный генератор записей постраничного запроса со смещением. Следующие страницы загружаются, пока обрабатывается текущая
+
+        :param get_page: Функция получения страницы по смещению
+        :param int page_size: Кол-во записей на странице
+        :param int prefetch: Кол-во страниц, загружаемых заранее
+        :return: Асинхронный генератор записей. Исключение PageLoadError, если страница не получена
+        """
+        pages = deque(asyncio.ensure_future(self.load_page(get_page, page * page_size)) for page in range(prefetch + 1))  # Загружаем текущую и следующие страницы
+        next_page = prefetch + 1  # Номер следующей страницы для загрузки
+        try:
+            while pages:  # Пока есть загружаемые страницы
+                records = await pages.popleft()  # Дожидаемся загрузки страницы
+                if len(records) == page_size:  # Если страница полная, то за ней могут быть еще записи
+                    pages.append(asyncio.ensure_future(self.load_page(get_page, next_page * page_size)))  # Загружаем следующую страницу
+                    next_page += 1
+                for record in records:  # Отдаем записи страницы
+                    yield record
+                if len(records) < page_size:  # Если страница последняя
+                    break  # то записей больше нет
+        finally:
+            for page in pages:  # Загрузку оставшихся страниц
+                page.cancel()  # отменяем
+
+    async def iter_id_pages(self, get_page, id_from, page_size):
+        """Асинхронный генератор записей постраничного запроса с начальным номером. Следующая страница загружается, пока обрабатывается текущая
+
+        :param get_page: Функция получения страницы по начальному номеру
+        :param int id_from: Начальный номер записи
+        :param int page_size: Кол-во записей на странице
+        :return: Асинхронный генератор записей. Исключение PageLoadError, если страница не получена
+        """
+        page = asyncio.ensure_future(self.load_page(get_page, id_from))  # Загружаем первую страницу
+        try:
+            while page:  # Пока есть загружаемая страница
+                records = await page  # Дожидаемся загрузки страницы
+                page = asyncio.ensure_future(self.load_page(get_page, int(records[-1]['id']) + 1)) if len(records) == page_size else None  # Если страница полная, то загружаем следующую после последнего номера
+                for record in records:  # Отдаем записи страницы
+                    yield record
+        finally:
+            if page:  # Загрузку оставшейся страницы
+                page.cancel()  # отменяем
+
+    # Запросы WebSocket
+
+    async def send_websocket(self, request, timeout=None):
+        """Отправка запроса через командный WebSocket с ожиданием ответа. Несколько запросов выполняются одновременно
+
+        :param request: Запрос JSON
+        :param float timeout: Время ожидания ответа в секундах. По умолчанию cws_timeout
+        :return: Ответ JSON, None в случае ошибки или таймаута
+        """
+        future = await self.send_websocket_future(request)  # Отправляем запрос
+        try:
+            return await asyncio.wait_for(future, self.cws_timeout if timeout is None else timeout)  # Дожидаемся ответа
+        except asyncio.TimeoutError:  # Если ответ не пришел
+            self.cws_pending.pop(request['guid'], None)  # то больше его не ждем
+            self.logger.error(f'Ошибка сервера заявок: Таймаут ответа на запрос {request["guid"]}')
+            return None
+        except ConnectionError as ex:  # Если соединение закрылось до ответа
+            self.logger.error(f'Ошибка сервера заявок: {ex}. Запрос {request["guid"]}')
+            return None
+
+    async def send_websocket_future(self, request) -> asyncio.Future:
+        """Отправка запроса через командный WebSocket без ожидания ответа
+
+        :param request: Запрос JSON
+        :return: Future с ответом JSON, None в случае ошибки. Ответы сопоставляются с запросами по уникальному идентификатору запроса
+        """
+        guid = str(uuid4())  # Уникальный идентификатор запроса
+        request['guid'] = guid  # Ставим его в запрос
+        future = asyncio.get_running_loop().create_future()  # Ответ на запрос
+        async with self.cws_lock:  # Подключаемся только один раз
+            if not self.cws_socket:  # Если не было подключения к серверу заявок WebSocket
+                self.cws_socket = await connect(self.cws_server)  # то пробуем к нему подключиться
+                self.cws_task = asyncio.create_task(self.command_websocket_task(self.cws_socket))  # Ответы читаем в отдельной задаче
+            self.cws_pending[guid] = future  # Ответ может прийти сразу после отправки
+            try:
+                await self.cws_socket.send(self.codec.dumps(request))  # Переводим JSON в строку, отправляем запрос
+            except Exception:  # Если запрос не отправлен
+                del self.cws_pending[guid]  # то ответ не ждем
+                raise
+        return future
+
+    async def command_websocket_task(self, cws_socket):
+        """Задача чтения ответов сервера заявок WebSocket
+
+        :param cws_socket: Подключение к серверу заявок WebSocket
+        """
+        try:
+            while True:
+                response_json = await cws_socket.recv(decode=False)  # Ожидаем ответ сервера заявок WebSocket
+                try:
+                    response = self.codec.loads(response_json)  # Переводим JSON в словарь
+                except self.codec.decode_errors:  # Если ответ не в формате JSON, то не можем определить запрос
+                    self.logger.warning(f'Command WebSocket Task: Пришел ответ не в формате JSON {response_json}. Пропуск')
+                    continue
+                future = self.cws_pending.pop(response.get('requestGuid'), None)  # Ответ ищем по уникальному идентификатору запроса
+                if future is None or future.done():  # Если запрос не найден или ответ уже не ждут. Например, после таймаута
+                    self.logger.debug(f'Command WebSocket Task: Пришел ответ на неизвестный запрос {response}. Пропуск')
+                    continue
+                try:
+                    future.set_result(self.check_websocket_result(response))  # Отдаем ответ ждущей корутине
+                except Exception as ex:  # Ошибка разбора одного ответа не останавливает чтение остальных
+                    future.set_exception(ex)
+        except ConnectionClosed:  # Отключились от сервера заявок WebSocket
+            self.logger.debug('Command WebSocket Task: Отключена от сервера')
+        except Exception as ex:  # При других типах ошибок
+            self.logger.error(f'Command WebSocket Task: Ошибка {ex}')
+        finally:
+            if self.cws_socket is cws_socket:  # Новые команды отправятся через новое подключение
+                self.cws_socket = None
+            pending, self.cws_pending = self.cws_pending, {}  # Ответы на отправленные команды уже не придут
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError('Соединение с сервером заявок WebSocket закрыто'))
+            try:
+                await cws_socket.close()  # Закрываем подключение, если оно еще открыто
+            except Exception:  # Ошибки при закрытии подключения
+                pass  # не обрабатываем
+
+    # Подписки WebSocket
+
+    async def subscribe(self, request, callback=None) -> str:
+        """Запуск задачи WebSocket, если не запущена. Отправка запроса подписки на сервер WebSocket
+
+        :param request request: Запрос
+        :param callback: Функция, получающая данные только этой подписки. Если не задана, то вызывается общее событие по типу подписки
+        :return: Подписка. Уникальный идентификатор подписки с отменой unsubscribe()
+        """
+        if callback:  # Если задана функция подписки
+            request['callback'] = callback  # то данные подписки будем передавать только ей
+        self.start_websocket()  # Запускаем задачу WebSocket, если не запущена
+        await self.ws_ready_event.wait()  # Подождем, пока WebSocket не будет готов принимать запросы
+        guid = str(uuid4())  # Уникальный идентификатор подписки
+        await self.subscribe_call(request, guid)
+        return Subscription(guid, self)
+
+    async def subscribe_many(self, requests, callback=None, timeout=10) -> list:
+        """Отправка сразу нескольких запросов подписки на сервер WebSocket без ожидания ответа на каждый из них
+
+        :param requests: Запросы подписок. Справочники как в функциях подписок. Функцию подписки можно задать в ключе callback
+        :param callback: Функция, получающая данные подписок без своей функции. Если не задана, то вызывается общее событие по типу подписки
+        :param float timeout: Время ожидания подтверждения подписок сервером в секундах. 0 - не ждать
+        :return: Подписки в порядке запросов. Подтверждение сервера в атрибуте acknowledged: True - подписка оформлена, False - отклонена, None - ответ не получен
+        """
+        self.start_websocket()  # Запускаем задачу WebSocket, если не запущена
+        await self.ws_ready_event.wait()  # Подождем, пока WebSocket не будет готов принимать запросы
+        if callback:  # Если задана общая функция подписок
+            for request in requests:  # то ставим ее подпискам без своей функции
+                request.setdefault('callback', callback)
+        token = self.get_jwt_token()  # Токен JWT один для всех подписок
+        guids = [str(uuid4()) for _ in requests]  # Уникальные идентификаторы подписок
+        frames = [self.get_subscribe_frame(request, guid, token) for request, guid in zip(requests, guids)]  # Готовим все запросы подписок
+        loop = asyncio.get_running_loop()
+        acks = {guid: loop.create_future() for guid in guids} if timeout else {}  # Подтверждения подписок
+        self.subscribe_acks.update(acks)  # Подтверждение может прийти сразу после отправки
+        for frame in frames:  # Отправляем запросы подряд без ожидания ответов
+            await self.ws_socket.send(frame)
+        if acks:  # Если ждем подтверждения подписок
+            await asyncio.wait(acks.values(), timeout=timeout)  # то ждем их, но не дольше таймаута
+        subscriptions = []  # Подписки
+        for guid in guids:  # Пробегаемся по всем подпискам
+            subscription = Subscription(guid, self)
+            ack = self.subscribe_acks.pop(guid, None)  # Подтверждение подписки
+            subscription.acknowledged = ack.result() if ack and ack.done() else None  # True/False или None, если ответ не получен
+            subscriptions.append(subscription)
+        return subscriptions
+
+    def start_websocket(self):
+        """Запуск задачи WebSocket, если не запущена. В асинхронном режиме одно подключение к серверу подписок"""
+        if self.ws_shards > 1:  # Если задано несколько подключений
+            raise ValueError('Несколько подключений WebSocket (ws_shards) не поддерживаются в асинхронном режиме')
+        if self.ws_task is None:  # Если задача управления подписками не запущена
+            self.ws_running = True  # Запуск задачи только один раз
+            self.logger.debug(f'WebSocket Main: Запуск')
+            self.on_entering.trigger()  # Событие начала входа
+            self.ws_task = asyncio.create_task(self.websocket_task())  # Создаем и запускаем задачу управления подписками
+
+    async def websocket_task(self):
+        """Задача управления подписками"""
+        self.logger.debug(f'WebSocket Task: Запущена')
+        self.on_enter.trigger()  # Событие входа
+        attempt = 0  # Номер попытки переподключения
+        while self.ws_running:  # Будем держать соединение с сервером WebSocket до отмены
+            connected = None  # Время готовности подключения
+            try:
+                ssl_context = ssl.create_default_context()  # Контекст SSL
+                ssl_context.check_hostname = False  # Не проверяем имя сервера
+                ssl_context.verify_mode = ssl.CERT_NONE  # Не проверяем сертификат
+                self.ws_socket = await connect(uri=self.ws_server, ssl=ssl_context)  # Пробуем подключиться к серверу подписок и событий WebSocket
+                self.logger.debug(f'WebSocket Task: Подключена к серверу')
+                self.on_connect.trigger()  # Событие подключения к серверу
+
+                if len(self.subscriptions) > 0:  # Если есть подписки, то будем их возобновлять
+                    self.logger.debug(f'WebSocket Task: Возобновление подписок ({len(self.subscriptions)})')
+                    self.on_resubscribe.trigger()  # Событие возобновления подписок
+                    for guid, request in list(self.subscriptions.items()):  # Пробегаемся по всем подпискам
+                        await self.subscribe_call(request, guid)  # Переподписываемся с тем же уникальным идентификатором
+                self.ws_ready = True  # Готов принимать запросы
+                self.ws_ready_event.set()  # Отпускаем ожидающие подписки
+                connected = monotonic()  # Задержку переподключения сбросим, только если подключение проработает ws_stable_time
+                self.logger.debug(f'WebSocket Task: Готова')
+                self.on_ready.trigger()  # Событие готовности к работе
+
+                while self.ws_running:  # Получаем подписки до отмены
+                    response_json = await self.ws_socket.recv(decode=False)  # Ожидаем ответ с сервера подписок и событий WebSocket. Получаем байты без перевода в текст
+                    try:
+                        response = self.codec.loads(response_json)  # Переводим JSON в словарь
+                    except self.codec.decode_errors:  # Если вместо JSON сообщений получаем текст (проверка на всякий случай)
+                        self.logger.warning(f'WebSocket Task: Пришли данные подписки не в формате JSON {response_json}. Пропуск')
+                        continue  # то его не разбираем, пропускаем
+                    self.dispatch(response)  # Разбираем данные подписки
+            except ConnectionClosed:  # Отключились от сервера WebSockets
+                self.logger.debug(f'WebSocket Task: Отключена от сервера')
+                self.on_disconnect.trigger()  # Событие отключения от сервера
+            except OSError as ex:  # При системной ошибке
+                self.logger.error(f'WebSocket Task: Системная ошибка {ex}')
+            except TimeoutError as ex:  # При таймауте на websockets
+                self.logger.debug(f'WebSocket Task: Таймаут {ex}')
+                self.on_timeout.trigger()  # Событие таймаута
+            except Exception as ex:  # При других типах ошибок
+                self.logger.error(f'WebSocket Task: Ошибка {ex}')  # Событие ошибки
+            finally:
+                self.ws_ready = False  # Не готов принимать запросы
+                self.ws_ready_event.clear()  # Новые подписки будут ждать переподключения
+                self.ws_socket = None  # Сбрасываем подключение сервера подписок и событий WebSocket
+            if connected is not None and monotonic() - connected >= self.ws_stable_time:  # Если подключение работало долго
+                attempt = 0  # то следующее переподключение начнем сразу. Сервер, сразу закрывающий подключение, получит растущую задержку
+            if self.ws_running:  # Если отключение не было запрошено пользователем
+                delay = self.get_reconnect_delay(attempt)  # Задержка до следующей попытки подключиться
+                attempt += 1
+                self.logger.debug(f'WebSocket Task: попытка переподключения к вебсокету через {delay:.2f} секунд')
+                await asyncio.sleep(delay)  # выжидаем время до следующей попытки подключиться
+        self.logger.debug(f'WebSocket Task: Завершение')
+        self.on_exit.trigger()  # Событие выхода
+
+    async def subscribe_call(self, request, guid):
+        """Отправка запроса (пере)подписки на сервер WebSocket
+
+        :param request: Запрос
+        :param str guid: Уникальный идентификатор подписки
+        """
+        await self.ws_socket.send(self.get_subscribe_frame(request, guid))  # Отправляем запрос на сервер подписок и событий WebSocket
+
+    async def unsubscribe(self, guid):  # https://alor.dev/docs/api/websocket/data-subscriptions/Unsubscribe
+        """Отмена существующей подписки. Повторная отмена ничего не делает. Без подключения к серверу удаляется только сама подписка
+
+        :param str guid: Уникальный идентификатор подписки
+        :return: Уникальный идентификатор подписки. None, если подписка не найдена
+        """
+        if self.subscriptions.pop(guid, None) is None:  # Если подписка уже отменена
+            return None  # то выходим, дальше не продолжаем
+        self.handlers.pop(guid, None)  # Удаляем обработчик подписки
+        self.conflated.discard(guid)
+        ws_socket = self.ws_socket  # Подключение к серверу подписок и событий WebSocket
+        if ws_socket is None:  # Если подключение переподключается
+            return guid  # то отменять на сервере нечего. Новое подключение подписку не возобновит
+        try:
+            await ws_socket.send(self.codec.dumps({'opcode': 'unsubscribe', 'token': str(self.get_jwt_token()), 'guid': guid}))  # Отправляем запрос на отмену подписки на сервер подписок и событий WebSocket
+        except ConnectionClosed:  # Если подключение закрылось во время отправки
+            pass  # то подписка на сервере закрылась вместе с ним
+        return guid
+
+    def start_bar_timer(self):
+        """Запуск задачи таймера завершения баров, если не запущена"""
+        if not self.bar_timer_running:  # Если таймер не запущен
+            self.bar_timer_running = True  # Запуск только один раз
+            self.bar_timer_task = asyncio.create_task(self.bar_timer())
+
+    async def bar_timer(self):
+        """Задача таймера завершения баров"""
+        synced = None  # Время последнего обновления разницы времени сервера
+        try:
+            while self.ws_running:  # Пока работает WebSocket
+                if synced is None or monotonic() - synced >= self.server_time_interval:  # Если пора обновить разницу времени сервера
+                    synced = monotonic()
+                    try:
+                        self.set_server_time_offset(await self.get_time())
+                    except Exception as ex:  # Ошибка запроса не должна останавливать таймер
+                        self.logger.error(f'Bar Timer: Ошибка получения времени сервера {ex}')
+                try:
+                    timeout = self.close_bars_by_timer()  # Завершаем бары
+                except Exception as ex:  # Ошибка завершения баров не должна останавливать таймер
+                    self.logger.error(f'Bar Timer: Ошибка {ex}')
+                    timeout = 1.0
+                await asyncio.sleep(timeout)  # Ждем до следующей проверки
+        finally:
+            self.bar_timer_running = False  # Таймер можно запустить снова
+
+    # Потоки подписок
+
+    def check_conflate(self):
+        """Данные подписок разбираются в цикле событий без очереди обработки. Обработка только последних данных невозможна"""
+        raise ValueError('Параметр conflate не поддерживается в асинхронном режиме')
+
+    async def stream(self, subscribe, *args, maxsize=0, **kwargs):
+        """Асинхронный поток данных подписки для async for. Подписка оформляется при получении первых данных и отменяется при закрытии потока
+
+        :param subscribe: Функция подписки с параметром callback. Например, quotes_subscribe
+        :param args: Параметры функции подписки
+        :param int maxsize: Максимальное кол-во неполученных данных в буфере подписки. При переполнении самые старые данные удаляются. 0 - без ограничения
+        :param kwargs: Именованные параметры функции подписки
+        :return: Асинхронный генератор данных подписки
+        """
+        buffer = asyncio.Queue(maxsize)  # Буфер данных подписки. Данные подписки разбираются в цикле событий
+
+        def put(response):
+            if buffer.full():  # Цикл событий нельзя блокировать ожиданием места в буфере
+                buffer.get_nowait()  # Удаляем самые старые данные
+            buffer.put_nowait(response)
+
+        subscription = await subscribe(*args, callback=put, **kwargs)  # Данные подписки получает только буфер
+        try:
+            while True:
+                yield await buffer.get()  # Ждем и отдаем данные подписки
+        finally:  # При закрытии потока
+            if self.ws_running and subscription in self.subscriptions:  # Если подписка еще действует
+                await subscription.unsubscribe()  # то отменяем ее
+
+    async def subscribe_order_book(self, exchange, symbol, levels=5, callback=None, **kwargs) -> OrderBook:
+        """Биржевой стакан, обновляемый подпиской. Параметры как в AlorPy.subscribe_order_book"""
+        order_book = OrderBook(levels, callback)  # Стакан
+        order_book.subscription = await self.order_book_get_and_subscribe(exchange, symbol, callback=order_book.on_response, **kwargs)  # Данные подписки получает только стакан
+        return order_book
+
+    async def subscribe_bar_aggregator(self, exchange, symbol, series, callback=None, source='trades', **kwargs) -> BarAggregator:
+        """Сборка баров нескольких типов и размеров по одной подписке. Параметры как в AlorPy.subscribe_bar_aggregator"""
+        aggregator = BarAggregator(series, callback or self.on_new_bar.trigger)  # Сборщик баров
+        if source == 'bars':  # Если собираем бары из минутных баров
+            aggregator.subscription = await self.bars_get_and_subscribe(exchange, symbol, 60, callback=aggregator.on_bar, **kwargs)
+        else:  # Если собираем бары из сделок
+            aggregator.subscription = await self.all_trades_subscribe(exchange, symbol, callback=aggregator.on_trade, **kwargs)
+        return aggregator
+
+    async def subscribe_tick_store(self, exchange, symbol, store=None, trades=True, quotes=True, capacity=100_000, **kwargs) -> TickStore:
+        """Хранилище сделок и котировок, заполняемое подписками. Параметры как в AlorPy.subscribe_tick_store"""
+        store = store or TickStore(capacity)  # Хранилище
+        if trades:  # Если нужны сделки
+            store.subscriptions.append(await self.all_trades_subscribe(exchange, symbol, callback=partial(store.on_trade, exchange), **kwargs))
+        if quotes:  # Если нужны котировки
+            store.subscriptions.append(await self.quotes_subscribe(exchange, symbol, callback=partial(store.on_quote, exchange), **kwargs))
+        return store
+
+    # Выход и закрытие
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """Выход из класса с async with"""
+        await self.close()
+
+    def close_web_socket(self):
+        """Остановка задач управления подписками и обновления токена JWT без ожидания закрытия соединений"""
+        self.ws_running = False
+        for task in (getattr(self, 'ws_task', None), getattr(self, 'jwt_token_task', None)):  # Задачи управления подписками и обновления токена JWT
+            if task and not task.done():  # Если задача работает
+                try:
+                    task.cancel()  # то отменяем ее
+                except RuntimeError:  # Если цикл событий уже закрыт
+                    pass  # то задача уже не выполняется
+
+    async def close(self):
+        """Закрытие соединений с серверами WebSocket и HTTP API"""
+        self.close_web_socket()  # Останавливаем задачу управления подписками
+        if self.ws_task:  # Если задача управления подписками была запущена
+            await asyncio.gather(self.ws_task, return_exceptions=True)  # то дожидаемся ее завершения
+            self.ws_task = None
+        if self.jwt_token_task:  # Если задача обновления токена JWT была запущена
+            await asyncio.gather(self.jwt_token_task, return_exceptions=True)  # то дожидаемся ее завершения
+            self.jwt_token_task = None
+        if self.ws_socket:  # Если работатет сервер подписок и событий WebSocket
+            await self.ws_socket.close()  # то закрываем соединение с ним
+        if self.cws_socket:  # Если работает сервер заявок WebSocket
+            await self.cws_socket.close()  # то закрываем соединение с ним
+            self.cws_socket = None
+        await self.session.close()  # Закрываем соединения пула HTTP API
+
+    # Функции конвертации
+
+    async def dataname_to_alor_board_symbol(self, dataname) -> tuple[str | None, str]:
+        """Код режима торгов Алора и тикер из названия тикера
+
+        :param str dataname: Название тикера
+        :return: Код режима торгов и тикер
+        """
+        symbol_parts = dataname.split('.')  # По разделителю пытаемся разбить тикер на части
+        if len(symbol_parts) >= 2:  # Если тикер задан в формате <Код режима торгов>.<Код тикера>
+            board = symbol_parts[0]  # Код режима торгов
+            symbol = '.'.join(symbol_parts[1:])  # Код тикера
+        else:  # Если тикер задан без кода режима торгов
+            symbol = dataname  # Код тикера
+            si = None  # Спецификация тикера
+            for exchange in self.exchanges:  # Пробуем получить спецификацию тикера на всех биржах
+                si = await self.get_symbol_info(exchange, symbol)
+                if si:  # Если спецификация найдена
+                    break  # то дальше не ищем
+            if si is None:  # Если спецификация тикера нигде не найдена
+                return None, symbol  # то возвращаем без кода режима торгов
+            board = si['board']  # Канонический код режима торгов
+        alor_board = self.board_to_alor_board(board)  # Код режима торгов Алор
+        return alor_board, symbol
+
+    async def get_exchange(self, alor_board, symbol) -> str | None:
+        """Биржа тикера из кода режима торгов Алора и тикера
+
+        :param str alor_board: Код режима торгов Алор
+        :param str symbol: Тикер
+        :return: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
+        """
+        for exchange in self.exchanges:  # Пробегаемся по всем биржам
+            si = await self.get_symbol_info(exchange, symbol)  # Получаем информацию о тикере
+            if si and si['board'] == alor_board:  # Если информация о тикере найдена, и режим торгов есть на бирже
+                return exchange  # то биржа найдена
+        return None  # Если биржа не была найдена, то возвращаем пустое значение
+
+    async def get_symbol_info(self, exchange, symbol, reload=False) -> dict | None:
+        """Спецификация тикера
+
+        :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
+        :param str symbol: Тикер
+        :param bool reload: Получить информацию из Алор
+        :return: Спецификация тикера из кэша/Алор или None, если тикер не найден
+        """
+        if reload or (exchange, symbol) not in self.symbols:  # Если нужно получить информацию из Алор или нет информации о тикере в справочнике
+            si = await self.get_symbol(exchange, symbol)  # Получаем информацию о тикере из Алор
+            if si is None:  # Если тикер не найден
+                return None  # то возвращаем пустое значение
+            self.symbols[(exchange, symbol)] = si  # Заносим информацию о тикере в справочник
+        return self.symbols[(exchange, symbol)]  # Возвращаем значение из справочника
+
+    async def price_to_alor_price(self, exchange, symbol, price) -> int | float:
+        """Перевод цены в рублях за штуку в цену Алор
+
+        :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
+        :param str symbol: Тикер
+        :param float price: Цена в рублях за штуку
+        :return: Цена в Алор
+        """
+        return self.si_price_to_alor_price(await self.get_symbol_info(exchange, symbol), price)
+
+    async def alor_price_to_price(self, exchange, symbol, alor_price) -> float:
+        """Перевод цены Алор в цену в рублях за штуку
+
+        :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
+        :param str symbol: Тикер
+        :param float alor_price: Цена в Алор
+        :return: Цена в рублях за штуку
+        """
+        return self.si_alor_price_to_price(await self.get_symbol_info(exchange, symbol), alor_price)
+
+    async def lots_to_size(self, exchange, symbol, lots) -> int:
+        """Перевод лотов в штуки
+
+        :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
+        :param str symbol: Тикер
+        :param int lots: Кол-во лотов
+        :return: Кол-во штук
+        """
+        return self.si_lots_to_size(await self.get_symbol_info(exchange, symbol), lots)
+
+    async def size_to_lots(self, exchange, symbol, size) -> int:
+        """Перевод штуки в лоты
+
+        :param str exchange: Код биржи: 'MOEX' — Московская биржа, 'SPBX' — СПБ Биржа
+        :param str symbol: Тикер
+        :param int size: Кол-во штук
+        :return: Кол-во лотов
+        """
+        return self.si_size_to_lots(await self.get_symbol_info(exchange, symbol), size)
+
+    async def prices_to_alor_prices(self, exchange, symbol, prices):
+        """Перевод массива цен в рублях за штуку в цены Алор. Параметры как в AlorPy.prices_to_alor_prices"""
+        return self.si_prices_to_alor_prices(await self.get_symbol_info(exchange, symbol), prices)
+
+    async def alor_prices_to_prices(self, exchange, symbol, alor_prices):
+        """Перевод массива цен Алор в цены в рублях за штуку. Параметры как в AlorPy.alor_prices_to_prices"""
+        return self.si_alor_prices_to_prices(await self.get_symbol_info(exchange, symbol), alor_prices)
+
+    async def lots_to_sizes(self, exchange, symbol, lots):
+        """Перевод массива лотов в штуки. Параметры как в AlorPy.lots_to_sizes"""
+        return self.si_lots_to_sizes(await self.get_symbol_info(exchange, symbol), lots)
+
+    async def sizes_to_lots(self, exchange, symbol, sizes):
+        """Перевод массива штук в лоты. Параметры как в AlorPy.sizes_to_lots"""
+        return self.si_sizes_to_lots(await self.get_symbol_info(exchange, symbol), sizes)
@@ -0,0 +1,108 @@
+class BarSeries:
+    """Бары одного типа и размера, собираемые по сделкам или барам меньшего размера"""
+    __slots__ = ('kind', 'size', 'bar', 'ticks')
+    kinds = ('time', 'volume', 'tick', 'range')  # Типы баров
+
+    def __init__(self, kind, size):
+        """Инициализация
+
+        :param str kind: Тип баров: 'time' - по времени, 'volume' - по объему, 'tick' - по кол-ву сделок, 'range' - по диапазону цен
+        :param size: Размер бара: секунды, лоты, кол-во сделок или диапазон цен
+        """
+        if kind not in self.kinds:  # Неизвестный тип баров
+            raise ValueError(f'Тип баров {kind} не поддерживается')
+        self.kind = kind  # Тип баров
+        self.size = size  # Размер бара
+        self.bar = None  # Текущий бар
+        self.ticks = 0  # Кол-во сделок (баров) в текущем баре
+
+    def add(self, seconds, open, high, low, close, volume):  # noqa: A002
+        """Добавление сделки или бара меньшего размера
+
+        :param int seconds: Дата и время UTC в секундах
+        :param float open: Цена открытия. Для сделки цена сделки
+        :param float high: Максимальная цена
+        :param float low: Минимальная цена
+        :param float close: Цена закрытия
+        :param float volume: Объем в лотах
+        :return: Завершенный бар. None, если бар не завершен
+        """
+        completed = None  # Завершенный бар
+        bar = self.bar  # Текущий бар
+        if self.kind == 'time':  # Для баров по времени
+            seconds -= seconds % self.size  # время открытия бара
+            if bar is not None and seconds > bar['time']:  # Если пришла сделка следующего бара
+                completed, bar = bar, None  # то текущий бар завершен
+        if bar is None:  # Если бара нет
+            bar = self.bar = {'time': seconds, 'open': open, 'high': high, 'low': low, 'close': close, 'volume': volume}  # то открываем его
+            self.ticks = 1
+        else:  # Если бар есть
+            if high > bar['high']:
+                bar['high'] = high
+            if low < bar['low']:
+                bar['low'] = low
+            bar['close'] = close
+            bar['volume'] += volume
+            self.ticks += 1
+        if (self.kind == 'volume' and bar['volume'] >= self.size or
+                self.kind == 'tick' and self.ticks >= self.size or
+                self.kind == 'range' and bar['high'] - bar['low'] >= self.size):  # Если бар по объему, кол-ву сделок или диапазону заполнен
+            completed, self.bar = bar, None  # то он завершен. Следующая сделка откроет новый бар
+        return completed
+
+
+class BarAggregator:
+    """Сборка баров нескольких типов и размеров из ленты сделок или баров меньшего размера"""
+    def __init__(self, series=(), callback=None):
+        """Инициализация
+
+        :param series: Типы и размеры баров. Например, (('time', 60), ('time', 300), ('volume', 1000), ('tick', 100), ('range', 0.5))
+        :param callback: Функция, вызываемая с завершенным баром в формате события on_new_bar: {'data': бар, 'guid': подписка, 'kind': тип, 'size': размер}
+        """
+        self.series = [BarSeries(kind, size) for kind, size in series]  # Собираемые бары
+        self.callback = callback  # Функция завершенного бара
+        self.subscription = None  # Подписка на сделки или бары
+
+    def add_series(self, kind, size) -> BarSeries:
+        """Добавление баров
+
+        :param str kind: Тип баров: 'time', 'volume', 'tick', 'range'
+        :param size: Размер бара
+        :return: Собираемые бары
+        """
+        series = BarSeries(kind, size)
+        self.series.append(series)
+        return series
+
+    def add(self, guid, seconds, open, high, low, close, volume):  # noqa: A002
+        """Добавление сделки или бара во все собираемые бары
+
+        :param str guid: Уникальный идентификатор подписки
+        :param int seconds: Дата и время UTC в секундах
+        :param float open: Цена открытия
+        :param float high: Максимальная цена
+        :param float low: Минимальная цена
+        :param float close: Цена закрытия
+        :param float volume: Объем в лотах
+        """
+        for series in self.series:  # Пробегаемся по всем собираемым барам
+            bar = series.add(seconds, open, high, low, close, volume)
+            if bar is not None and self.callback:  # Если бар завершен, и задана функция завершенного бара
+                self.callback({'data': bar, 'guid': guid, 'kind': series.kind, 'size': series.size})
+
+    def on_trade(self, response):
+        """Обработчик подписки на все сделки. Для параметра callback функции all_trades_subscribe
+
+        :param dict response: Данные подписки в формате Simple
+        """
+        trade = response['data']  # Сделка
+        price = trade['price']  # Цена сделки
+        self.add(response['guid'], trade['timestamp'] // 1000, price, price, price, price, trade['qty'])
+
+    def on_bar(self, response):
+        """Обработчик подписки на завершенные бары. Для параметра callback функции bars_get_and_subscribe
+
+        :param dict response: Данные подписки в формате Simple
+        """
+        bar = response['data']  # Завершенный бар
+        self.add(response['guid'], bar['time'], bar['open'], bar['high'], bar['low'], bar['close'], bar['volume'])
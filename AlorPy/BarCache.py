@@ -0,0 +1,138 @@
+import os
+from threading import Lock  # Запись в кэш из нескольких потоков
+
+try:
+    import numpy as np  # Бары храним колонками в файлах NumPy
+except ImportError:  # Если NumPy не установлен
+    np = None  # то кэш бар недоступен. Остальная библиотека работает без NumPy
+
+
+class BarCache:
+    """Кэш бар на диске по бирже, тикеру и интервалу.
+    Бары хранятся в структурированных массивах NumPy (.npy), которые открываются отображением в память.
+    Новые бары дописываются отдельными частями без перезаписи уже сохраненных. Часть, начинающаяся с времени бара, заменяет этот бар и все следующие бары предыдущих частей
+    """
+    columns = (('time', 'i8'), ('open', 'f8'), ('high', 'f8'), ('low', 'f8'), ('close', 'f8'), ('volume', 'f8'))  # Бар. Время UTC в секундах
+
+    def __init__(self, path, max_parts=32):
+        """Инициализация
+
+        :param str path: Папка кэша
+        :param int max_parts: Максимальное кол-во частей по тикеру и интервалу. При превышении части объединяются в одну
+        """
+        if np is None:  # Если NumPy не установлен
+            raise ImportError('Для кэша бар установите NumPy: pip install numpy')
+        self.path = path  # Папка кэша
+        self.max_parts = max_parts  # Максимальное кол-во частей
+        self.dtype = np.dtype(list(self.columns))  # Тип записи бара
+        self.lock = Lock()  # Блокировка записи частей
+
+    def get_dir(self, exchange, symbol, tf) -> str:
+        """Папка частей бар
+
+        :param str exchange: Код биржи
+        :param str symbol: Тикер
+        :param int|str tf: Временной интервал Alor
+        :return: Путь к папке
+        """
+        return os.path.join(self.path, f'{exchange}.{symbol}_{tf}')
+
+    def get_parts(self, directory) -> list:
+        """Части бар по возрастанию времени начала
+
+        :param str directory: Папка частей бар
+        :return: Список времени начала частей UTC в секундах
+        """
+        if not os.path.isdir(directory):  # Если бар в кэше нет
+            return []
+        return sorted(int(name[:-4]) for name in os.listdir(directory) if name.endswith('.npy'))
+
+    def get_start(self, exchange, symbol, tf):
+        """Начало истории в кэше
+
+        :param str exchange: Код биржи
+        :param str symbol: Тикер
+        :param int|str tf: Временной интервал Alor
+        :return: Дата и время UTC в секундах, с которого загружалась история. None, если кэш пуст
+        """
+        parts = self.get_parts(self.get_dir(exchange, symbol, tf))
+        return parts[0] if parts else None
+
+    def load(self, exchange, symbol, tf, seconds_from=0, seconds_to=None):
+        """Бары из кэша. Если в кэше одна часть, то бары отдаются без копирования из отображения файла в память
+
+        :param str exchange: Код биржи
+        :param str symbol: Тикер
+        :param int|str tf: Временной интервал Alor
+        :param int seconds_from: Дата и время UTC в секундах первого бара
+        :param int seconds_to: Дата и время UTC в секундах последнего бара. По умолчанию, до последнего бара
+        :return: Структурированный массив бар, отсортированных по времени
+        """
+        directory = self.get_dir(exchange, symbol, tf)
+        parts = self.get_parts(directory)
+        arrays = []  # Бары частей
+        for i, start in enumerate(parts):  # Пробегаемся по всем частям
+            bars = np.load(os.path.join(directory, f'{start}.npy'), mmap_mode='r')  # Отображаем файл в память
+            if i + 1 < len(parts):  # Если есть следующая часть
+                bars = bars[:np.searchsorted(bars['time'], parts[i + 1])]  # то ее бары заменяют бары этой части
+            arrays.append(bars)
+        if not arrays:  # Если бар в кэше нет
+            return np.empty(0, dtype=self.dtype)
+        bars = arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+        times = bars['time']
+        start = np.searchsorted(times, seconds_from, side='left')  # Первый бар двоичным поиском
+        end = len(bars) if seconds_to is None else np.searchsorted(times, seconds_to, side='right')  # Следующий за последним бар
+        return bars[start:end]
+
+    def append(self, exchange, symbol, tf, seconds_from, bars):
+        """Добавление части бар
+
+        :param str exchange: Код биржи
+        :param str symbol: Тикер
+        :param int|str tf: Временной интервал Alor
+        :param int seconds_from: Дата и время UTC в секундах начала части. Бары предыдущих частей с этого времени заменяются
+        :param bars: Структурированный массив бар, отсортированных по времени
+        """
+        directory = self.get_dir(exchange, symbol, tf)
+        with self.lock:
+            os.makedirs(directory, exist_ok=True)
+            self.save(os.path.join(directory, f'{seconds_from}.npy'), bars)
+            parts = self.get_parts(directory)
+            if len(parts) > self.max_parts:  # Если частей стало слишком много
+                self.compact(exchange, symbol, tf)  # то объединяем их
+
+    def compact(self, exchange, symbol, tf):
+        """Объединение всех частей бар в одну
+
+        :param str exchange: Код биржи
+        :param str symbol: Тикер
+        :param int|str tf: Временной интервал Alor
+        """
+        directory = self.get_dir(exchange, symbol, tf)
+        parts = self.get_parts(directory)
+        if len(parts) < 2:  # Если объединять нечего
+            return
+        bars = np.array(self.load(exchange, symbol, tf))  # Копируем бары из отображений файлов в память
+        self.save(os.path.join(directory, f'{parts[0]}.npy'), bars)  # Заменяем первую часть
+        for start in parts[1:]:  # Остальные части
+            os.remove(os.path.join(directory, f'{start}.npy'))  # удаляем
+
+    @staticmethod
+    def save(filename, bars):
+        """Запись бар в файл через временный файл. Прерванная запись не портит кэш
+
+        :param str filename: Имя файла
+        :param bars: Структурированный массив бар
+        """
+        tmp_filename = f'{filename}.tmp'
+        with open(tmp_filename, 'wb') as f:
+            np.save(f, bars)
+        os.replace(tmp_filename, filename)
+
+    def from_history(self, history):
+        """Структурированный массив из бар истории
+
+        :param list history: Бары get_history в формате Simple. Справочники или записи Bar
+        :return: Структурированный массив бар
+        """
+        return np.array([(bar['time'], bar['open'], bar['high'], bar['low'], bar['close'], bar['volume']) for bar in history], dtype=self.dtype)
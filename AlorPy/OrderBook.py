@@ -0,0 +1,119 @@
+from array import array  # Цены и объемы уровней стакана храним в непрерывных массивах
+from itertools import accumulate  # Накопленный объем по уровням
+
+
+class OrderBook:
+    """Биржевой стакан подписки. Уровни хранятся в массивах цен и объемов от лучшей цены"""
+    def __init__(self, levels=5, callback=None):
+        """Инициализация
+
+        :param int levels: Кол-во лучших уровней, изменение которых вызывает функцию callback
+        :param callback: Функция, вызываемая со стаканом при изменении лучших уровней
+        """
+        self.levels = levels  # Кол-во отслеживаемых уровней
+        self.callback = callback  # Функция изменения лучших уровней
+        self.bid_prices = array('d')  # Цены покупок от лучшей (большей) цены
+        self.bid_volumes = array('d')  # Объемы покупок в лотах
+        self.ask_prices = array('d')  # Цены продаж от лучшей (меньшей) цены
+        self.ask_volumes = array('d')  # Объемы продаж в лотах
+        self.ms_timestamp = None  # Время стакана UTC в миллисекундах
+        self.subscription = None  # Подписка на стакан
+
+    def on_response(self, response):
+        """Обработчик данных подписки на стакан. Для параметра callback функции order_book_get_and_subscribe
+
+        :param dict response: Данные подписки
+        """
+        self.update(response['data'])
+
+    def update(self, data) -> bool:
+        """Обновление стакана
+
+        :param data: Стакан в формате Simple. Справочник или запись OrderBookSnapshot
+        :return: True, если изменились лучшие уровни
+        """
+        bids = data['bids']  # Покупки
+        asks = data['asks']  # Продажи
+        bid_prices = array('d', [level['price'] for level in bids])
+        bid_volumes = array('d', [level['volume'] for level in bids])
+        ask_prices = array('d', [level['price'] for level in asks])
+        ask_volumes = array('d', [level['volume'] for level in asks])
+        n = self.levels  # Сравниваем только лучшие уровни
+        changed = (bid_prices[:n] != self.bid_prices[:n] or bid_volumes[:n] != self.bid_volumes[:n] or
+                   ask_prices[:n] != self.ask_prices[:n] or ask_volumes[:n] != self.ask_volumes[:n])  # Массивы сравниваются поэлементно без создания объектов Python
+        self.bid_prices, self.bid_volumes, self.ask_prices, self.ask_volumes = bid_prices, bid_volumes, ask_prices, ask_volumes
+        self.ms_timestamp = data['ms_timestamp']
+        if changed and self.callback:  # Если лучшие уровни изменились, и задана функция изменения
+            self.callback(self)  # то вызываем ее
+        return changed
+
+    @property
+    def best_bid(self):
+        """Лучшая цена покупки. None, если покупок нет"""
+        return self.bid_prices[0] if self.bid_prices else None
+
+    @property
+    def best_ask(self):
+        """Лучшая цена продажи. None, если продаж нет"""
+        return self.ask_prices[0] if self.ask_prices else None
+
+    @property
+    def spread(self):
+        """Спред между лучшими ценами продажи и покупки. None, если одна из сторон стакана пуста"""
+        return self.ask_prices[0] - self.bid_prices[0] if self.bid_prices and self.ask_prices else None
+
+    @property
+    def mid_price(self):
+        """Средняя цена между лучшими ценами продажи и покупки. None, если одна из сторон стакана пуста"""
+        return (self.ask_prices[0] + self.bid_prices[0]) / 2 if self.bid_prices and self.ask_prices else None
+
+    def get_side(self, side):
+        """Цены и объемы стороны стакана
+
+        :param str side: 'buy' - покупка по ценам продаж (asks), 'sell' - продажа по ценам покупок (bids)
+        :return: Массивы цен и объемов
+        """
+        if side == 'buy':
+            return self.ask_prices, self.ask_volumes
+        if side == 'sell':
+            return self.bid_prices, self.bid_volumes
+        raise ValueError(f'Неизвестное направление {side}')
+
+    def depth(self, side, levels=None) -> float:
+        """Суммарный объем лучших уровней стороны стакана
+
+        :param str side: 'buy' - объем продаж (asks), 'sell' - объем покупок (bids)
+        :param int levels: Кол-во уровней. По умолчанию все уровни
+        :return: Объем в лотах
+        """
+        _, volumes = self.get_side(side)
+        return sum(volumes[:levels])
+
+    def cumulative_depth(self, side) -> array:
+        """Накопленный объем по уровням стороны стакана
+
+        :param str side: 'buy' - объем продаж (asks), 'sell' - объем покупок (bids)
+        :return: Массив накопленных объемов в лотах от лучшей цены
+        """
+        _, volumes = self.get_side(side)
+        return array('d', accumulate(volumes))
+
+    def vwap(self, side, size):
+        """Средневзвешенная цена исполнения заявки по рынку на заданный объем
+
+        :param str side: 'buy' - покупка по ценам продаж (asks), 'sell' - продажа по ценам покупок (bids)
+        :param float size: Объем в лотах. Больше нуля
+        :return: Средневзвешенная цена. None, если в стакане не хватает объема
+        """
+        if size <= 0:  # Для нулевого или отрицательного объема цены исполнения нет
+            raise ValueError(f'Объем должен быть больше нуля: {size}')
+        prices, volumes = self.get_side(side)
+        remaining = size  # Оставшийся объем
+        cost = 0.0  # Стоимость исполненного объема
+        for price, volume in zip(prices, volumes):  # Пробегаемся по уровням от лучшей цены
+            filled = volume if volume < remaining else remaining  # Объем, исполненный на уровне
+            cost += price * filled
+            remaining -= filled
+            if remaining <= 0:  # Если объем исполнен
+                return cost / size
+        return None  # В стакане не хватает объема
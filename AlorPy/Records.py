@@ -0,0 +1,99 @@
+class Record:
+    """Компактная запись с фиксированным набором полей. Поля доступны как атрибуты и по ключу, как в справочнике"""
+    __slots__ = ()
+
+    @classmethod
+    def from_dict(cls, data):
+        """Запись из справочника JSON
+
+        :param dict data: Справочник JSON
+        :return: Запись
+        """
+        record = cls.__new__(cls)  # Создаем запись без вызова конструктора
+        for field in cls.__slots__:  # Пробегаемся по всем полям
+            setattr(record, field, data.get(field))  # Заполняем поле. Если поля нет в справочнике, то ставим None
+        return record
+
+    @classmethod
+    def convert(cls, result):
+        """Перевод результата запроса в записи
+
+        :param result: Справочник JSON, список справочников или справочник со списком в history/list
+        :return: Запись, список записей или справочник со списком записей. None, если результат не получен
+        """
+        if isinstance(result, list):  # Если получили список
+            return [cls.from_dict(data) for data in result]  # то переводим все его элементы
+        if isinstance(result, dict):  # Если получили справочник
+            for key in ('history', 'list'):  # Бары истории и постраничные записи
+                if key in result:  # приходят в справочнике списком
+                    result[key] = [cls.from_dict(data) for data in result[key]]  # Переводим все элементы списка
+                    return result
+            return cls.from_dict(result)  # Переводим справочник в запись
+        return result  # None или текст ошибки оставляем как есть
+
+    def __getitem__(self, key):
+        """Значение поля по ключу, как в справочнике"""
+        return getattr(self, key)
+
+    def to_dict(self) -> dict:
+        """Справочник из записи"""
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({", ".join(f"{field}={getattr(self, field)!r}" for field in self.__slots__)})'
+
+
+class Bar(Record):
+    """Бар"""
+    __slots__ = ('time', 'open', 'high', 'low', 'close', 'volume')
+
+    def __init__(self, time, open, high, low, close, volume):  # noqa: A002
+        self.time = time  # Дата и время открытия бара UTC в секундах
+        self.open = open  # Цена открытия
+        self.high = high  # Максимальная цена
+        self.low = low  # Минимальная цена
+        self.close = close  # Цена закрытия
+        self.volume = volume  # Объем в лотах
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['time'], data['open'], data['high'], data['low'], data['close'], data['volume'])
+
+
+class Trade(Record):
+    """Сделка по инструменту"""
+    __slots__ = ('id', 'orderno', 'symbol', 'board', 'qty', 'price', 'time', 'timestamp', 'oi', 'existing', 'side')
+
+
+class Quote(Record):
+    """Котировка"""
+    __slots__ = ('symbol', 'exchange', 'description', 'last_price', 'last_price_timestamp', 'bid', 'ask', 'bid_vol', 'ask_vol', 'total_bid_vol', 'total_ask_vol',
+                 'open_price', 'high_price', 'low_price', 'prev_close_price', 'change', 'change_percent', 'volume', 'open_interest', 'lotsize', 'facevalue', 'ob_ms_timestamp')
+
+
+class OrderBookLevel(Record):
+    """Уровень биржевого стакана"""
+    __slots__ = ('price', 'volume')
+
+    def __init__(self, price, volume):
+        self.price = price  # Цена
+        self.volume = volume  # Объем в лотах
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['price'], data['volume'])
+
+
+class OrderBookSnapshot(Record):
+    """Биржевой стакан"""
+    __slots__ = ('bids', 'asks', 'ms_timestamp', 'existing', 'snapshot')
+
+    @classmethod
+    def from_dict(cls, data):
+        record = super().from_dict(data)  # Заполняем все поля
+        record.bids = [OrderBookLevel(level['price'], level['volume']) for level in record.bids or ()]  # Покупки от лучшей цены
+        record.asks = [OrderBookLevel(level['price'], level['volume']) for level in record.asks or ()]  # Продажи от лучшей цены
+        return record
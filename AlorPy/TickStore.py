@@ -0,0 +1,166 @@
+try:
+    import numpy as np  # Колонки тиков храним в массивах NumPy
+except ImportError:  # Если NumPy не установлен
+    np = None  # то хранилище тиков недоступно. Остальная библиотека работает без NumPy
+
+
+class RingBuffer:
+    """Кольцевой буфер фиксированного размера с колонками в структурированном массиве NumPy.
+    Каждая запись пишется дважды: в позицию и в позицию + capacity. Поэтому последние записи всегда лежат непрерывно, и выборки отдаются без копирования.
+    Первая колонка - время. Оно не убывает, поэтому записи за интервал ищутся двоичным поиском
+    """
+    def __init__(self, capacity, columns):
+        """Инициализация
+
+        :param int capacity: Максимальное кол-во записей. Старые записи затираются новыми
+        :param columns: Колонки и их типы NumPy. Первая колонка - время. Например, (('time', 'i8'), ('price', 'f8'))
+        """
+        if np is None:  # Если NumPy не установлен
+            raise ImportError('Для хранилища тиков установите NumPy: pip install numpy')
+        self.capacity = capacity  # Максимальное кол-во записей
+        self.data = np.zeros(2 * capacity, dtype=list(columns))  # Двойной буфер
+        self.pos = 0  # Позиция следующей записи
+        self.count = 0  # Кол-во записей в буфере
+        self.time = 0  # Время последней записи
+
+    def append(self, *values):
+        """Добавление записи за O(1). Вызывается из одного потока подписки
+
+        :param values: Значения колонок в порядке их объявления. Время раньше последней записи заменяется временем последней записи
+        """
+        if values[0] < self.time:  # Если время пошло назад. Например, котировка со временем последней сделки после котировки со временем стакана
+            values = (self.time, *values[1:])  # то оставляем время последней записи
+        self.time = values[0]  # Время последней записи
+        pos = self.pos
+        self.data[pos] = self.data[pos + self.capacity] = values  # Записываем в обе половины буфера
+        self.pos = pos + 1 if pos + 1 < self.capacity else 0  # Следующая позиция по кругу
+        if self.count < self.capacity:  # Пока буфер не заполнен
+            self.count += 1  # Кол-во записей увеличиваем после записи данных. Читающий поток не увидит незаполненную запись
+
+    def __len__(self):
+        return self.count
+
+    def last(self, n=None):
+        """Последние записи без копирования. Запись, затертая новыми данными, меняется и в выборке. Для хранения делайте copy()
+
+        :param int n: Кол-во записей. По умолчанию все записи
+        :return: Структурированный массив от старых записей к новым. Колонки по имени: last(100)['price']
+        """
+        count = self.count
+        n = count if n is None or n > count else n
+        end = self.pos + self.capacity if count == self.capacity else self.pos  # Конец непрерывного участка
+        return self.data[end - n:end]
+
+    def since(self, seconds, column='time'):
+        """Записи за последние секунды без копирования. Отсчет от времени последней записи
+
+        :param float seconds: Кол-во секунд
+        :param str column: Колонка времени UTC в миллисекундах. Значения не убывают
+        :return: Структурированный массив от старых записей к новым
+        """
+        records = self.last()  # Все записи
+        if not len(records):  # Если записей нет
+            return records  # то возвращаем пустой массив
+        times = records[column]  # Время записей
+        start = np.searchsorted(times, times[-1] - seconds * 1000, side='right')  # Первая запись интервала двоичным поиском
+        return records[start:]
+
+
+class TickStore:
+    """Хранилище сделок и котировок по биржам и тикерам в кольцевых буферах NumPy"""
+    trade_columns = (('time', 'i8'), ('price', 'f8'), ('qty', 'f8'), ('side', 'i1'), ('id', 'i8'))  # Сделка. Время UTC в миллисекундах, направление 1 - покупка, -1 - продажа
+    quote_columns = (('time', 'i8'), ('last_price', 'f8'), ('bid', 'f8'), ('ask', 'f8'), ('bid_vol', 'f8'), ('ask_vol', 'f8'))  # Котировка. Время UTC в миллисекундах
+    sides = {'buy': 1, 'sell': -1}  # Направления сделок
+
+    def __init__(self, capacity=100_000):
+        """Инициализация
+
+        :param int capacity: Максимальное кол-во сделок и котировок по каждому тикеру
+        """
+        self.capacity = capacity  # Размер буферов
+        self.trades = {}  # Сделки по бирже и тикеру
+        self.quotes = {}  # Котировки по бирже и тикеру
+        self.subscriptions = []  # Подписки на сделки и котировки
+
+    def get_trades(self, exchange, symbol) -> RingBuffer:
+        """Буфер сделок тикера. Создается при первом обращении
+
+        :param str exchange: Код биржи
+        :param str symbol: Тикер
+        :return: Кольцевой буфер сделок
+        """
+        buffer = self.trades.get((exchange, symbol))
+        if buffer is None:
+            buffer = self.trades[(exchange, symbol)] = RingBuffer(self.capacity, self.trade_columns)
+        return buffer
+
+    def get_quotes(self, exchange, symbol) -> RingBuffer:
+        """Буфер котировок тикера. Создается при первом обращении
+
+        :param str exchange: Код биржи
+        :param str symbol: Тикер
+        :return: Кольцевой буфер котировок
+        """
+        buffer = self.quotes.get((exchange, symbol))
+        if buffer is None:
+            buffer = self.quotes[(exchange, symbol)] = RingBuffer(self.capacity, self.quote_columns)
+        return buffer
+
+    def on_trade(self, exchange, response):
+        """Обработчик подписки на все сделки. Для параметра callback функции all_trades_subscribe: partial(store.on_trade, exchange)
+
+        :param str exchange: Код биржи подписки. В сделке биржи нет
+        :param dict response: Данные подписки в формате Simple. Справочник или запись Trade
+        """
+        trade = response['data']  # Сделка
+        self.get_trades(exchange, trade['symbol']).append(trade['timestamp'], trade['price'], trade['qty'], self.sides.get(trade['side'], 0), trade['id'] or 0)
+
+    def on_quote(self, exchange, response):
+        """Обработчик подписки на котировки. Для параметра callback функции quotes_subscribe: partial(store.on_quote, exchange)
+
+        :param str exchange: Код биржи подписки
+        :param dict response: Данные подписки в формате Simple. Справочник или запись Quote
+        """
+        quote = response['data']  # Котировка
+        ms_timestamp = quote['ob_ms_timestamp'] or (quote['last_price_timestamp'] or 0) * 1000  # Время стакана или последней сделки в миллисекундах
+        self.get_quotes(exchange, quote['symbol']).append(ms_timestamp, quote['last_price'] or np.nan, quote['bid'] or np.nan, quote['ask'] or np.nan, quote['bid_vol'] or 0, quote['ask_vol'] or 0)
+
+    def last_trades(self, exchange, symbol, n=None):
+        """Последние сделки тикера без копирования
+
+        :param str exchange: Код биржи
+        :param str symbol: Тикер
+        :param int n: Кол-во сделок. По умолчанию все сделки
+        :return: Структурированный массив сделок
+        """
+        return self.get_trades(exchange, symbol).last(n)
+
+    def trades_since(self, exchange, symbol, seconds):
+        """Сделки тикера за последние секунды без копирования
+
+        :param str exchange: Код биржи
+        :param str symbol: Тикер
+        :param float seconds: Кол-во секунд от последней сделки
+        :return: Структурированный массив сделок
+        """
+        return self.get_trades(exchange, symbol).since(seconds)
+
+    def last_quotes(self, exchange, symbol, n=None):
+        """Последние котировки тикера без копирования
+
+        :param str exchange: Код биржи
+        :param str symbol: Тикер
+        :param int n: Кол-во котировок. По умолчанию все котировки
+        :return: Структурированный массив котировок
+        """
+        return self.get_quotes(exchange, symbol).last(n)
+
+    def quotes_since(self, exchange, symbol, seconds):
+        """Котировки тикера за последние секунды без копирования
+
+        :param str exchange: Код биржи
+        :param str symbol: Тикер
+        :param float seconds: Кол-во секунд от последней котировки
+        :return: Структурированный массив котировок
+        """
+        return self.get_quotes(exchange, symbol).since(seconds)
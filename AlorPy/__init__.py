@@ -1 +1,7 @@
-from .AlorPy import AlorPy
+from .AlorPy import AlorPy, Tracer, Subscription, RateLimitError, PageLoadError
+from .AlorPyAsync import AlorPyAsync
+from .Records import Bar, Trade, Quote, OrderBookLevel, OrderBookSnapshot
+from .OrderBook import OrderBook
+from .BarAggregator import BarAggregator
+from .TickStore import TickStore
+from .BarCache import BarCache
@@ -15,13 +15,23 @@ if __name__ == '__main__':  # Точка входа при запуске это
     logging.Formatter.converter = lambda *args: datetime.now(tz=ap_provider.tz_msk).timetuple()  # В логе время указываем по МСК
     logging.getLogger('urllib3').setLevel(logging.CRITICAL + 1)  # Пропускаем события запросов
 
+    calls = {}  # Запросы по всем счетам и биржам
+    for account in ap_provider.accounts:  # Пробегаемся по всем счетам
+        methods = [ap_provider.get_positions, ap_provider.get_risk, ap_provider.get_orders, ap_provider.get_stop_orders]  # Позиции, риски, заявки, стоп заявки
+        if account['type'] == 'derivatives':  # Для счета срочного рынка
+            methods.append(ap_provider.get_forts_risk)  # дополнительно получаем риски срочного рынка
+        for exchange in account['exchanges']:  # Пробегаемся по всем биржам
+            for method in methods:  # Пробегаемся по всем запросам
+                calls[(account['portfolio'], exchange, method.__name__)] = (method, account['portfolio'], exchange)
+    results = dict(zip(calls, ap_provider.batch(calls.values())))  # Выполняем все запросы параллельно
+
     for account in ap_provider.accounts:  # Пробегаемся по всем счетам
         portfolio = account['portfolio']  # Портфель
         logger.info(f'Счет #{account["account_id"]}, Договор: {account["agreement"]}, Портфель: {portfolio} ({"Фондовый" if account["type"] == "securities" else "Срочный" if account["type"] == "derivatives" else "Валютный" if account["type"] == "fx" else "Неизвестный"} рынок)')
         logger.info(f'Режимы торгов: {account["boards"]}')
         for exchange in account['exchanges']:  # Пробегаемся по всем биржам
             logger.info(f'- Биржа {exchange}')
-            positions = ap_provider.get_positions(portfolio, exchange)  # Все позиции (с денежной позицией)
+            positions = results[(portfolio, exchange, 'get_positions')]  # Все позиции (с денежной позицией)
             for position in positions:  # Пробегаемся по всем позициям
                 symbol = position['symbol']  # Тикер
                 if symbol == 'RUB':  # Если получаем денежную позицию
@@ -34,14 +44,14 @@ if __name__ == '__main__':  # Точка входа при запуске это
                 last_price = entry_price + position['unrealisedPl'] / size  # Последняя цена по бумажной прибыли/убытку
                 si = ap_provider.get_symbol_info(exchange, symbol)  # Информация о тикере
                 logger.info(f'  - Позиция {si["board"]}.{symbol} ({position["shortName"]}) {size} @ {entry_price} / {last_price}')
-            risk = ap_provider.get_risk(portfolio, exchange)  # Общую стоимость портфеля будем получать из рисков
+            risk = results[(portfolio, exchange, 'get_risk')]  # Общую стоимость портфеля будем получать из рисков
             value = round(risk['portfolioLiquidationValue'], 2)  # Общая стоимость портфеля
             if account['type'] == 'derivatives':  # Для счета срочного рынка
-                cash = round(ap_provider.get_forts_risk(portfolio, exchange)['moneyFree'], 2)  # Свободные средства. Сумма рублей и залогов, дисконтированных в рубли, доступная для открытия позиций. (MoneyFree = MoneyAmount + VmInterCl – MoneyBlocked – VmReserve – Fee)
+                cash = round(results[(portfolio, exchange, 'get_forts_risk')]['moneyFree'], 2)  # Свободные средства. Сумма рублей и залогов, дисконтированных в рубли, доступная для открытия позиций. (MoneyFree = MoneyAmount + VmInterCl – MoneyBlocked – VmReserve – Fee)
             else:  # Для остальных счетов
                 cash = next((position['qtyUnits'] for position in positions if position['symbol'] == 'RUB'), 0)  # Свободные средства через денежную позицию
             logger.info(f'  - Позиции {round(value - cash, 2)} + Свободные средства {cash} = {value}')
-            orders = ap_provider.get_orders(portfolio, exchange)  # Получаем список активных заявок
+            orders = results[(portfolio, exchange, 'get_orders')]  # Список активных заявок
             for order in orders:  # Пробегаемся по всем активным заявкам
                 if order['status'] == 'working':  # Если заявка еще не исполнилась
                     symbol = order['symbol']  # Тикер
@@ -49,7 +59,7 @@ if __name__ == '__main__':  # Точка входа при запуске это
                     si = ap_provider.get_symbol_info(exchange, symbol)  # Информация о тикере
                     order_qty = ap_provider.lots_to_size(exchange, symbol, order['qty'])  # Кол-во в штуках
                     logger.info(f'  - Заявка номер {order["id"]} {"Покупка" if order["side"] == "buy" else "Продажа"} {si["board"]}.{symbol} {order_qty} @ {order_price}')
-            stop_orders = ap_provider.get_stop_orders(portfolio, exchange)  # Получаем список активных стоп заявок
+            stop_orders = results[(portfolio, exchange, 'get_stop_orders')]  # Список активных стоп заявок
             for stop_order in stop_orders:  # Пробегаемся по всем активным стоп заявкам
                 if stop_order['status'] == 'working':  # Если заявка еще не исполнилась
                     symbol = stop_order['symbol']  # Тикер
@@ -10,6 +10,7 @@ from AlorPy import AlorPy  # Работа с Alor OpenAPI V2
 
 logger = logging.getLogger('AlorPy.Bars')  # Будем вести лог. Определяем здесь, т.к. возможен внешний вызов ф-ии
 datapath = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'Data', 'Alor', '')  # Путь сохранения файла истории
+cachepath = os.path.join(datapath, 'Cache')  # Путь кэша бар. Из Alor загружаются только новые бары
 delimiter = '\t'  # Разделитель значений в файле истории. По умолчанию табуляция
 dt_format = '%d.%m.%Y %H:%M'  # Формат представления даты и времени в файле истории. По умолчанию русский формат
 
@@ -57,26 +58,34 @@ def get_candles_from_provider(ap_provider, class_code, security_code, tf, second
     if not exchange:  # Если биржа не была найдена
         logger.error(f'Биржа для тикера {class_code}.{security_code} не найдена')
         return pd.DataFrame()  # то выходим, дальше не продолжаем
-    logger.info(f'Получение истории {class_code}.{security_code} {tf} из Alor')
-    history = ap_provider.get_history(exchange, security_code, time_frame, seconds_from)  # Запрос истории рынка
-    if not history:  # Если бары не получены
-        logger.error('Ошибка при получении истории: История не получена')
-        return pd.DataFrame()  # то выходим, дальше не продолжаем
-    if 'history' not in history:  # Если бар нет в словаре
-        logger.error(f'Ошибка при получении истории: {history}')
-        return pd.DataFrame()  # то выходим, дальше не продолжаем
-    new_bars = history['history']  # Получаем все бары из Alor
-    if len(new_bars) == 0:  # Если новых бар нет
-        logger.info('Новых записей нет')
-        return pd.DataFrame()  # то выходим, дальше не продолжаем
-    pd_bars = pd.json_normalize(new_bars)  # Переводим список бар в pandas DataFrame
-    pd_bars['datetime'] = pd.to_datetime(pd_bars['time'], unit='s')  # Дата и время в UTC для дневных бар и выше
-    if type(time_frame) is not str:  # Для внутридневных бар (time_frame число)
-        pd_bars['datetime'] = pd_bars['datetime'].dt.tz_localize('UTC').dt.tz_convert(ap_provider.tz_msk).dt.tz_localize(None)  # Переводим в рыночное время МСК
+    if ap_provider.bar_cache is not None:  # Если задан кэш бар
+        logger.info(f'Получение истории {class_code}.{security_code} {tf} из кэша')
+        cached_bars = ap_provider.get_history_cached(exchange, security_code, time_frame, seconds_from)  # Бары из кэша. Из Alor загружаются только новые бары
+        if len(cached_bars) == 0:  # Если бар нет
+            logger.info('Новых записей нет')
+            return pd.DataFrame()  # то выходим, дальше не продолжаем
+        pd_bars = pd.DataFrame(cached_bars)  # Переводим колонки бар в pandas DataFrame
+    else:  # Если кэша бар нет
+        logger.info(f'Получение истории {class_code}.{security_code} {tf} из Alor')
+        history = ap_provider.get_history_parallel(exchange, security_code, time_frame, seconds_from)  # Запрос истории рынка параллельно по временнЫм окнам
+        if not history:  # Если бары не получены
+            logger.error('Ошибка при получении истории: История не получена')
+            return pd.DataFrame()  # то выходим, дальше не продолжаем
+        if 'history' not in history:  # Если бар нет в словаре
+            logger.error(f'Ошибка при получении истории: {history}')
+            return pd.DataFrame()  # то выходим, дальше не продолжаем
+        new_bars = history['history']  # Получаем все бары из Alor
+        if len(new_bars) == 0:  # Если новых бар нет
+            logger.info('Новых записей нет')
+            return pd.DataFrame()  # то выходим, дальше не продолжаем
+        pd_bars = pd.json_normalize(new_bars)  # Переводим список бар в pandas DataFrame
+    if type(time_frame) is str:  # Для дневных бар и выше
+        pd_bars['datetime'] = pd.to_datetime(pd_bars['time'], unit='s')  # Дата и время в UTC
+    else:  # Для внутридневных бар (time_frame число)
+        pd_bars['datetime'] = ap_provider.timestamps_to_msk_datetimes(pd_bars['time'])  # Переводим в рыночное время МСК
     pd_bars.index = pd_bars['datetime']  # В индекс ставим дату/время
     pd_bars = pd_bars[['datetime', 'open', 'high', 'low', 'close', 'volume']]  # Отбираем нужные колонки. Дата и время нужна, чтобы не удалять одинаковые OHLCV на разное время
-    lot_size = ap_provider.lots_to_size(exchange, security_code, 1)  # Кол-во акций в штуках в одном лоте
-    pd_bars['volume'] = pd_bars['volume'].astype('int64') * lot_size  # Объемы в штуках могут быть только целыми
+    pd_bars['volume'] = ap_provider.lots_to_sizes(exchange, security_code, pd_bars['volume'])  # Объемы в штуках могут быть только целыми
     si = ap_provider.get_symbol_info(exchange, security_code)  # Спецификация тикера
     if not si['decimals']:  # Если кол-во десятичных знаков = 0, то цены - целые значения
         pd_bars['open'] = pd_bars['open'].astype('int64')
@@ -104,7 +113,7 @@ def save_candles_to_file(ap_provider, class_code, security_codes, tf='D1',
     """
     _, intraday = ap_provider.timeframe_to_alor_timeframe(tf)  # Временной интервал Alor, внутридневной интервал
     for security_code in security_codes:  # Пробегаемся по всем тикерам
-        file_bars = load_candles_from_file(class_code, security_code, tf)  # Получаем бары из файла
+        file_bars = pd.DataFrame() if ap_provider.bar_cache is not None else load_candles_from_file(class_code, security_code, tf)  # С кэшем бар вся история берется из кэша. Файл не разбираем, а только перезаписываем
         if file_bars.empty:  # Если файла нет
             seconds_from = 0  # Берем отметку времени, когда никакой тикер еще не торговался
         else:  # Если получили бары из файла
@@ -148,7 +157,7 @@ def save_candles_to_file(ap_provider, class_code, security_codes, tf='D1',
 
 if __name__ == '__main__':  # Точка входа при запуске этого скрипта
     start_time = time()  # Время начала запуска скрипта
-    ap_provider = AlorPy()  # Подключаемся ко всем торговым счетам
+    ap_provider = AlorPy(bar_cache=cachepath)  # Подключаемся ко всем торговым счетам. Историю храним в кэше бар
 
     logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',  # Формат сообщения
                         datefmt='%d.%m.%Y %H:%M:%S',  # Формат даты
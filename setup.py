@@ -11,7 +11,11 @@ setup(name='AlorPy',
             'requests',  # Запросы/ответы через HTTP API
             'PyJWT',  # Декодирование токена JWT для получения договоров и портфелей
             'urllib3',  # Соединение с сервером не установлено за максимальное кол-во попыток подключения
-            'websockets',  # Управление подписками и заявками через WebSocket API
+            'websockets>=13.0',  # Управление подписками и заявками через WebSocket API. Синхронный и асинхронный клиенты
       ],
+      extras_require={
+            'async': ['aiohttp'],  # Асинхронные запросы/ответы через HTTP API для AlorPyAsync
+            'numpy': ['numpy'],  # Хранилище сделок и котировок TickStore, кэш бар BarCache
+      },
       python_requires='>=3.12',
       )